@@ -14,6 +14,7 @@ CREATE TABLE IF NOT EXISTS events_data.etl_runs (
     inserted_count INTEGER DEFAULT 0,
     updated_count INTEGER DEFAULT 0,
     unchanged_count INTEGER DEFAULT 0,
+    deactivated_count INTEGER DEFAULT 0,
     status VARCHAR(20) DEFAULT 'running',
     error_message TEXT
 );
@@ -23,9 +24,9 @@ CREATE TABLE IF NOT EXISTS events_data.etl_runs (
 -- =============================================================================
 CREATE TABLE IF NOT EXISTS events_data.etl_errors (
     id SERIAL PRIMARY KEY,
-    error_type VARCHAR(50) NOT NULL,  -- 'missing_required_fields', 'invalid_json', 'db_insert_error'
-    source VARCHAR(50),               -- 'city_today', 'zero_eu'
-    json_file VARCHAR(255),           -- nome del file JSON
+    error_type VARCHAR(50) NOT NULL,  -- 'missing_required_fields', 'invalid_json', 'db_insert_error', 'manifest_mismatch'
+    source VARCHAR(50),               -- 'city_today', 'zero_eu', 'artribune'
+    json_file VARCHAR(255),           -- nome del file JSON / JSON Lines
     record_data JSONB,                -- dati del record problematico
     error_message TEXT,               -- messaggio di errore
     dag_run_id VARCHAR(255),          -- ID del DAG run
@@ -37,107 +38,407 @@ CREATE INDEX IF NOT EXISTS idx_etl_errors_source ON events_data.etl_errors(sourc
 CREATE INDEX IF NOT EXISTS idx_etl_errors_created ON events_data.etl_errors(created_at);
 
 -- =============================================================================
--- FUNZIONE: Truncate staging
+-- TABELLA COPERTURA: finestre (sorgente, città, date) scaricate per intero in un run
+-- Scritta dal loader dal campo coverage dei manifest, solo per i file caricati senza
+-- errori: gli eventi attivi dentro una finestra e assenti dallo staging del run sono
+-- spariti dalla fonte (vedi deactivate_missing). UNLOGGED come le partizioni di
+-- staging: dopo un crash PostgreSQL le svuota insieme, e una copertura senza le sue
+-- righe non può disattivare eventi
 -- =============================================================================
-CREATE OR REPLACE FUNCTION events_data.truncate_staging()
+CREATE UNLOGGED TABLE IF NOT EXISTS events_data.scrape_coverage (
+    id SERIAL PRIMARY KEY,
+    dag_run_id VARCHAR(255) NOT NULL,  -- ID del DAG run
+    load_key VARCHAR(100) NOT NULL,    -- partizione di staging che contiene gli eventi della finestra
+    source VARCHAR(50) NOT NULL,       -- 'city_today', 'zero_eu', 'artribune'
+    city VARCHAR(100),                 -- come nel campo city degli eventi (NULL = tutte le città)
+    window_start DATE,                 -- primo giorno (NULL = nessun limite)
+    window_end DATE,                   -- ultimo giorno (NULL = nessun limite)
+    json_file VARCHAR(255),            -- file del manifest
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_scrape_coverage_run ON events_data.scrape_coverage(dag_run_id, load_key);
+
+-- =============================================================================
+-- TABELLA RUN DI STAGING: partizioni di staging per DAG run
+-- =============================================================================
+CREATE TABLE IF NOT EXISTS events_data.staging_runs (
+    run_id VARCHAR(255) PRIMARY KEY,   -- ID del DAG run (valore della partizione)
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- =============================================================================
+-- TABELLE STREAM: avanzamento del caricamento dallo stream Redis del run
+-- (scraping/shared/stream.py, task stream_to_staging del DAG)
+-- stream_offsets: ultima voce dello stream già caricata in staging, salvata nella stessa
+-- transazione delle righe: una voce riconsegnata dopo un retry del loader e con id non
+-- successivo viene solo confermata, non caricata di nuovo.
+-- stream_producers: tentativo corrente e item ricevuti/scartati per produttore (task di
+-- scraping + sorgente), confrontati con il conteggio dell'eof. UNLOGGED come le partizioni
+-- di staging: dopo un crash PostgreSQL si svuotano insieme e il confronto fallisce
+-- =============================================================================
+CREATE UNLOGGED TABLE IF NOT EXISTS events_data.stream_offsets (
+    run_id VARCHAR(255) PRIMARY KEY,   -- ID del DAG run
+    stream VARCHAR(255) NOT NULL,      -- chiave dello stream Redis
+    last_id VARCHAR(32) NOT NULL,      -- id dell'ultima voce caricata ('<ms>-<seq>')
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE UNLOGGED TABLE IF NOT EXISTS events_data.stream_producers (
+    run_id VARCHAR(255) NOT NULL,      -- ID del DAG run
+    producer VARCHAR(100) NOT NULL,    -- '<task di scraping>.<sorgente>'
+    source VARCHAR(50) NOT NULL,
+    attempt INTEGER NOT NULL,          -- tentativo del task (le voci degli altri vengono ignorate)
+    received INTEGER NOT NULL DEFAULT 0,
+    rejected INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (run_id, producer)
+);
+
+-- =============================================================================
+-- FUNZIONI: Partizioni di staging per run e per task di caricamento
+-- staging_events è partizionata per run_id: ogni DAG run ha la sua partizione
+-- (a sua volta partizionata per load_key), creata da prepare_staging_run() a inizio
+-- run ed eliminata da drop_staging_run() dopo l'upsert. Ogni task di load scrive
+-- in una tabella UNLOGGED propria (staccata, senza lock sulla partizione del run)
+-- e la aggancia quando ha finito: l'upsert legge solo le partizioni agganciate del
+-- proprio run, cioè i caricamenti conclusi.
+-- =============================================================================
+DROP FUNCTION IF EXISTS events_data.truncate_staging();
+DROP FUNCTION IF EXISTS events_data.staging_partition_name(VARCHAR);
+DROP FUNCTION IF EXISTS events_data.create_staging_partition(VARCHAR);
+DROP FUNCTION IF EXISTS events_data.attach_staging_partition(VARCHAR);
+
+CREATE OR REPLACE FUNCTION events_data.staging_run_partition_name(p_run_id VARCHAR)
+RETURNS TEXT AS $$
+BEGIN
+    -- Nome leggibile ma entro i 63 caratteri di un identificatore, univoco grazie all'hash
+    RETURN 'staging_events_r_'
+        || left(lower(regexp_replace(p_run_id, '[^a-zA-Z0-9]+', '_', 'g')), 36)
+        || '_' || left(md5(p_run_id), 8);
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION events_data.staging_partition_name(p_run_id VARCHAR, p_load_key VARCHAR)
+RETURNS TEXT AS $$
+BEGIN
+    -- Prefisso con l'hash del run: drop_staging_run() trova anche le partizioni mai agganciate
+    RETURN 'staging_events_p_' || left(md5(p_run_id), 8) || '_'
+        || left(lower(regexp_replace(p_load_key, '[^a-zA-Z0-9]+', '_', 'g')), 26)
+        || '_' || left(md5(p_run_id || '/' || p_load_key), 6);
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION events_data.create_staging_run(p_run_id VARCHAR)
+RETURNS TEXT AS $$
+DECLARE
+    v_name TEXT := events_data.staging_run_partition_name(p_run_id);
+BEGIN
+    -- Idempotente: chiamata a inizio run e da ogni aggancio
+    IF to_regclass(format('events_data.%I', v_name)) IS NULL THEN
+        EXECUTE format(
+            'CREATE TABLE events_data.%I PARTITION OF events_data.staging_events FOR VALUES IN (%L) '
+            'PARTITION BY LIST (load_key)', v_name, p_run_id);
+        INSERT INTO events_data.staging_runs (run_id) VALUES (p_run_id) ON CONFLICT (run_id) DO NOTHING;
+    END IF;
+
+    RETURN format('events_data.%I', v_name);
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION events_data.drop_staging_run(p_run_id VARCHAR)
+RETURNS void AS $$
+DECLARE
+    v_partition RECORD;
+    v_dropped INT := 0;
+BEGIN
+    -- Partizioni dei task di load rimaste staccate (caricamento fallito); le agganciate
+    -- vengono eliminate con la partizione del run
+    FOR v_partition IN
+        SELECT c.relname
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'events_data'
+          AND c.relkind = 'r'
+          AND c.relname LIKE 'staging\_events\_p\_' || left(md5(p_run_id), 8) || '\_%'
+          AND NOT c.relispartition
+    LOOP
+        EXECUTE format('DROP TABLE events_data.%I', v_partition.relname);
+        v_dropped := v_dropped + 1;
+    END LOOP;
+
+    EXECUTE format('DROP TABLE IF EXISTS events_data.%I', events_data.staging_run_partition_name(p_run_id));
+    DELETE FROM events_data.staging_runs WHERE run_id = p_run_id;
+    DELETE FROM events_data.stream_offsets WHERE run_id = p_run_id;
+    DELETE FROM events_data.stream_producers WHERE run_id = p_run_id;
+
+    RAISE NOTICE 'Staging of run % dropped (% detached partitions)', p_run_id, v_dropped;
+END;
+$$ LANGUAGE plpgsql;
+
+-- =============================================================================
+-- FUNZIONE: Prepara lo staging di un run
+-- Riparte da una partizione vuota (es. DAG run ripetuto con clear) ed elimina lo
+-- staging dei run più vecchi di p_stale_after rimasti da upsert mai eseguiti, più la
+-- copertura dei run più vecchi di 30 giorni. Gli altri run in corso non vengono
+-- toccati: daily, weekly e monthly possono sovrapporsi.
+-- =============================================================================
+CREATE OR REPLACE FUNCTION events_data.prepare_staging_run(p_run_id VARCHAR, p_stale_after INTERVAL DEFAULT '2 days')
+RETURNS TEXT AS $$
+DECLARE
+    v_run RECORD;
+BEGIN
+    PERFORM events_data.drop_staging_run(p_run_id);
+
+    FOR v_run IN
+        SELECT run_id FROM events_data.staging_runs
+        WHERE created_at < CURRENT_TIMESTAMP - p_stale_after
+    LOOP
+        PERFORM events_data.drop_staging_run(v_run.run_id);
+    END LOOP;
+
+    DELETE FROM events_data.scrape_coverage WHERE created_at < CURRENT_TIMESTAMP - INTERVAL '30 days';
+
+    RETURN events_data.create_staging_run(p_run_id);
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION events_data.create_staging_partition(p_run_id VARCHAR, p_load_key VARCHAR)
+RETURNS TEXT AS $$
+DECLARE
+    v_name TEXT := events_data.staging_partition_name(p_run_id, p_load_key);
+BEGIN
+    -- Idempotente: il retry di un task di load continua nella stessa partizione
+    -- (i file già caricati sono stati archiviati, le loro righe restano)
+    IF to_regclass(format('events_data.%I', v_name)) IS NULL THEN
+        -- Stesse colonne, default e indici della tabella staging: all'aggancio gli indici
+        -- vengono riutilizzati invece di essere ricostruiti. UNLOGGED: le righe non passano dal WAL
+        EXECUTE format('CREATE UNLOGGED TABLE events_data.%I (LIKE events_data.staging_events INCLUDING ALL)', v_name);
+        EXECUTE format('ALTER TABLE events_data.%I ALTER COLUMN run_id SET DEFAULT %L', v_name, p_run_id);
+        EXECUTE format('ALTER TABLE events_data.%I ALTER COLUMN load_key SET DEFAULT %L', v_name, p_load_key);
+        -- Il vincolo coincide con quello della partizione: l'aggancio non deve scandire la tabella
+        EXECUTE format('ALTER TABLE events_data.%I ADD CONSTRAINT %I CHECK (run_id = %L AND load_key = %L)',
+                       v_name, v_name || '_key', p_run_id, p_load_key);
+    END IF;
+
+    RETURN format('events_data.%I', v_name);
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION events_data.reset_staging_partition(p_run_id VARCHAR, p_load_key VARCHAR)
+RETURNS TEXT AS $$
+BEGIN
+    -- Nuovo tentativo di un produttore dello stream: le righe e la copertura del tentativo
+    -- precedente (anche se già agganciate) vengono scartate
+    EXECUTE format('DROP TABLE IF EXISTS events_data.%I', events_data.staging_partition_name(p_run_id, p_load_key));
+    DELETE FROM events_data.scrape_coverage WHERE dag_run_id = p_run_id AND load_key = p_load_key;
+
+    RETURN events_data.create_staging_partition(p_run_id, p_load_key);
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION events_data.attach_staging_partition(p_run_id VARCHAR, p_load_key VARCHAR)
 RETURNS void AS $$
+DECLARE
+    v_partition REGCLASS := to_regclass(
+        format('events_data.%I', events_data.staging_partition_name(p_run_id, p_load_key)));
+    v_run_partition TEXT;
 BEGIN
-    TRUNCATE TABLE events_data.staging_events;
-    RAISE NOTICE 'Staging table truncated';
+    IF v_partition IS NULL THEN
+        RAISE EXCEPTION 'Staging partition for %/% does not exist', p_run_id, p_load_key;
+    END IF;
+
+    IF NOT EXISTS (SELECT 1 FROM pg_inherits WHERE inhrelid = v_partition) THEN
+        -- Lock solo sulla partizione del run: i caricamenti degli altri run non aspettano
+        v_run_partition := events_data.create_staging_run(p_run_id);
+        EXECUTE format('ALTER TABLE %s ATTACH PARTITION %s FOR VALUES IN (%L)',
+                       v_run_partition, v_partition, p_load_key);
+        RAISE NOTICE 'Staging partition % attached', v_partition;
+    END IF;
 END;
 $$ LANGUAGE plpgsql;
 
 -- =============================================================================
--- FUNZIONE: Upsert da staging a production
--- Confronta content_hash per aggiornare solo se cambiato
+-- FUNZIONE: Upsert da staging a production (MERGE, PostgreSQL 16)
+-- Con p_dag_run_id legge la sola partizione di staging del run (senza: tutto lo staging),
+-- analizzata all'inizio perché appena caricata
+-- 1. Deduplica per uuid (riga più recente), letta in ordine da idx_staging_uuid_scraped
+-- 2. Classifica ogni uuid in una tabella temporanea confrontando campo per campo le colonne
+--    aggiornabili: nuovo, modificato o invariato (MERGE ... RETURNING esiste solo da PG17,
+--    i conteggi vengono dalla classificazione)
+-- 3. MERGE delle sole righe nuove o modificate: le invariate non vengono riscritte
+-- 4. Con p_dag_run_id: eventi spariti dalle finestre coperte dal run marcati inattivi
+--    (deactivate_missing)
+-- 5. Eventi attivi già conclusi (date_end, o date_start, prima di oggi) marcati inattivi,
+--    letti dall'indice parziale idx_prod_active_until
 -- =============================================================================
-CREATE OR REPLACE FUNCTION events_data.upsert_from_staging()
-RETURNS TABLE(inserted INT, updated INT, unchanged INT) AS $$
+DROP FUNCTION IF EXISTS events_data.upsert_from_staging();
+
+CREATE OR REPLACE FUNCTION events_data.upsert_from_staging(p_dag_run_id VARCHAR DEFAULT NULL)
+RETURNS TABLE(inserted INT, updated INT, unchanged INT, deactivated INT) AS $$
 DECLARE
     v_inserted INT := 0;
     v_updated INT := 0;
     v_unchanged INT := 0;
-    v_total INT := 0;
+    v_missing INT := 0;
+    v_deactivated INT := 0;
+    v_staging TEXT := 'events_data.staging_events';
 BEGIN
-    -- Conta totale staging (deduplicati)
-    SELECT COUNT(DISTINCT uuid) INTO v_total FROM events_data.staging_events;
+    IF p_dag_run_id IS NOT NULL THEN
+        v_staging := format('events_data.%I', events_data.staging_run_partition_name(p_dag_run_id));
+        IF to_regclass(v_staging) IS NULL THEN
+            RAISE EXCEPTION 'Staging of run % does not exist', p_dag_run_id;
+        END IF;
+    END IF;
+
+    -- Un upsert alla volta: classificazione e MERGE vedono la stessa production
+    LOCK TABLE events_data.production_events IN SHARE ROW EXCLUSIVE MODE;
 
-    -- UPSERT con confronto hash (usando DISTINCT ON per deduplicare)
-    WITH deduplicated AS (
+    -- Le foglie UNLOGGED del run sono appena state caricate dai task di load e l'autovacuum non le ha
+    -- ancora analizzate: senza statistiche il DISTINCT ON è stimato a 200 righe (ordinamento
+    -- su disco e nested loop su production). Bastano le colonne di deduplica e join
+    EXECUTE format('ANALYZE %s (uuid, scraped_at)', v_staging);
+
+    DROP TABLE IF EXISTS pg_temp.upsert_batch;
+    EXECUTE format($sql$
+    CREATE TEMP TABLE upsert_batch ON COMMIT DROP AS
+    SELECT
+        s.*,
+        CASE
+            WHEN p.uuid IS NULL THEN 'insert'
+            WHEN (p.content_hash, p.url, p.title, p.description, p.category, p.image_url,
+                  p.location_address, p.price, p.website, p.date_end,
+                  p.time_start, p.time_end, p.time_info, p.schedule, p.weekdays, p.is_active)
+                 IS DISTINCT FROM
+                 (s.content_hash, s.url, s.title, s.description, s.category, s.image_url,
+                  s.location_address, s.price, s.website, s.date_end,
+                  s.time_start, s.time_end, s.time_info, s.schedule, s.weekdays, TRUE)
+                THEN 'update'
+            ELSE 'unchanged'
+        END AS action
+    FROM (
         SELECT DISTINCT ON (uuid) *
-        FROM events_data.staging_events
+        FROM %s
         ORDER BY uuid, scraped_at DESC NULLS LAST
-    ),
-    upsert_result AS (
-        INSERT INTO events_data.production_events (
+    ) s
+    LEFT JOIN events_data.production_events p ON p.uuid = s.uuid
+    $sql$, v_staging);
+
+    -- Le tabelle temporanee non vengono analizzate dall'autovacuum: statistiche per il MERGE,
+    -- solo sulle colonne di join e filtro
+    ANALYZE upsert_batch (uuid, action);
+
+    SELECT
+        COUNT(*) FILTER (WHERE action = 'insert'),
+        COUNT(*) FILTER (WHERE action = 'update'),
+        COUNT(*) FILTER (WHERE action = 'unchanged')
+    INTO v_inserted, v_updated, v_unchanged
+    FROM upsert_batch;
+
+    MERGE INTO events_data.production_events p
+    USING (SELECT * FROM upsert_batch WHERE action <> 'unchanged') s
+    ON p.uuid = s.uuid
+    WHEN MATCHED THEN
+        UPDATE SET
+            content_hash = s.content_hash,
+            url = s.url,
+            title = s.title,
+            description = s.description,
+            category = s.category,
+            image_url = s.image_url,
+            location_address = s.location_address,
+            price = s.price,
+            website = s.website,
+            date_end = s.date_end,
+            time_start = s.time_start,
+            time_end = s.time_end,
+            time_info = s.time_info,
+            schedule = s.schedule,
+            weekdays = s.weekdays,
+            raw_data = s.raw_data,
+            scraped_at = s.scraped_at,
+            updated_at = CURRENT_TIMESTAMP,
+            is_active = TRUE
+    WHEN NOT MATCHED THEN
+        INSERT (
             uuid, content_hash, source, url, title, description,
             category, image_url, city, location_name, location_address,
             location_coords, price, website, date_start, date_end,
             time_start, time_end, time_info, schedule, weekdays,
             raw_data, scraped_at, is_active
         )
-        SELECT
+        VALUES (
             s.uuid, s.content_hash, s.source, s.url, s.title, s.description,
             s.category, s.image_url, s.city, s.location_name, s.location_address,
             s.location_coords, s.price, s.website, s.date_start, s.date_end,
             s.time_start, s.time_end, s.time_info, s.schedule, s.weekdays,
             s.raw_data, s.scraped_at, TRUE
-        FROM deduplicated s
-        ON CONFLICT (uuid)
-        DO UPDATE SET
-            content_hash = EXCLUDED.content_hash,
-            description = EXCLUDED.description,
-            category = EXCLUDED.category,
-            image_url = EXCLUDED.image_url,
-            price = EXCLUDED.price,
-            website = EXCLUDED.website,
-            time_info = EXCLUDED.time_info,
-            schedule = EXCLUDED.schedule,
-            raw_data = EXCLUDED.raw_data,
-            scraped_at = EXCLUDED.scraped_at,
-            updated_at = CURRENT_TIMESTAMP,
-            is_active = TRUE
-        WHERE events_data.production_events_data.content_hash IS DISTINCT FROM EXCLUDED.content_hash
-        RETURNING
-            (xmax = 0) AS is_insert
-    )
-    SELECT
-        COUNT(*) FILTER (WHERE is_insert = TRUE),
-        COUNT(*) FILTER (WHERE is_insert = FALSE)
-    INTO v_inserted, v_updated
-    FROM upsert_result;
+        );
+
+    IF p_dag_run_id IS NOT NULL THEN
+        v_missing := events_data.deactivate_missing(p_dag_run_id);
+    END IF;
 
-    -- Calcola unchanged
-    v_unchanged := v_total - v_inserted - v_updated;
+    -- Eventi conclusi: fuori dagli eventi attivi (stessa espressione di idx_prod_active_until)
+    UPDATE events_data.production_events
+    SET is_active = FALSE, updated_at = CURRENT_TIMESTAMP
+    WHERE is_active = TRUE
+      AND COALESCE(date_end, date_start) < CURRENT_DATE;
+    GET DIAGNOSTICS v_deactivated = ROW_COUNT;
+    v_deactivated := v_deactivated + v_missing;
 
-    RAISE NOTICE 'Upsert completed: % inserted, % updated, % unchanged',
-                 v_inserted, v_updated, v_unchanged;
+    RAISE NOTICE 'Upsert completed: % inserted, % updated, % unchanged, % deactivated',
+                 v_inserted, v_updated, v_unchanged, v_deactivated;
 
-    RETURN QUERY SELECT v_inserted, v_updated, v_unchanged;
+    RETURN QUERY SELECT v_inserted, v_updated, v_unchanged, v_deactivated;
 END;
 $$ LANGUAGE plpgsql;
 
 -- =============================================================================
--- FUNZIONE: Marca eventi non più presenti come inattivi
--- (opzionale, per eventi scaduti non più nello scraping)
+-- FUNZIONE: Marca inattivi gli eventi spariti dalla fonte
+-- Un solo UPDATE per run: per ogni finestra di scrape_coverage del run (solo quelle
+-- delle partizioni di staging agganciate) gli eventi attivi della sorgente e della
+-- città che iniziano nella finestra e non sono nello staging del run (anti-join su uuid).
+-- Un run parziale (es. {"city": "milano"}) copre solo le sue finestre: gli eventi di
+-- altre città, periodi o sorgenti restano come sono. Le righe vengono cercate con
+-- l'indice parziale idx_prod_active_source (source, city, date_start) WHERE is_active.
+-- Sostituisce mark_missing_inactive(source, city), che non conosceva il periodo.
 -- =============================================================================
-CREATE OR REPLACE FUNCTION events_data.mark_missing_inactive(p_source VARCHAR, p_city VARCHAR DEFAULT NULL)
+DROP FUNCTION IF EXISTS events_data.mark_missing_inactive(VARCHAR, VARCHAR);
+
+CREATE OR REPLACE FUNCTION events_data.deactivate_missing(p_dag_run_id VARCHAR)
 RETURNS INT AS $$
 DECLARE
     v_count INT;
 BEGIN
     UPDATE events_data.production_events p
     SET is_active = FALSE, updated_at = CURRENT_TIMESTAMP
-    WHERE p.source = p_source
-      AND (p_city IS NULL OR p.city = p_city)
-      AND p.is_active = TRUE
+    FROM (
+        SELECT DISTINCT c.source, c.city, c.window_start, c.window_end
+        FROM events_data.scrape_coverage c
+        JOIN pg_inherits i
+          ON i.inhrelid = to_regclass(format('events_data.%I',
+                                             events_data.staging_partition_name(p_dag_run_id, c.load_key)))
+         AND i.inhparent = to_regclass(format('events_data.%I',
+                                              events_data.staging_run_partition_name(p_dag_run_id)))
+        WHERE c.dag_run_id = p_dag_run_id
+    ) w
+    WHERE p.is_active = TRUE
+      AND p.source = w.source
+      AND (w.city IS NULL OR p.city = w.city)
+      AND (
+          p.date_start BETWEEN COALESCE(w.window_start, '-infinity'::DATE)
+                           AND COALESCE(w.window_end, 'infinity'::DATE)
+          -- Finestra senza limiti di date: anche gli eventi senza data
+          OR (p.date_start IS NULL AND w.window_start IS NULL AND w.window_end IS NULL)
+      )
       AND NOT EXISTS (
           SELECT 1 FROM events_data.staging_events s
-          WHERE s.uuid = p.uuid
+          WHERE s.run_id = p_dag_run_id
+            AND s.uuid = p.uuid
       );
 
     GET DIAGNOSTICS v_count = ROW_COUNT;
-    RAISE NOTICE 'Marked % events as inactive for source % city %', v_count, p_source, COALESCE(p_city, 'ALL');
+    RAISE NOTICE 'Marked % missing events as inactive for run %', v_count, p_dag_run_id;
 
     RETURN v_count;
 END;
@@ -155,6 +456,7 @@ SELECT
     inserted_count,
     updated_count,
     unchanged_count,
+    deactivated_count,
     status,
     EXTRACT(EPOCH FROM (upsert_completed_at - started_at)) as duration_seconds
 FROM events_data.etl_runs
@@ -1,18 +1,27 @@
 -- =============================================================================
 -- TABELLA STAGING: eventi temporanei dallo scraping
+-- Partizionata su due livelli (vedi 02-etl.sql):
+-- - run_id: una partizione per DAG run, creata a inizio run ed eliminata dopo
+--   l'upsert; run concorrenti (daily, weekly, monthly) non si toccano
+-- - load_key: dentro il run, una partizione UNLOGGED per task di caricamento,
+--   agganciata solo a caricamento concluso
+-- Solo le partizioni foglia hanno dati: sono UNLOGGED (niente WAL per le righe di
+-- staging, svuotate da PostgreSQL dopo un crash)
 -- =============================================================================
 DROP TABLE IF EXISTS events_data.staging_events CASCADE;
 
 CREATE TABLE IF NOT EXISTS events_data.staging_events (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
+    run_id VARCHAR(255) NOT NULL,      -- Partizione: DAG run che ha caricato la riga
+    load_key VARCHAR(100) NOT NULL,    -- Sotto-partizione: task di caricamento che ha scritto la riga
 
     -- ID e Hashing
     event_id VARCHAR(255),             -- ID originale della fonte (slug dall'URL)
-    uuid VARCHAR(16) UNIQUE NOT NULL,  -- Hash interno (titolo + data + location)
+    uuid VARCHAR(16) NOT NULL,         -- Hash interno (titolo + data + location)
     content_hash VARCHAR(16),          -- Hash del contenuto per rilevare modifiche
 
     -- Metadati Fonte
-    source VARCHAR(50) NOT NULL,       -- Es: "city_today", "zero_eu"
+    source VARCHAR(50) NOT NULL,       -- Es: "city_today", "zero_eu", "artribune"
     url TEXT,                          -- URL originale dell'evento
 
     -- Contenuto Core
@@ -37,6 +46,13 @@ CREATE TABLE IF NOT EXISTS events_data.staging_events (
     date_end DATE,                     -- Data fine
     date_display TEXT,                 -- Testo leggibile (es: "dal 31 gennaio al 1 febbraio")
 
+    -- Orari
+    time_start TIME,                   -- Ora di inizio (es: 21:00)
+    time_end TIME,                     -- Ora di fine
+    time_info TEXT,                    -- Orario sintetico in testo libero
+    schedule TEXT,                     -- Orari/calendario come pubblicati dalla fonte
+    weekdays TEXT,                     -- Giorni della settimana (es: "Lunedì, Mercoledì")
+
     -- Dati Tecnici
     raw_data JSONB,                    -- JSON originale completo
     scraped_at TIMESTAMP WITH TIME ZONE,
@@ -44,13 +60,19 @@ CREATE TABLE IF NOT EXISTS events_data.staging_events (
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     is_active BOOLEAN DEFAULT TRUE,
 
+    -- Chiavi (su una tabella partizionata devono includere la chiave di partizione)
+    PRIMARY KEY (run_id, load_key, id),
+    CONSTRAINT uq_staging_uuid UNIQUE (run_id, load_key, uuid),
+
     -- Foreign Key
     CONSTRAINT fk_staging_city FOREIGN KEY (city_id)
         REFERENCES comuni_italiani.comuni(id) ON DELETE SET NULL
-);
+) PARTITION BY LIST (run_id);
 
 -- Commenti
 COMMENT ON TABLE events_data.staging_events IS 'Tabella staging per eventi temporanei dallo scraping, prima della validazione.';
+COMMENT ON COLUMN events_data.staging_events.run_id IS 'Chiave di partizione: run_id del DAG run.';
+COMMENT ON COLUMN events_data.staging_events.load_key IS 'Chiave di sotto-partizione: task_id del task di caricamento (load_<...> o load_to_staging).';
 COMMENT ON COLUMN events_data.staging_events.event_id IS 'ID originale dalla fonte (es. slug dall URL).';
 COMMENT ON COLUMN events_data.staging_events.uuid IS 'Hash univoco interno (titolo + data_start + location_name).';
 COMMENT ON COLUMN events_data.staging_events.content_hash IS 'Hash del contenuto per rilevare modifiche.';
@@ -59,10 +81,12 @@ COMMENT ON COLUMN events_data.staging_events.category IS 'Array di categorie (TE
 COMMENT ON COLUMN events_data.staging_events.city_id IS 'FK a comuni_italiani.comuni per join geografici.';
 COMMENT ON COLUMN events_data.staging_events.location_coords IS 'Coordinate PostGIS (SRID 4326). Usare ST_SetSRID(ST_MakePoint(lng, lat), 4326).';
 COMMENT ON COLUMN events_data.staging_events.date_display IS 'Rappresentazione testuale della data (es. "dal 31 gennaio al 1 febbraio").';
+COMMENT ON COLUMN events_data.staging_events.schedule IS 'Orari come pubblicati dalla fonte (testo libero).';
 COMMENT ON COLUMN events_data.staging_events.raw_data IS 'Dump completo del JSON scaricato dalla fonte.';
 
 -- Indici staging
-CREATE INDEX IF NOT EXISTS idx_staging_uuid ON events_data.staging_events(uuid);
+-- Deduplica dell'upsert (DISTINCT ON uuid, riga più recente) letta in ordine dall'indice
+CREATE INDEX IF NOT EXISTS idx_staging_uuid_scraped ON events_data.staging_events(uuid, scraped_at DESC NULLS LAST);
 CREATE INDEX IF NOT EXISTS idx_staging_city ON events_data.staging_events(city);
 CREATE INDEX IF NOT EXISTS idx_staging_city_id ON events_data.staging_events(city_id);
 CREATE INDEX IF NOT EXISTS idx_staging_date_start ON events_data.staging_events(date_start);
@@ -12,7 +12,7 @@ CREATE TABLE IF NOT EXISTS events_data.production_events (
     content_hash VARCHAR(16),          -- Hash del contenuto per rilevare modifiche
 
     -- Metadati Fonte
-    source VARCHAR(50) NOT NULL,       -- Es: "city_today", "zero_eu"
+    source VARCHAR(50) NOT NULL,       -- Es: "city_today", "zero_eu", "artribune"
     url TEXT,                          -- URL originale dell'evento
 
     -- Contenuto Core
@@ -37,6 +37,13 @@ CREATE TABLE IF NOT EXISTS events_data.production_events (
     date_end DATE,                     -- Data fine
     date_display TEXT,                 -- Testo leggibile (es: "dal 31 gennaio al 1 febbraio")
 
+    -- Orari
+    time_start TIME,                   -- Ora di inizio (es: 21:00)
+    time_end TIME,                     -- Ora di fine
+    time_info TEXT,                    -- Orario sintetico in testo libero
+    schedule TEXT,                     -- Orari/calendario come pubblicati dalla fonte
+    weekdays TEXT,                     -- Giorni della settimana (es: "Lunedì, Mercoledì")
+
     -- Dati Tecnici
     raw_data JSONB,                    -- JSON originale completo
     scraped_at TIMESTAMP WITH TIME ZONE,
@@ -59,6 +66,7 @@ COMMENT ON COLUMN events_data.production_events.category IS 'Array di categorie
 COMMENT ON COLUMN events_data.production_events.city_id IS 'FK a comuni_italiani.comuni per join geografici.';
 COMMENT ON COLUMN events_data.production_events.location_coords IS 'Coordinate PostGIS (SRID 4326). Usare ST_SetSRID(ST_MakePoint(lng, lat), 4326).';
 COMMENT ON COLUMN events_data.production_events.date_display IS 'Rappresentazione testuale della data (es. "dal 31 gennaio al 1 febbraio").';
+COMMENT ON COLUMN events_data.production_events.schedule IS 'Orari come pubblicati dalla fonte (testo libero).';
 COMMENT ON COLUMN events_data.production_events.raw_data IS 'Dump completo del JSON scaricato dalla fonte.';
 
 -- Indici production
@@ -68,7 +76,13 @@ CREATE INDEX IF NOT EXISTS idx_prod_city_id ON events_data.production_events(cit
 CREATE INDEX IF NOT EXISTS idx_prod_date_start ON events_data.production_events(date_start);
 CREATE INDEX IF NOT EXISTS idx_prod_date_end ON events_data.production_events(date_end);
 CREATE INDEX IF NOT EXISTS idx_prod_source ON events_data.production_events(source);
-CREATE INDEX IF NOT EXISTS idx_prod_active ON events_data.production_events(is_active);
+-- Indici parziali sui soli eventi attivi: gli eventi disattivati ne escono, la scadenza
+-- (upsert_from_staging) e la disattivazione per copertura (deactivate_missing) leggono
+-- solo le righe candidate invece di scandire la tabella
+CREATE INDEX IF NOT EXISTS idx_prod_active_until ON events_data.production_events((COALESCE(date_end, date_start)))
+    WHERE is_active;
+CREATE INDEX IF NOT EXISTS idx_prod_active_source ON events_data.production_events(source, city, date_start)
+    WHERE is_active;
 CREATE INDEX IF NOT EXISTS idx_prod_coords ON events_data.production_events USING GIST(location_coords);
 CREATE INDEX IF NOT EXISTS idx_prod_category ON events_data.production_events USING GIN(category);
 
@@ -2,26 +2,39 @@
 DAG per lo scraping degli eventi - Strategia ETL con Staging Table
 
 Pipeline:
-1. Truncate staging
-2. Scraping (DockerOperator) → JSON files (Parallel execution per city)
-3. Load JSON → staging_events
-4. Upsert staging → production_events (con confronto hash)
+1. Prepare staging (partizione del run: run concorrenti non si toccano)
+2. Scraping (DockerOperator) → JSON Lines zstd + manifest
+   (SCRAPE_SHARDS container paralleli, più città per processo; 0 = un container per città;
+   artribune, copertura nazionale, in un container a parte in parallelo)
+3. Load JSON / JSON Lines (streaming) → staging_events (sorgente letta dal manifest)
+   (PIPELINED_LOAD: ogni task di scraping ha il suo task di load, che parte appena lo scraping
+   finisce e scrive in una partizione UNLOGGED propria; load_to_staging carica i file del run rimasti)
+   (REDIS_STREAM_ENABLED: gli spider scrivono gli item nello stream Redis del run e stream_to_staging
+   li carica in staging mentre lo scraping è in corso, al posto dei file)
+4. Upsert staging → production_events (MERGE delle sole righe nuove o modificate, confronto campo per campo,
+   sulle partizioni agganciate del run; eventi conclusi marcati inattivi), poi staging del run eliminato
 5. Log ETL run
 """
 
+import hashlib
+import io
 import json
 import os
 import glob
+import re
+import time
 from datetime import datetime, timedelta
 from airflow import DAG
 from airflow.operators.python import PythonOperator
 from airflow.providers.docker.operators.docker import DockerOperator
 from airflow.providers.postgres.operators.postgres import PostgresOperator
 from airflow.providers.postgres.hooks.postgres import PostgresHook
+from airflow.utils.state import State
 from airflow.utils.task_group import TaskGroup
 from airflow.utils.trigger_rule import TriggerRule
 from airflow.exceptions import AirflowSkipException
 from docker.types import Mount
+from psycopg2.extras import execute_values
 
 default_args = {
     'owner': 'airflow',
@@ -50,17 +63,137 @@ CITIES_ZERO = ['milano', 'roma', 'bologna', 'napoli', 'firenze', 'venezia', 'tor
 # Unione di tutte le città univoche per l'iterazione
 ALL_CITIES = sorted(list(set(CITIES_TODAY + CITIES_ZERO)))
 
+# Sorgenti caricate in staging (valori della colonna source e del campo source dei manifest)
+SOURCES = ('city_today', 'zero_eu', 'artribune')
 
-class FilterableDockerOperator(DockerOperator):
+# Tabella staging (partizionata per DAG run e per task di caricamento, vedi create_staging_partition)
+STAGING_TABLE = 'events_data.staging_events'
+
+# Colonne caricate in staging (stesso ordine per INSERT e COPY)
+STAGING_COLUMNS = (
+    'uuid', 'content_hash', 'source', 'url', 'title', 'description',
+    'category', 'image_url', 'city', 'location_name', 'location_address',
+    'price', 'website', 'date_start', 'date_end', 'time_start',
+    'time_end', 'time_info', 'schedule', 'weekdays', 'raw_data', 'scraped_at',
+)
+
+# Orario HH:MM (anche H.MM, con eventuali secondi) per le colonne TIME
+TIME_RE = re.compile(r'^(\d{1,2})[:.](\d{2})')
+
+# Metodo di caricamento staging: 'copy' (COPY FROM STDIN per file) o 'insert' (INSERT multi-riga a batch)
+STAGING_LOAD_METHOD = 'copy'
+
+# Righe per batch di INSERT (ogni batch in un savepoint, bisezionato in caso di errore)
+STAGING_BATCH_SIZE = 500
+
+# Righe per singolo COPY: i file JSON Lines vengono letti in streaming e caricati a blocchi
+STAGING_COPY_CHUNK_SIZE = 5000
+
+# Formato di output richiesto agli spider: JSON Lines compresso zstd, letto in streaming dal loader
+FEED_ARGS = ['--format=jsonl', '--compress=zstd']
+
+# Sotto-periodi (giorni) per i periodi lunghi di city_today: liste più corte crawlate in parallelo
+DATE_SHARD_DAYS = {
+    'prossima-settimana': 1,
+    'questo-mese': 3,
+}
+
+
+def city_today_args(periodo):
+    """Argomenti city_today per il periodo (periodo + eventuali sotto-periodi)"""
+    args = [f'--periodo={periodo}']
+    if DATE_SHARD_DAYS.get(periodo):
+        args.append(f'--shard-days={DATE_SHARD_DAYS[periodo]}')
+    return args
+
+
+# File di output degli spider (JSON array storico, JSON Lines, JSON Lines zstd) e relativi manifest
+FEED_PATTERNS = ('*.json', '*.jsonl', '*.jsonl.zst')
+MANIFEST_SUFFIX = '.manifest.json'
+
+
+# Scraping a shard: N container long-lived, ciascuno esegue più città in un solo processo Scrapy
+# (runner "multi" dell'immagine). 0 = un container per coppia città/sorgente
+SCRAPE_SHARDS = 4
+
+# Caricamento a pipeline: ogni task di scraping è seguito da un task load_<...> che carica i suoi
+# file in una partizione di staging appena lo scraping termina, senza aspettare gli altri task.
+# L'upsert legge solo le partizioni agganciate. False = un unico load_to_staging dopo tutti gli scraping
+PIPELINED_LOAD = True
+
+# Job ripristinabile dello spider city_today (scraping/shared/resume.py): l'id è lo stesso per tutti
+# i tentativi del task, così un retry riprende coda, fingerprint e item già emessi dal volume condiviso
+SCRAPY_JOB_ENV = {'SCRAPY_JOB_ID': '{{ ti.dag_id }}.{{ ti.task_id }}.{{ run_id }}'}
+
+# DAG run di ogni container di scraping, scritto nel manifest dei file (scraping/shared/feeds.py):
+# DATA_DIR è condiviso da daily, weekly e monthly, e i task di load caricano solo i file del proprio run
+SCRAPY_RUN_ENV = {'SCRAPY_RUN_ID': '{{ run_id }}'}
+
+# Handoff tramite stream Redis (scraping/shared/stream.py): ogni DAG run ha il suo stream, gli spider
+# vi scrivono gli item (con back-pressure) e stream_to_staging li carica in staging mentre lo scraping
+# è in corso, confermandoli (XACK) solo dopo il commit. False = file JSON Lines sul volume condiviso
+REDIS_STREAM_ENABLED = False
+REDIS_STREAM_URL = os.environ.get('REDIS_STREAM_URL', 'redis://redis:6379/1')
+STREAM_KEY_PREFIX = 'events:'
+STREAM_GROUP = 'etl'
+STREAM_CONSUMER = 'stream_to_staging'
+
+# Voci lette per transazione e attesa massima di una lettura a stream vuoto (millisecondi)
+STREAM_READ_COUNT = 1000
+STREAM_BLOCK_MS = 5000
+
+# Variabili d'ambiente dei container di scraping con REDIS_STREAM_ENABLED: stream del run,
+# produttore (task) e tentativo, per scartare le voci dei tentativi precedenti
+SCRAPY_STREAM_ENV = {
+    'SCRAPY_STREAM': STREAM_KEY_PREFIX + '{{ run_id }}',
+    'SCRAPY_STREAM_PRODUCER': '{{ ti.task_id }}',
+    'SCRAPY_STREAM_ATTEMPT': '{{ ti.try_number }}',
+    'REDIS_STREAM_URL': REDIS_STREAM_URL,
+}
+
+
+def scrape_environment(job_env=None):
+    """Variabili d'ambiente di un container di scraping (run, job ripristinabile, stream Redis del run)"""
+    environment = {**SCRAPY_RUN_ENV, **(job_env or {})}
+    if REDIS_STREAM_ENABLED:
+        environment.update(SCRAPY_STREAM_ENV)
+    return environment
+
+
+def city_filter(conf, filter_key, city_name):
     """
-    DockerOperator that skips execution if the city is not in the configuration.
-    Expects 'filter_key' (e.g., 'cities_today', 'cities_zero') and 'city_name' in kwargs.
-    
-    Logic:
+    Applica i filtri di dag_run.conf a una città. Ritorna (should_run, skip_reason).
+
     1. If 'city' is in conf (Global Override): Run ONLY if city_name matches conf['city'].
     2. Else if 'filter_key' is in conf: Run ONLY if city_name is in conf[filter_key].
     3. Else: Run all (Default).
     """
+    # Check Global City Override first (e.g., {"city": "milano"})
+    if 'city' in conf:
+        target_city = conf['city'].lower().strip()
+        if city_name.lower() != target_city:
+            return False, f"Global 'city' filter set to {target_city}"
+
+    # Check Specific Filter (e.g., {"cities_zero": "milano,roma"})
+    elif filter_key in conf:
+        allowed_cities = conf.get(filter_key)
+        if isinstance(allowed_cities, str):
+            allowed_cities = allowed_cities.split(',')
+
+        allowed_cities = [c.lower().strip() for c in allowed_cities]
+
+        if city_name.lower() not in allowed_cities:
+            return False, f"Not in {filter_key} list"
+
+    return True, ""
+
+
+class FilterableDockerOperator(DockerOperator):
+    """
+    DockerOperator that skips execution if the city is not in the configuration.
+    Expects 'filter_key' (e.g., 'cities_today', 'cities_zero') and 'city_name' in kwargs.
+    Filtering logic: see city_filter().
+    """
     def __init__(self, filter_key, city_name, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.filter_key = filter_key
@@ -69,29 +202,9 @@ class FilterableDockerOperator(DockerOperator):
     def execute(self, context):
         dag_run = context['dag_run']
         conf = dag_run.conf or {}
-        
-        should_run = True
-        skip_reason = ""
-
-        # Check Global City Override first (e.g., {"city": "milano"})
-        if 'city' in conf:
-            target_city = conf['city'].lower().strip()
-            if self.city_name.lower() != target_city:
-                should_run = False
-                skip_reason = f"Global 'city' filter set to {target_city}"
-        
-        # Check Specific Filter (e.g., {"cities_zero": "milano,roma"})
-        elif self.filter_key in conf:
-            allowed_cities = conf.get(self.filter_key)
-            if isinstance(allowed_cities, str):
-                allowed_cities = allowed_cities.split(',')
-            
-            allowed_cities = [c.lower().strip() for c in allowed_cities]
-            
-            if self.city_name.lower() not in allowed_cities:
-                should_run = False
-                skip_reason = f"Not in {self.filter_key} list"
-        
+
+        should_run, skip_reason = city_filter(conf, self.filter_key, self.city_name)
+
         if not should_run:
             print(f"Skipping {self.city_name}. Reason: {skip_reason}")
             raise AirflowSkipException(f"Skipped: {skip_reason}")
@@ -99,6 +212,59 @@ class FilterableDockerOperator(DockerOperator):
         return super().execute(context)
 
 
+def artribune_filter(conf):
+    """
+    Applica i filtri di dag_run.conf ad artribune (copertura nazionale, nessuna città).
+    Ritorna (should_run, skip_reason): salta con {"artribune": false} o con il filtro globale 'city'.
+    """
+    if str(conf.get('artribune', True)).lower() == 'false':
+        return False, "artribune disabled by conf"
+    if 'city' in conf:
+        return False, f"Global 'city' filter set to {conf['city'].lower().strip()}"
+    return True, ""
+
+
+class ShardDockerOperator(DockerOperator):
+    """
+    DockerOperator che esegue un gruppo di città in un solo container (runner 'multi').
+    Le città vengono filtrate con le stesse regole di dag_run.conf (city_filter); il comando
+    viene costruito a runtime con le sole città rimaste. Se non resta nulla il task viene saltato.
+    Con artribune=True il runner esegue anche lo spider artribune (artribune_filter).
+    """
+    def __init__(self, cities_today, cities_zero, periodo, *args, artribune=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cities_today = cities_today
+        self.cities_zero = cities_zero
+        self.periodo = periodo
+        self.artribune = artribune
+
+    def execute(self, context):
+        dag_run = context['dag_run']
+        conf = dag_run.conf or {}
+
+        cities_today = [c for c in self.cities_today if city_filter(conf, 'cities_today', c)[0]]
+        cities_zero = [c for c in self.cities_zero if city_filter(conf, 'cities_zero', c)[0]]
+        artribune = self.artribune and artribune_filter(conf)[0]
+
+        if not cities_today and not cities_zero and not artribune:
+            print(f"Skipping {self.task_id}. Reason: no cities selected by conf")
+            raise AirflowSkipException("Skipped: no cities selected by conf")
+
+        command = ['multi']
+        if cities_today:
+            command += city_today_args(self.periodo)
+            command.append(f"--city-today={','.join(cities_today)}")
+        if cities_zero:
+            command.append(f"--zero-eu={','.join(cities_zero)}")
+        if artribune:
+            command.append('--artribune')
+        self.command = command + FEED_ARGS
+
+        print(f"city_today: {', '.join(cities_today) or '-'} | zero_eu: {', '.join(cities_zero) or '-'} | "
+              f"artribune: {'sì' if artribune else '-'}")
+        return super().execute(context)
+
+
 # =============================================================================
 # FUNZIONI ETL
 # =============================================================================
@@ -114,38 +280,391 @@ def log_etl_error(cursor, error_type, source, json_file, record_data, error_mess
         print(f"Warning: Could not log error to etl_errors: {e}")
 
 
-def load_json_to_staging(**context):
+def record_coverage(cursor, manifest, json_file, source, load_key, dag_run_id):
     """
-    STEP 3: Carica i JSON files nella tabella staging_events
+    Registra in scrape_coverage le finestre coperte per intero dal file (campo coverage del
+    manifest): l'upsert disattiva gli eventi attivi spariti da quelle finestre. Ritorna quante.
+    """
+    windows = (manifest or {}).get('coverage') or []
+    for window in windows:
+        cursor.execute("""
+            INSERT INTO events_data.scrape_coverage
+                (dag_run_id, load_key, source, city, window_start, window_end, json_file)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """, (dag_run_id, load_key, source, window.get('city'), window.get('date_start'),
+              window.get('date_end'), os.path.basename(json_file)))
+    return len(windows)
+
+
+def _time_value(value):
+    """Orario per una colonna TIME ('21:00'), None se assente o non interpretabile"""
+    match = TIME_RE.match(str(value).strip()) if value else None
+    if not match or int(match.group(1)) > 23 or int(match.group(2)) > 59:
+        return None
+    return f'{int(match.group(1)):02d}:{match.group(2)}'
+
+
+def _staging_row(event, source):
+    """Converte un evento validato nella tupla di valori per staging_events (ordine STAGING_COLUMNS)"""
+    # Normalizza category come array
+    category = event.get('category')
+    if category and not isinstance(category, list):
+        category = [category]
+
+    return (
+        event.get('uuid'),
+        event.get('content_hash'),
+        source,
+        event.get('url'),
+        event.get('title'),
+        event.get('description'),
+        category,
+        event.get('image_url'),
+        event.get('city'),
+        event.get('location_name'),
+        event.get('location_address'),
+        event.get('price'),
+        event.get('website'),
+        event.get('date_start'),
+        event.get('date_end'),
+        _time_value(event.get('time_start')),
+        _time_value(event.get('time_end')),
+        event.get('time_info'),
+        event.get('schedule'),
+        event.get('weekdays'),
+        json.dumps(event),
+        event.get('scraped_at')
+    )
+
+
+def _missing_fields(event):
+    """Campi obbligatori assenti dall'evento"""
+    return [field for field in ('uuid', 'title') if not event.get(field)]
+
+
+def _copy_text_value(value):
+    """Serializza un valore nel formato testo di COPY (NULL = \\N, escape di backslash/tab/newline)"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, list):
+        # Letterale array PostgreSQL: {"a","b"}
+        elements = []
+        for element in value:
+            if element is None:
+                elements.append('NULL')
+            else:
+                escaped = str(element).replace('\\', '\\\\').replace('"', '\\"')
+                elements.append(f'"{escaped}"')
+        value = '{' + ','.join(elements) + '}'
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace('\t', '\\t')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+    )
+
+
+def insert_rows_to_staging(cursor, rows, table=STAGING_TABLE):
+    """Inserisce le righe in staging (o in una sua partizione) con un unico INSERT multi-riga"""
+    execute_values(
+        cursor,
+        f"INSERT INTO {table} ({', '.join(STAGING_COLUMNS)}) VALUES %s",
+        rows,
+        page_size=max(len(rows), 1)
+    )
+
+
+def insert_batch_isolating(cursor, batch, on_row_error, table=STAGING_TABLE):
+    """
+    Inserisce un batch di coppie (evento, riga) dentro un savepoint.
+    Se il batch fallisce viene diviso a metà e ritentato ricorsivamente, finché l'errore
+    resta isolato sulle singole righe: solo quelle vengono passate a on_row_error(evento, errore),
+    le altre vengono comunque inserite a blocchi. Ritorna il numero di righe inserite.
+    """
+    if not batch:
+        return 0
+
+    cursor.execute("SAVEPOINT staging_batch")
+    try:
+        insert_rows_to_staging(cursor, [row for _, row in batch], table)
+        cursor.execute("RELEASE SAVEPOINT staging_batch")
+        return len(batch)
+    except Exception as db_err:
+        cursor.execute("ROLLBACK TO SAVEPOINT staging_batch")
+        cursor.execute("RELEASE SAVEPOINT staging_batch")
+        if len(batch) == 1:
+            on_row_error(batch[0][0], db_err)
+            return 0
+
+    middle = len(batch) // 2
+    return (
+        insert_batch_isolating(cursor, batch[:middle], on_row_error, table)
+        + insert_batch_isolating(cursor, batch[middle:], on_row_error, table)
+    )
+
+
+def copy_rows_to_staging(cursor, rows, table=STAGING_TABLE):
+    """Carica le righe in staging (o in una sua partizione) con un singolo COPY FROM STDIN (formato testo)"""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(_copy_text_value(value) for value in row))
+        buffer.write('\n')
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY {table} ({', '.join(STAGING_COLUMNS)}) FROM STDIN",
+        buffer
+    )
+
+
+def load_events_chunk(cursor, chunk, source, table, load_method, batch_size, on_row_error, label):
+    """
+    Carica un blocco di eventi validi nella partizione di staging table, ritorna le righe inserite.
+    'copy': un solo COPY in un savepoint, se fallisce si ripiega sugli INSERT a batch;
+    'insert': INSERT a batch di batch_size, le righe colpevoli vanno a on_row_error(evento, errore)
+    """
+    if load_method == 'copy':
+        cursor.execute("SAVEPOINT staging_copy")
+        try:
+            copy_rows_to_staging(cursor, [_staging_row(event, source) for event in chunk], table)
+            cursor.execute("RELEASE SAVEPOINT staging_copy")
+            return len(chunk)
+        except Exception as copy_err:
+            cursor.execute("ROLLBACK TO SAVEPOINT staging_copy")
+            print(f"COPY fallito per {label} ({copy_err}), ripiego su INSERT a batch")
+
+    loaded = 0
+    for offset in range(0, len(chunk), batch_size):
+        batch = [(event, _staging_row(event, source)) for event in chunk[offset:offset + batch_size]]
+        loaded += insert_batch_isolating(cursor, batch, on_row_error, table)
+    return loaded
+
+
+def _rows_per_second(rows, seconds):
+    """Throughput di caricamento (0 se il tempo non è misurabile)"""
+    return rows / seconds if seconds > 0 else 0.0
+
+
+def _list_feed_files():
+    """File di output degli spider presenti in DATA_DIR (manifest esclusi)"""
+    feed_files = set()
+    for pattern in FEED_PATTERNS:
+        feed_files.update(glob.glob(os.path.join(DATA_DIR, pattern)))
+    return sorted(f for f in feed_files if not f.endswith(MANIFEST_SUFFIX))
+
+
+def _feed_matches(manifest, feeds, run_id):
+    """
+    True se il file è stato prodotto dal DAG run run_id (run_id del manifest) e appartiene al task
+    di scraping descritto da feeds ({sorgente: [città]}): sorgente del manifest presente e città del
+    manifest tutte tra quelle del task. feeds None (load_to_staging) accetta tutti i file del run.
+    I file senza manifest, con una sorgente sconosciuta o di altri run (DAG sovrapposti sullo stesso
+    DATA_DIR) non vengono caricati.
+    """
+    if not manifest or manifest.get('run_id') != run_id or manifest.get('source') not in SOURCES:
+        return False
+    if feeds is None:
+        return True
+    cities = feeds.get(manifest.get('source'))
+    return cities is not None and set(manifest.get('cities') or []) <= set(cities)
+
+
+def _is_json_lines(feed_file):
+    return feed_file.endswith('.jsonl') or feed_file.endswith('.jsonl.zst')
+
+
+def _read_manifest(feed_file):
+    """Legge il manifest <file>.manifest.json scritto dallo spider a fine crawl (None se assente)"""
+    manifest_path = feed_file + MANIFEST_SUFFIX
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _file_sha256(path, chunk_size=1024 * 1024):
+    """SHA-256 del file letto a blocchi"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def iter_feed_events(feed_file, on_invalid_line=None):
+    """
+    Legge gli eventi di un file di output in streaming.
+    - .jsonl / .jsonl.zst: una riga alla volta, memoria costante; le righe non valide
+      vengono passate a on_invalid_line(numero_riga, errore) e saltate
+    - .json (array storico): richiede il parsing dell'intero file
+    """
+    if not _is_json_lines(feed_file):
+        with open(feed_file, 'r', encoding='utf-8') as f:
+            yield from json.load(f)
+        return
+
+    if feed_file.endswith('.zst'):
+        import zstandard
+        raw = open(feed_file, 'rb')
+        reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+        text = io.TextIOWrapper(reader, encoding='utf-8')
+    else:
+        text = open(feed_file, 'r', encoding='utf-8')
+
+    with text:
+        for line_number, line in enumerate(text, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                if on_invalid_line is None:
+                    raise
+                on_invalid_line(line_number, e)
+
+
+def _archive_feed(feed_file, status='processed'):
+    """Rinomina il file (e il suo manifest) in <base>.<timestamp>.<status>"""
+    base = feed_file
+    for extension in ('.jsonl.zst', '.jsonl', '.json'):
+        if base.endswith(extension):
+            base = base[:-len(extension)]
+            break
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    os.rename(feed_file, f'{base}.{timestamp}.{status}')
+    manifest_path = feed_file + MANIFEST_SUFFIX
+    if os.path.exists(manifest_path):
+        os.rename(manifest_path, f'{base}.{timestamp}.manifest.{status}')
+
+
+def load_json_to_staging(feeds=None, **context):
+    """
+    STEP 3: Carica i file di output degli spider nella tabella staging_events
     Logga record problematici nella tabella etl_errors
+
+    Le righe vanno nella partizione di staging del task (run_id del DAG run, load_key = task_id),
+    creata al primo file e agganciata alla partizione del run solo a fine caricamento. Vengono caricati
+    solo i file il cui manifest riporta il run_id del DAG run (SCRAPY_RUN_ID dei container); con feeds
+    ({sorgente: [città]}, task load_<...> del caricamento a pipeline) solo quelli del task di scraping
+    a monte, senza feeds (load_to_staging) tutti i file del run.
+
+    Per i file caricati senza alcun errore la copertura del manifest (finestre città/date
+    scaricate per intero) va in scrape_coverage, nella stessa transazione delle righe: conta
+    solo dopo l'aggancio della partizione. Un file con righe scartate non registra copertura,
+    altrimenti gli eventi scartati verrebbero disattivati.
+
+    Formati letti: JSON array (.json), JSON Lines (.jsonl) e JSON Lines zstd (.jsonl.zst).
+    I JSON Lines sono letti in streaming e caricati a blocchi, quindi la memoria resta costante
+    qualunque sia la dimensione del file. Il manifest, sempre presente nei file caricati, ne dà la
+    sorgente e viene verificato (checksum prima del caricamento, numero di item dopo); un file senza
+    manifest (crawl interrotto o in corso, file storico) o di un altro run non viene caricato.
+
+    Metodo di caricamento (STAGING_LOAD_METHOD, sovrascrivibile con conf {"load_method": "insert"}):
+    - 'copy': un COPY ogni STAGING_COPY_CHUNK_SIZE righe; se fallisce si ripiega sugli INSERT a batch
+    - 'insert': INSERT multi-riga a batch di STAGING_BATCH_SIZE (conf {"staging_batch_size": N})
+
+    Ogni batch è scritto in un savepoint: un batch fallito viene bisezionato fino alle righe
+    colpevoli, che finiscono in etl_errors, mentre le altre righe del file restano caricate.
     """
     hook = PostgresHook(postgres_conn_id=POSTGRES_CONN_ID)
     conn = hook.get_conn()
     cursor = conn.cursor()
 
-    dag_run_id = context['dag_run'].run_id
+    dag_run = context['dag_run']
+    dag_run_id = dag_run.run_id
+    conf = dag_run.conf or {}
+    load_method = (conf.get('load_method') or STAGING_LOAD_METHOD).lower()
+    if load_method not in ('copy', 'insert'):
+        raise ValueError(f"load_method non valido: {load_method} (valori ammessi: copy, insert)")
+    batch_size = int(conf.get('staging_batch_size') or STAGING_BATCH_SIZE)
+    if batch_size < 1:
+        raise ValueError(f"staging_batch_size non valido: {batch_size}")
+    chunk_size = STAGING_COPY_CHUNK_SIZE if load_method == 'copy' else batch_size
+
+    feed_files = [f for f in _list_feed_files() if _feed_matches(_read_manifest(f), feeds, dag_run_id)]
+    partition_key = context['ti'].task_id
+    partition = None
+    if feed_files:
+        # Partizione del task (riusata dai retry): nessun lock sulla tabella staging durante il caricamento
+        cursor.execute("SELECT events_data.create_staging_partition(%s, %s)", (dag_run_id, partition_key))
+        partition = cursor.fetchone()[0]
+        conn.commit()
 
-    json_files = glob.glob(f'{DATA_DIR}/*.json')
     loaded_count = 0
     skipped_count = 0
     error_count = 0
+    coverage_count = 0
+    load_seconds = 0.0
+    # Statistiche per sorgente: file, righe caricate, secondi di caricamento
+    source_stats = {}
 
-    for json_file in json_files:
+    for json_file in feed_files:
         filename = os.path.basename(json_file).lower()
-        source = 'zero_eu' if 'zero' in filename else 'city_today'
+        # Manifest sempre presente e con sorgente valida (_feed_matches)
+        manifest = _read_manifest(json_file)
+        source = manifest['source']
+
+        if manifest.get('sha256') and manifest['sha256'] != _file_sha256(json_file):
+            error_count += 1
+            log_etl_error(
+                cursor,
+                error_type='manifest_mismatch',
+                source=source,
+                json_file=json_file,
+                record_data=manifest,
+                error_message="Checksum del file diverso da quello del manifest",
+                dag_run_id=dag_run_id
+            )
+            conn.commit()
+            _archive_feed(json_file, status='rejected')
+            print(f"{filename}: checksum non corrispondente al manifest, file scartato")
+            continue
+
+        def log_insert_error(event, db_err):
+            log_etl_error(
+                cursor,
+                error_type='db_insert_error',
+                source=source,
+                json_file=json_file,
+                record_data=event,
+                error_message=str(db_err),
+                dag_run_id=dag_run_id
+            )
+
+        file_read = 0
+        errors_before_file = error_count
+
+        def log_invalid_line(line_number, json_err):
+            nonlocal error_count, file_read
+            file_read += 1
+            error_count += 1
+            log_etl_error(
+                cursor,
+                error_type='invalid_json',
+                source=source,
+                json_file=json_file,
+                record_data=None,
+                error_message=f"Riga {line_number}: {json_err}",
+                dag_run_id=dag_run_id
+            )
+
+        def load_chunk(chunk):
+            """Carica un blocco di eventi validi, ritorna le righe inserite"""
+            return load_events_chunk(cursor, chunk, source, partition, load_method, batch_size,
+                                     log_insert_error, json_file)
 
         try:
-            with open(json_file, 'r', encoding='utf-8') as f:
-                events = json.load(f)
+            file_started = time.perf_counter()
+            file_loaded = 0
+            file_insert_errors = 0
+            chunk = []
 
-            for event in events:
-                # Validazione campi obbligatori
-                missing_fields = []
-                if not event.get('uuid'):
-                    missing_fields.append('uuid')
-                if not event.get('title'):
-                    missing_fields.append('title')
+            for event in iter_feed_events(json_file, on_invalid_line=log_invalid_line):
+                file_read += 1
 
+                # Validazione campi obbligatori
+                missing_fields = _missing_fields(event)
                 if missing_fields:
                     skipped_count += 1
                     error_count += 1
@@ -160,67 +679,57 @@ def load_json_to_staging(**context):
                     )
                     continue
 
-                # Normalizza category come array
-                category = event.get('category')
-                if category and not isinstance(category, list):
-                    category = [category]
-
-                try:
-                    cursor.execute("""
-                        INSERT INTO events_data.staging_events (
-                            uuid, content_hash, source, url, title, description,
-                            category, image_url, city, location_name, location_address,
-                            price, website, date_start, date_end, time_info,
-                            schedule, weekdays, raw_data, scraped_at
-                        ) VALUES (
-                            %s, %s, %s, %s, %s, %s,
-                            %s, %s, %s, %s, %s,
-                            %s, %s, %s, %s, %s,
-                            %s, %s, %s, %s
-                        )
-                    """, (
-                        event.get('uuid'),
-                        event.get('content_hash'),
-                        source,
-                        event.get('url'),
-                        event.get('title'),
-                        event.get('description'),
-                        category,
-                        event.get('image_url'),
-                        event.get('city'),
-                        event.get('location_name'),
-                        event.get('location_address'),
-                        event.get('price'),
-                        event.get('website'),
-                        event.get('date_start'),
-                        event.get('date_end'),
-                        event.get('time_info'),
-                        event.get('schedule'),
-                        event.get('weekdays'),
-                        json.dumps(event),
-                        event.get('scraped_at')
-                    ))
-                    loaded_count += 1
-                except Exception as db_err:
-                    error_count += 1
-                    log_etl_error(
-                        cursor,
-                        error_type='db_insert_error',
-                        source=source,
-                        json_file=json_file,
-                        record_data=event,
-                        error_message=str(db_err),
-                        dag_run_id=dag_run_id
-                    )
-                    conn.rollback()
+                chunk.append(event)
+                if len(chunk) >= chunk_size:
+                    chunk_loaded = load_chunk(chunk)
+                    file_loaded += chunk_loaded
+                    file_insert_errors += len(chunk) - chunk_loaded
+                    chunk = []
+
+            if chunk:
+                chunk_loaded = load_chunk(chunk)
+                file_loaded += chunk_loaded
+                file_insert_errors += len(chunk) - chunk_loaded
+
+            error_count += file_insert_errors
+            if file_insert_errors:
+                print(f"{filename}: {file_insert_errors} righe scartate per db_insert_error, "
+                      f"le altre sono state caricate")
+
+            if manifest.get('item_count') is not None and manifest['item_count'] != file_read:
+                error_count += 1
+                log_etl_error(
+                    cursor,
+                    error_type='manifest_mismatch',
+                    source=source,
+                    json_file=json_file,
+                    record_data=manifest,
+                    error_message=f"Item letti {file_read}, attesi dal manifest {manifest['item_count']}",
+                    dag_run_id=dag_run_id
+                )
+
+            if error_count == errors_before_file:
+                coverage_count += record_coverage(cursor, manifest, json_file, source, partition_key, dag_run_id)
+            elif manifest.get('coverage'):
+                print(f"{filename}: righe scartate, copertura non registrata (nessuna disattivazione)")
 
             conn.commit()
 
+            file_seconds = time.perf_counter() - file_started
+            load_seconds += file_seconds
+            loaded_count += file_loaded
+            stats = source_stats.setdefault(source, {'files': 0, 'rows': 0, 'seconds': 0.0})
+            stats['files'] += 1
+            stats['rows'] += file_loaded
+            stats['seconds'] += file_seconds
+            print(f"{filename} [{source}]: {file_loaded} righe in {file_seconds:.2f}s "
+                  f"({_rows_per_second(file_loaded, file_seconds):.0f} righe/s)")
+
             # Archivia il file processato
-            archive_path = json_file.replace('.json', f'.{datetime.now().strftime("%Y%m%d%H%M%S")}.processed')
-            os.rename(json_file, archive_path)
+            _archive_feed(json_file)
 
         except json.JSONDecodeError as e:
+            conn.rollback()
             error_count += 1
             log_etl_error(
                 cursor,
@@ -239,41 +748,355 @@ def load_json_to_staging(**context):
             conn.rollback()
             raise
 
+    if partition:
+        # Partizione pronta: da qui in poi è visibile all'upsert
+        cursor.execute("SELECT events_data.attach_staging_partition(%s, %s)", (dag_run_id, partition_key))
+        conn.commit()
+        print(f"Partizione {partition} agganciata allo staging del run {dag_run_id}")
+
     cursor.close()
     conn.close()
 
+    rows_per_second = _rows_per_second(loaded_count, load_seconds)
+
     # Push count per XCom
     context['ti'].xcom_push(key='staging_count', value=loaded_count)
     context['ti'].xcom_push(key='error_count', value=error_count)
+    context['ti'].xcom_push(key='staging_rows_per_second', value=rows_per_second)
+    context['ti'].xcom_push(
+        key='staging_count_by_source',
+        value={source: stats['rows'] for source, stats in source_stats.items()}
+    )
+    for source, stats in sorted(source_stats.items()):
+        print(f"  {source:<12} {stats['files']:>4} file {stats['rows']:>8} righe "
+              f"({_rows_per_second(stats['rows'], stats['seconds']):.0f} righe/s)")
     print(f"Loaded {loaded_count} events to staging (skipped {skipped_count}, errors logged: {error_count})")
+    print(f"Copertura: {coverage_count} finestre (sorgente, città, periodo) registrate")
+    print(f"Metodo: {load_method}, {load_seconds:.2f}s di caricamento, {rows_per_second:.0f} righe/s")
     return loaded_count
 
 
-def upsert_to_production(**context):
+def _stream_id(entry_id):
+    """Id di una voce dello stream ('<ms>-<seq>') come tupla confrontabile"""
+    ms, _, seq = str(entry_id).partition('-')
+    return int(ms), int(seq or 0)
+
+
+def _scraping_finished(dag_run, scrape_task_ids):
+    """True se tutti i task di scraping del DAG run sono in uno stato finale (nessun retry in attesa)"""
+    return all(
+        ti.state in State.finished
+        for ti in dag_run.get_task_instances()
+        if ti.task_id in scrape_task_ids
+    )
+
+
+def stream_to_staging(**context):
     """
-    STEP 4: Upsert da staging a production usando la funzione SQL
+    STEP 3 (REDIS_STREAM_ENABLED): Carica in staging gli item dello stream Redis del run mentre
+    lo scraping è in corso (voci start/item/eof scritte da scraping/shared/stream.py)
+
+    Lettura con il consumer group STREAM_GROUP, STREAM_READ_COUNT voci per transazione:
+    - righe, contatori dei produttori e id dell'ultima voce (stream_offsets) nello stesso commit;
+      solo dopo il commit le voci vengono confermate (XACK) ed eliminate (XDEL), e la lunghezza
+      dello stream che fa da back-pressure per gli spider scende
+    - un retry del task rilegge prima le voci consegnate e non confermate: quelle con id non
+      successivo all'offset salvato sono già in staging e vengono solo confermate
+    - ogni produttore (task di scraping + sorgente) scrive nella propria partizione UNLOGGED
+      (load_key stream.<produttore>); una voce start (nuovo tentativo del task) la riparte da
+      vuota, le voci dei tentativi precedenti vengono ignorate
+    - all'eof la partizione viene agganciata se gli item ricevuti sono quelli scritti dallo
+      spider; la copertura viene registrata solo se nessun item è stato scartato
+
+    Il task termina quando lo stream è vuoto e tutti i task di scraping sono conclusi, poi
+    elimina lo stream. Le righe scartate vanno in etl_errors come nel caricamento dei file.
     """
+    import redis
+
+    dag_run = context['dag_run']
+    dag_run_id = dag_run.run_id
+    stream = STREAM_KEY_PREFIX + dag_run_id
+    scrape_task_ids = {task.task_id for task in context['dag'].tasks if isinstance(task, DockerOperator)}
+
+    client = redis.Redis.from_url(REDIS_STREAM_URL, decode_responses=True)
+    try:
+        client.xgroup_create(stream, STREAM_GROUP, id='0', mkstream=True)
+    except redis.ResponseError as e:
+        # Gruppo creato da un tentativo precedente del task: si riprende dalle sue voci
+        if 'BUSYGROUP' not in str(e):
+            raise
+
     hook = PostgresHook(postgres_conn_id=POSTGRES_CONN_ID)
     conn = hook.get_conn()
     cursor = conn.cursor()
+    cursor.execute("SELECT last_id FROM events_data.stream_offsets WHERE run_id = %s", (dag_run_id,))
+    row = cursor.fetchone()
+    last_id = row[0] if row else '0-0'
 
-    # Chiama la funzione upsert
-    cursor.execute("SELECT * FROM events_data.upsert_from_staging()")
-    result = cursor.fetchone()
+    # Stato dei produttori (sorgente, tentativo corrente, partizione) e item in attesa di caricamento
+    producers = {}
+    pending = {}
+    error_count = 0
+    stale_count = 0
+    coverage_count = 0
+    completed = []
+
+    def producer_state(producer):
+        if producer not in producers:
+            cursor.execute(
+                "SELECT source, attempt FROM events_data.stream_producers WHERE run_id = %s AND producer = %s",
+                (dag_run_id, producer)
+            )
+            found = cursor.fetchone()
+            state = None
+            if found:
+                cursor.execute("SELECT events_data.create_staging_partition(%s, %s)",
+                               (dag_run_id, f'stream.{producer}'))
+                state = {'source': found[0], 'attempt': found[1], 'table': cursor.fetchone()[0]}
+            producers[producer] = state
+        return producers[producer]
+
+    def log_error(error_type, source, producer, record_data, error_message):
+        nonlocal error_count
+        error_count += 1
+        log_etl_error(cursor, error_type=error_type, source=source, json_file=producer,
+                      record_data=record_data, error_message=error_message, dag_run_id=dag_run_id)
+
+    def flush_pending():
+        """Carica gli item in attesa e aggiorna i contatori dei produttori"""
+        for producer, (events, rejected) in pending.items():
+            state = producers[producer]
+
+            def log_insert_error(event, db_err):
+                log_error('db_insert_error', state['source'], producer, event, str(db_err))
+
+            loaded = 0
+            if events:
+                loaded = load_events_chunk(cursor, events, state['source'], state['table'], STAGING_LOAD_METHOD,
+                                           STAGING_BATCH_SIZE, log_insert_error, producer)
+            cursor.execute("""
+                UPDATE events_data.stream_producers
+                SET received = received + %s, rejected = rejected + %s
+                WHERE run_id = %s AND producer = %s
+            """, (len(events) + rejected, rejected + len(events) - loaded, dag_run_id, producer))
+        pending.clear()
+
+    def handle_entry(fields):
+        nonlocal stale_count, coverage_count
+        kind = fields.get('type')
+        producer = fields.get('producer')
+        source = fields.get('source')
+        attempt = int(fields.get('attempt') or 1)
+        load_key = f'stream.{producer}'
+
+        if kind == 'start':
+            flush_pending()
+            cursor.execute("SELECT events_data.reset_staging_partition(%s, %s)", (dag_run_id, load_key))
+            table = cursor.fetchone()[0]
+            cursor.execute("""
+                INSERT INTO events_data.stream_producers (run_id, producer, source, attempt)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (run_id, producer)
+                DO UPDATE SET source = EXCLUDED.source, attempt = EXCLUDED.attempt, received = 0, rejected = 0
+            """, (dag_run_id, producer, source, attempt))
+            producers[producer] = {'source': source, 'attempt': attempt, 'table': table}
+            print(f"{producer}: tentativo {attempt}, partizione {table}")
+            return
+
+        state = producer_state(producer)
+        if state is None or state['attempt'] != attempt:
+            # Voce di un tentativo precedente (o senza start: stato perso con un crash di PostgreSQL)
+            stale_count += 1
+            return
+
+        if kind == 'item':
+            events, rejected = pending.get(producer, ([], 0))
+            try:
+                event = json.loads(fields.get('data') or '')
+            except json.JSONDecodeError as e:
+                log_error('invalid_json', source, producer, None, str(e))
+                pending[producer] = (events, rejected + 1)
+                return
+            missing_fields = _missing_fields(event)
+            if missing_fields:
+                log_error('missing_required_fields', source, producer, event,
+                          f"Missing fields: {', '.join(missing_fields)}")
+                pending[producer] = (events, rejected + 1)
+                return
+            events.append(event)
+            pending[producer] = (events, rejected)
+            return
+
+        if kind == 'eof':
+            flush_pending()
+            cursor.execute(
+                "SELECT received, rejected FROM events_data.stream_producers WHERE run_id = %s AND producer = %s",
+                (dag_run_id, producer)
+            )
+            received, rejected = cursor.fetchone()
+            expected = int(fields.get('item_count') or 0)
+            if received != expected:
+                # Item persi: la partizione resta staccata (non arriva all'upsert) e non disattiva nulla
+                log_error('manifest_mismatch', source, producer, dict(fields),
+                          f"Item ricevuti {received}, scritti dallo spider {expected}: partizione non agganciata")
+                print(f"{producer}: {received} item ricevuti su {expected}, partizione non agganciata")
+                return
+            if rejected == 0:
+                coverage = json.loads(fields.get('coverage') or '[]')
+                coverage_count += record_coverage(cursor, {'coverage': coverage}, producer, source, load_key, dag_run_id)
+            cursor.execute("SELECT events_data.attach_staging_partition(%s, %s)", (dag_run_id, load_key))
+            completed.append(producer)
+            print(f"{producer}: {received - rejected} righe ({rejected} scartate), partizione agganciata")
+
+    started = time.perf_counter()
+    # Prima le voci consegnate a un tentativo precedente e mai confermate, poi quelle nuove
+    read_id = '0'
+    idle = False
+    finished = False
+    try:
+        while True:
+            if idle:
+                # Controllato prima della lettura: un task concluso ha già scritto tutte le sue voci
+                finished = _scraping_finished(dag_run, scrape_task_ids)
+            response = client.xreadgroup(
+                STREAM_GROUP, STREAM_CONSUMER, {stream: read_id},
+                count=STREAM_READ_COUNT, block=None if read_id == '0' else STREAM_BLOCK_MS
+            )
+            entries = response[0][1] if response else []
+            if not entries:
+                if read_id == '0':
+                    read_id = '>'
+                elif finished:
+                    break
+                idle = True
+                continue
+            idle = False
+
+            for entry_id, fields in entries:
+                # Già caricata prima di un retry (o eliminata: fields vuoti)
+                if fields and _stream_id(entry_id) > _stream_id(last_id):
+                    handle_entry(fields)
+            flush_pending()
+
+            if _stream_id(entries[-1][0]) > _stream_id(last_id):
+                last_id = entries[-1][0]
+            cursor.execute("""
+                INSERT INTO events_data.stream_offsets (run_id, stream, last_id)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (run_id) DO UPDATE SET last_id = EXCLUDED.last_id, updated_at = CURRENT_TIMESTAMP
+            """, (dag_run_id, stream, last_id))
+            conn.commit()
+
+            # Solo dopo il commit: una voce confermata è già in staging
+            entry_ids = [entry_id for entry_id, _ in entries]
+            client.xack(stream, STREAM_GROUP, *entry_ids)
+            client.xdel(stream, *entry_ids)
+    except Exception:
+        conn.rollback()
+        cursor.close()
+        conn.close()
+        raise
 
-    inserted, updated, unchanged = result if result else (0, 0, 0)
+    # Tutti i produttori hanno concluso: lo stream del run non serve più
+    client.delete(stream)
+    client.close()
 
+    cursor.execute("""
+        SELECT source, count(*) FROM events_data.staging_events
+        WHERE run_id = %s AND load_key LIKE 'stream.%%'
+        GROUP BY source
+    """, (dag_run_id,))
+    by_source = dict(cursor.fetchall())
     conn.commit()
     cursor.close()
     conn.close()
 
+    loaded_count = sum(by_source.values())
+    load_seconds = time.perf_counter() - started
+
+    context['ti'].xcom_push(key='staging_count', value=loaded_count)
+    context['ti'].xcom_push(key='error_count', value=error_count)
+    context['ti'].xcom_push(key='staging_rows_per_second', value=_rows_per_second(loaded_count, load_seconds))
+    context['ti'].xcom_push(key='staging_count_by_source', value=by_source)
+    for source, count in sorted(by_source.items()):
+        print(f"  {source:<12} {count:>8} righe")
+    print(f"Stream {stream}: {loaded_count} righe in staging da {len(completed)} produttori "
+          f"(errori: {error_count}, voci di tentativi precedenti ignorate: {stale_count})")
+    print(f"Copertura: {coverage_count} finestre (sorgente, città, periodo) registrate")
+    return loaded_count
+
+
+def upsert_to_production(**context):
+    """
+    STEP 4: Upsert da staging a production usando la funzione SQL (MERGE delle sole righe nuove o
+    modificate, poi eventi spariti dalle finestre coperte dal run ed eventi conclusi marcati inattivi)
+
+    Legge solo la partizione di staging del DAG run e la elimina a upsert concluso. Le partizioni
+    sono UNLOGGED: se contengono meno righe di quelle caricate dai task di load (svuotate da un
+    crash di PostgreSQL) il task fallisce invece di fare il merge di uno staging incompleto.
+    """
+    hook = PostgresHook(postgres_conn_id=POSTGRES_CONN_ID)
+    conn = hook.get_conn()
+    cursor = conn.cursor()
+    dag_run_id = context['dag_run'].run_id
+
+    # Partizioni pronte (agganciate dai task di load conclusi): sono le sole lette dall'upsert
+    cursor.execute(
+        "SELECT count(*) FROM pg_inherits "
+        "WHERE inhparent = to_regclass('events_data.' || quote_ident(events_data.staging_run_partition_name(%s)))",
+        (dag_run_id,)
+    )
+    print(f"Merge di {cursor.fetchone()[0]} partizioni di staging del run {dag_run_id}")
+
+    loaded = sum(
+        count or 0
+        for count in context['ti'].xcom_pull(key='staging_count', task_ids=_load_task_ids(context['dag'])) or []
+    )
+    cursor.execute("SELECT count(*) FROM events_data.staging_events WHERE run_id = %s", (dag_run_id,))
+    staged = cursor.fetchone()[0]
+    if staged < loaded:
+        cursor.close()
+        conn.close()
+        raise ValueError(
+            f"Staging del run con {staged} righe, i task di load ne hanno caricate {loaded}: "
+            f"partizioni UNLOGGED svuotate (crash di PostgreSQL?). Rieseguire il DAG run."
+        )
+
+    # Chiama la funzione upsert (il run_id seleziona staging e copertura del run)
+    cursor.execute(
+        "SELECT count(*) FROM events_data.scrape_coverage WHERE dag_run_id = %s", (dag_run_id,)
+    )
+    print(f"Finestre di copertura del run: {cursor.fetchone()[0]}")
+    cursor.execute("SELECT * FROM events_data.upsert_from_staging(%s)", (dag_run_id,))
+    result = cursor.fetchone()
+
+    inserted, updated, unchanged, deactivated = result if result else (0, 0, 0, 0)
+
+    conn.commit()
+
     # Push results per XCom
     context['ti'].xcom_push(key='inserted_count', value=inserted)
     context['ti'].xcom_push(key='updated_count', value=updated)
     context['ti'].xcom_push(key='unchanged_count', value=unchanged)
+    context['ti'].xcom_push(key='deactivated_count', value=deactivated)
 
-    print(f"Upsert completed: {inserted} inserted, {updated} updated, {unchanged} unchanged")
-    return {'inserted': inserted, 'updated': updated, 'unchanged': unchanged}
+    # Staging del run non più necessario (transazione a parte: il merge è già confermato)
+    cursor.execute("SELECT events_data.drop_staging_run(%s)", (dag_run_id,))
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+    print(f"Upsert completed: {inserted} inserted, {updated} updated, {unchanged} unchanged, "
+          f"{deactivated} deactivated")
+    return {'inserted': inserted, 'updated': updated, 'unchanged': unchanged, 'deactivated': deactivated}
+
+
+def _load_task_ids(dag_obj):
+    """task_id dei task che caricano in staging"""
+    return [
+        task.task_id for task in dag_obj.tasks
+        if getattr(task, 'python_callable', None) in (load_json_to_staging, stream_to_staging)
+    ]
 
 
 def log_etl_run(**context):
@@ -283,10 +1106,17 @@ def log_etl_run(**context):
     ti = context['ti']
     dag_run = context['dag_run']
 
-    staging_count = ti.xcom_pull(key='staging_count', task_ids='load_to_staging') or 0
+    # Righe caricate da tutti i task di load (load_to_staging e, a pipeline, i load_<...>)
+    load_task_ids = _load_task_ids(context['dag'])
+    staging_count = sum(count or 0 for count in ti.xcom_pull(key='staging_count', task_ids=load_task_ids) or [])
+    staging_by_source = {}
+    for counts in ti.xcom_pull(key='staging_count_by_source', task_ids=load_task_ids) or []:
+        for src, count in (counts or {}).items():
+            staging_by_source[src] = staging_by_source.get(src, 0) + count
     inserted = ti.xcom_pull(key='inserted_count', task_ids='upsert_to_production') or 0
     updated = ti.xcom_pull(key='updated_count', task_ids='upsert_to_production') or 0
     unchanged = ti.xcom_pull(key='unchanged_count', task_ids='upsert_to_production') or 0
+    deactivated = ti.xcom_pull(key='deactivated_count', task_ids='upsert_to_production') or 0
 
     hook = PostgresHook(postgres_conn_id=POSTGRES_CONN_ID)
     conn = hook.get_conn()
@@ -295,14 +1125,15 @@ def log_etl_run(**context):
     cursor.execute("""
         INSERT INTO events_data.etl_runs (
             run_type, staging_count, inserted_count, updated_count,
-            unchanged_count, status, upsert_completed_at
-        ) VALUES (%s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+            unchanged_count, deactivated_count, status, upsert_completed_at
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
     """, (
         dag_run.dag_id,
         staging_count,
         inserted,
         updated,
         unchanged,
+        deactivated,
         'completed'
     ))
 
@@ -310,17 +1141,20 @@ def log_etl_run(**context):
     cursor.close()
     conn.close()
 
-    print(f"ETL Run logged: staging={staging_count}, inserted={inserted}, updated={updated}, unchanged={unchanged}")
+    print(f"ETL Run logged: staging={staging_count}, inserted={inserted}, updated={updated}, "
+          f"unchanged={unchanged}, deactivated={deactivated}")
+    if staging_by_source:
+        print("Staging per sorgente: " + ", ".join(f"{src}={count}" for src, count in sorted(staging_by_source.items())))
 
 
 def cleanup_old_files(**context):
     """
-    Pulisce i file processati più vecchi di 7 giorni
+    Pulisce i file processati (o scartati) più vecchi di 7 giorni
     """
     import time
     cutoff = time.time() - (7 * 24 * 60 * 60)  # 7 giorni
 
-    for f in glob.glob(f'{DATA_DIR}/*.processed'):
+    for f in glob.glob(f'{DATA_DIR}/*.processed') + glob.glob(f'{DATA_DIR}/*.rejected'):
         if os.path.getmtime(f) < cutoff:
             os.remove(f)
             print(f"Removed old file: {f}")
@@ -352,11 +1186,121 @@ def create_common_tasks(dag_obj):
     return load, upsert, log
 
 
-def generate_city_tasks(dag_obj, periodo, include_zero=False):
+def create_load_task(dag_obj, task_id, feeds):
+    """
+    Task di load a pipeline: carica i file del task di scraping a monte (feeds = {sorgente: [città]})
+    nella propria partizione di staging appena lo scraping termina.
+    """
+    return PythonOperator(
+        task_id=task_id,
+        python_callable=load_json_to_staging,
+        op_kwargs={'feeds': feeds},
+        dag=dag_obj,
+    )
+
+
+def create_stream_task(dag_obj, prepare, upsert):
+    """
+    Con REDIS_STREAM_ENABLED: task stream_to_staging, in parallelo allo scraping tra la
+    preparazione dello staging e l'upsert. Ritorna None se lo stream è disattivato.
+    """
+    if not REDIS_STREAM_ENABLED:
+        return None
+    stream = PythonOperator(
+        task_id='stream_to_staging',
+        python_callable=stream_to_staging,
+        dag=dag_obj,
+    )
+    prepare >> stream >> upsert
+    return stream
+
+
+def generate_artribune_task(dag_obj):
+    """
+    Task dello spider artribune (copertura nazionale, crawl incrementale): un container a parte,
+    in parallelo agli shard delle città, così non allunga il percorso critico del primo shard.
+    Con PIPELINED_LOAD (senza stream Redis) il gruppo contiene anche load_artribune
+    (task_id senza prefisso del gruppo).
+    """
+    with TaskGroup(group_id='artribune', prefix_group_id=False, dag=dag_obj) as group:
+        scrape = ShardDockerOperator(
+            task_id='scrape_artribune',
+            cities_today=[],
+            cities_zero=[],
+            periodo=None,
+            artribune=True,
+            image=SCRAPY_IMAGE,
+            command=['multi'],
+            environment=scrape_environment(),
+            mounts=[
+                Mount(source='/Users/skyweb/Sites/today_events/infrastructures/data',
+                      target='/data/output', type='bind')
+            ],
+            network_mode='events-network',
+            auto_remove=True,
+            force_pull=False,
+            docker_url='unix://var/run/docker.sock',
+            dag=dag_obj,
+        )
+        if PIPELINED_LOAD and not REDIS_STREAM_ENABLED:
+            scrape >> create_load_task(dag_obj, 'load_artribune', {'artribune': []})
+    return group
+
+
+def generate_shard_tasks(dag_obj, periodo, include_zero=False, shards=SCRAPE_SHARDS):
+    """
+    Generates one ShardDockerOperator per shard.
+    city_today cities are spread round-robin (each *today.it domain keeps its own download slot);
+    zero_eu cities share a single domain and stay together in the first shard.
+    With PIPELINED_LOAD each shard is a TaskGroup (no task_id prefix) scrape_shard_<n> >> load_shard_<n>.
+    """
+    shard_today = [CITIES_TODAY[i::shards] for i in range(shards)]
+    shard_zero = [[] for _ in range(shards)]
+    if include_zero:
+        shard_zero[0] = list(CITIES_ZERO)
+
+    shard_tasks = []
+    for i in range(shards):
+        if not shard_today[i] and not shard_zero[i]:
+            continue
+        with TaskGroup(group_id=f'shard_{i}', prefix_group_id=False, dag=dag_obj) as shard_group:
+            scrape = ShardDockerOperator(
+                task_id=f'scrape_shard_{i}',
+                cities_today=shard_today[i],
+                cities_zero=shard_zero[i],
+                periodo=periodo,
+                image=SCRAPY_IMAGE,
+                command=['multi'],
+                environment=scrape_environment(SCRAPY_JOB_ENV),
+                mounts=[
+                    Mount(source='/Users/skyweb/Sites/today_events/infrastructures/data',
+                          target='/data/output', type='bind')
+                ],
+                network_mode='events-network',
+                auto_remove=True,
+                force_pull=False,
+                docker_url='unix://var/run/docker.sock',
+                dag=dag_obj,
+            )
+            if PIPELINED_LOAD and not REDIS_STREAM_ENABLED:
+                feeds = {'city_today': shard_today[i], 'zero_eu': shard_zero[i]}
+                scrape >> create_load_task(dag_obj, f'load_shard_{i}', {k: v for k, v in feeds.items() if v})
+        shard_tasks.append(shard_group)
+
+    return shard_tasks
+
+
+def generate_city_tasks(dag_obj, periodo, include_zero=False, include_artribune=False):
     """
     Generates TaskGroups for each city.
     Inside each city group, creates tasks for supported sources.
+    With SCRAPE_SHARDS > 0 the cities are grouped in shard tasks instead (see generate_shard_tasks).
+    artribune (no cities) always gets its own parallel task (see generate_artribune_task).
     """
+    extra_tasks = [generate_artribune_task(dag_obj)] if include_artribune else []
+    if SCRAPE_SHARDS:
+        return generate_shard_tasks(dag_obj, periodo, include_zero=include_zero) + extra_tasks
+
     city_groups = []
     
     for city in ALL_CITIES:
@@ -370,12 +1314,13 @@ def generate_city_tasks(dag_obj, periodo, include_zero=False):
         with TaskGroup(group_id=f'process_{city}', dag=dag_obj) as city_group:
             
             if has_today:
-                FilterableDockerOperator(
+                scrape_today = FilterableDockerOperator(
                     task_id='scrape_city_today',
                     filter_key='cities_today',
                     city_name=city,
                     image=SCRAPY_IMAGE,
-                    command=['city_today', city, f'--periodo={periodo}'],
+                    command=['city_today', city] + city_today_args(periodo) + FEED_ARGS,
+                    environment=scrape_environment(SCRAPY_JOB_ENV),
                     mounts=[
                         Mount(source='/Users/skyweb/Sites/today_events/infrastructures/data',
                               target='/data/output', type='bind')
@@ -387,13 +1332,17 @@ def generate_city_tasks(dag_obj, periodo, include_zero=False):
                     dag=dag_obj,
                 )
 
+                if PIPELINED_LOAD and not REDIS_STREAM_ENABLED:
+                    scrape_today >> create_load_task(dag_obj, 'load_city_today', {'city_today': [city]})
+
             if has_zero:
-                FilterableDockerOperator(
+                scrape_zero = FilterableDockerOperator(
                     task_id='scrape_zero_eu',
                     filter_key='cities_zero',
                     city_name=city,
                     image=SCRAPY_IMAGE,
-                    command=['zero_eu', city],
+                    command=['zero_eu', city] + FEED_ARGS,
+                    environment=scrape_environment(),
                     mounts=[
                         Mount(source='/Users/skyweb/Sites/today_events/infrastructures/data',
                               target='/data/output', type='bind')
@@ -404,10 +1353,12 @@ def generate_city_tasks(dag_obj, periodo, include_zero=False):
                     docker_url='unix://var/run/docker.sock',
                     dag=dag_obj,
                 )
+                if PIPELINED_LOAD and not REDIS_STREAM_ENABLED:
+                    scrape_zero >> create_load_task(dag_obj, 'load_zero_eu', {'zero_eu': [city]})
         
         city_groups.append(city_group)
     
-    return city_groups
+    return city_groups + extra_tasks
 
 
 # =============================================================================
@@ -423,10 +1374,11 @@ with DAG(
     tags=['events', 'etl', 'daily'],
 ) as dag_daily:
 
-    truncate_staging = PostgresOperator(
-        task_id='truncate_staging',
+    prepare_staging = PostgresOperator(
+        task_id='prepare_staging',
         postgres_conn_id=POSTGRES_CONN_ID,
-        sql="SELECT events_data.truncate_staging();",
+        sql="SELECT events_data.prepare_staging_run(%(run_id)s);",
+        parameters={'run_id': '{{ run_id }}'},
     )
 
     load, upsert, log = create_common_tasks(dag_daily)
@@ -437,11 +1389,12 @@ with DAG(
         dag=dag_daily
     )
 
-    # Generate groups for all cities (Both sources)
-    city_groups = generate_city_tasks(dag_daily, 'questa-settimana', include_zero=True)
+    # Generate groups for all cities (city_today + zero_eu) and the national artribune task
+    city_groups = generate_city_tasks(dag_daily, 'questa-settimana', include_zero=True, include_artribune=True)
 
     # Pipeline
-    truncate_staging >> city_groups >> load >> upsert >> log >> cleanup
+    prepare_staging >> city_groups >> load >> upsert >> log >> cleanup
+    create_stream_task(dag_daily, prepare_staging, upsert)
 
 
 # =============================================================================
@@ -457,10 +1410,11 @@ with DAG(
     tags=['events', 'etl', 'weekly'],
 ) as dag_weekly:
 
-    truncate_staging_w = PostgresOperator(
-        task_id='truncate_staging',
+    prepare_staging_w = PostgresOperator(
+        task_id='prepare_staging',
         postgres_conn_id=POSTGRES_CONN_ID,
-        sql="SELECT events_data.truncate_staging();",
+        sql="SELECT events_data.prepare_staging_run(%(run_id)s);",
+        parameters={'run_id': '{{ run_id }}'},
     )
 
     load_w, upsert_w, log_w = create_common_tasks(dag_weekly)
@@ -468,7 +1422,8 @@ with DAG(
     # Only City Today
     city_groups_w = generate_city_tasks(dag_weekly, 'prossima-settimana', include_zero=False)
 
-    truncate_staging_w >> city_groups_w >> load_w >> upsert_w >> log_w
+    prepare_staging_w >> city_groups_w >> load_w >> upsert_w >> log_w
+    create_stream_task(dag_weekly, prepare_staging_w, upsert_w)
 
 
 # =============================================================================
@@ -484,10 +1439,11 @@ with DAG(
     tags=['events', 'etl', 'monthly'],
 ) as dag_monthly:
 
-    truncate_staging_m = PostgresOperator(
-        task_id='truncate_staging',
+    prepare_staging_m = PostgresOperator(
+        task_id='prepare_staging',
         postgres_conn_id=POSTGRES_CONN_ID,
-        sql="SELECT events_data.truncate_staging();",
+        sql="SELECT events_data.prepare_staging_run(%(run_id)s);",
+        parameters={'run_id': '{{ run_id }}'},
     )
 
     load_m, upsert_m, log_m = create_common_tasks(dag_monthly)
@@ -495,4 +1451,5 @@ with DAG(
     # Only City Today
     city_groups_m = generate_city_tasks(dag_monthly, 'questo-mese', include_zero=False)
 
-    truncate_staging_m >> city_groups_m >> load_m >> upsert_m >> log_m
+    prepare_staging_m >> city_groups_m >> load_m >> upsert_m >> log_m
+    create_stream_task(dag_monthly, prepare_staging_m, upsert_m)
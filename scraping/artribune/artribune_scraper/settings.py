@@ -18,7 +18,44 @@ DOWNLOAD_DELAY = 1.5
 # Configure item pipelines
 ITEM_PIPELINES = {
    "artribune_scraper.pipelines.ArtribunePipeline": 300,
+   # Item nello stream Redis del run (attivo solo con SCRAPY_STREAM e REDIS_STREAM_URL)
+   "shared.stream.RedisStreamPipeline": 900,
 }
 
+# Sorgente negli item dello stream; back-pressure: lo spider aspetta finché lo stream ha
+# REDIS_STREAM_MAX_LEN voci non ancora caricate dall'ETL (vedi shared/stream.py)
+STREAM_SOURCE = "artribune"
+REDIS_STREAM_BATCH_SIZE = 100
+REDIS_STREAM_MAX_LEN = 20000
+
+# Crawl incrementale ($SCRAPY_STATE_DIR/artribune/crawl_state.sqlite): dopo il primo crawl completo
+# wp/v2/event viene chiesta con modified_after = high-water mark - INCREMENTAL_OVERLAP_MINUTES, quindi
+# solo gli eventi modificati (e i loro dettagli). CRAWL_MODE: "auto" (giro completo ogni FULL_SWEEP_DAYS),
+# "incremental", "full". Il mark avanza solo se tutte le pagine e i dettagli sono stati scaricati
+INCREMENTAL_ENABLED = True
+CRAWL_MODE = "auto"
+FULL_SWEEP_DAYS = 7
+INCREMENTAL_OVERLAP_MINUTES = 60
+
+# Dati dell'endpoint a7e/v1/events (luogo, date, URL immagini) tenuti per URL fino all'uso in parse:
+# al più ENRICHMENT_MEMORY_ITEMS voci in memoria, le altre in un file temporaneo in
+# $SCRAPY_STATE_DIR/artribune/tmp (eliminato a fine crawl)
+ENRICHMENT_MEMORY_ITEMS = 5000
+
+# Enable or disable downloader middlewares
+DOWNLOADER_MIDDLEWARES = {
+    "scrapy.downloadermiddlewares.httpcache.HttpCacheMiddleware": None,
+    "shared.httpcache.ConditionalCacheMiddleware": 900,
+}
+
+# Cache HTTP persistente con GET condizionali (ETag / Last-Modified), condivisa dai progetti
+# Vedi scraping/shared/httpcache.py; la directory è relativa a SCRAPY_STATE_DIR
+HTTPCACHE_ENABLED = True
+HTTPCACHE_POLICY = "shared.httpcache.ConditionalGetPolicy"
+HTTPCACHE_STORAGE = "shared.httpcache.BoundedFilesystemCacheStorage"
+HTTPCACHE_DIR = "httpcache"
+HTTPCACHE_MAX_BYTES = 512 * 1024 * 1024
+HTTPCACHE_GZIP = True
+
 # Set settings whose default value is deprecated to a future-proof value
 FEED_EXPORT_ENCODING = "utf-8"
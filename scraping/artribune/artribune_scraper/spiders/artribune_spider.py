@@ -1,10 +1,26 @@
 import scrapy
 import hashlib
 import json
+import os
 import re
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
+from shared.apistats import decode_json, summarize_api_stats
+from shared.state import STATE_DIR, state_path
+from shared.store import JsonStore, SpillStore
 from artribune_scraper.items import EventItem
 
+# Date di WP REST (date, modified, modified_after): ora locale del sito, senza fuso
+WP_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S"
+# auto: incrementale con giro completo ogni FULL_SWEEP_DAYS, incremental: sempre incrementale,
+# full: tutte le pagine (il primo crawl senza high-water mark è sempre completo)
+CRAWL_MODES = ("auto", "incremental", "full")
+
+# Campi dell'endpoint custom, letti per ogni evento in parse_custom_api
+PROVINCE_SUFFIX_RE = re.compile(r'\s*\([A-Z]{2}\)$')
+DATETIME_RE = re.compile(r'datetime=["\'](\d{4}-\d{2}-\d{2})["\']')
+IMG_SRC_RE = re.compile(r'src=["\'](.*?)["\']')
+
 class ArtribuneSpider(scrapy.Spider):
     name = "artribune"
     allowed_domains = ["artribune.com"]
@@ -12,15 +28,67 @@ class ArtribuneSpider(scrapy.Spider):
     # Configurazione
     per_page = 100  # Massimo supportato da WP REST API
     max_pages = None  # None = tutte le pagine
+    # Campi chiesti a wp/v2/event (_fields): gli oggetti completi portano contenuto, SEO e _links
+    # che lo spider non legge
+    wp_fields = ("id", "slug", "link", "date", "modified", "title")
+
+    # Dati già estratti dall'endpoint custom (luogo, date, URL immagini) per URL della pagina evento:
+    # per istanza, al più ENRICHMENT_MEMORY_ITEMS voci in memoria e le altre su disco
+    custom_api_data = None
+
+    # Stato del crawl incrementale: high-water mark (massimo "modified" visto) e ultimo giro completo
+    crawl_state = None
+    crawl_mode = "full"
+    modified_after = None
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        settings = crawler.settings
+        spider.started_at = time.time()
+        spider.max_modified = None
+        spider.incomplete = False
+        spider.custom_api_data = SpillStore(
+            settings.getint("ENRICHMENT_MEMORY_ITEMS", 5000),
+            directory=os.path.join(STATE_DIR, "artribune", "tmp"),
+        )
 
-    # Cache dati strutturati dall'endpoint custom (indexed by URL)
-    custom_api_data = {}
+        if settings.getbool("INCREMENTAL_ENABLED", True):
+            mode = kwargs.get("mode") or settings.get("CRAWL_MODE", "auto")
+            if mode not in CRAWL_MODES:
+                raise ValueError(f"CRAWL_MODE '{mode}' non supportato ({', '.join(CRAWL_MODES)})")
+            spider.crawl_state = JsonStore(state_path("artribune", "crawl_state.sqlite"))
+            spider.crawl_mode, spider.modified_after = spider._resolve_crawl_mode(mode, settings)
+        return spider
+
+    def _resolve_crawl_mode(self, mode, settings):
+        """Modalità effettiva (full, incremental) e valore di modified_after"""
+        high_water_mark = self.crawl_state.get("high_water_mark")
+        if mode == "full" or not high_water_mark:
+            return "full", None
+
+        if mode == "auto":
+            last_full_sweep = self.crawl_state.get("last_full_sweep")
+            full_sweep_age = settings.getfloat("FULL_SWEEP_DAYS", 7) * 86400
+            if not last_full_sweep or time.time() - last_full_sweep > full_sweep_age:
+                self.logger.info("Giro completo periodico (FULL_SWEEP_DAYS)")
+                return "full", None
+
+        # Margine sul mark: modifiche salvate a cavallo del crawl precedente
+        overlap = timedelta(minutes=settings.getfloat("INCREMENTAL_OVERLAP_MINUTES", 60))
+        since = datetime.strptime(high_water_mark, WP_DATE_FORMAT) - overlap
+        self.logger.info(f"Crawl incrementale: eventi modificati dopo {since.strftime(WP_DATE_FORMAT)}")
+        return "incremental", since.strftime(WP_DATE_FORMAT)
 
     def start_requests(self):
         """
         Prima scarica l'endpoint custom per i dati strutturati,
         poi procede con l'endpoint standard per la paginazione completa.
         """
+        self.crawler.stats.set_value("crawl/mode", self.crawl_mode)
+        if self.modified_after:
+            self.crawler.stats.set_value("crawl/modified_after", self.modified_after)
+
         # 1. Endpoint custom (una sola pagina, dati strutturati)
         yield scrapy.Request(
             "https://www.artribune.com/wp-json/a7e/v1/events",
@@ -34,40 +102,90 @@ class ArtribuneSpider(scrapy.Spider):
         Poi avvia lo scraping dall'endpoint standard.
         """
         try:
-            data = response.json()
+            data = decode_json(response, self.crawler.stats, "a7e")
             events = data.get('events', []) if isinstance(data, dict) else data
 
             self.logger.info(f"Endpoint custom: {len(events)} eventi con dati strutturati")
 
-            # Memorizza dati per URL
+            # Memorizza per URL solo i campi estratti (niente blob HTML)
             for event in events:
                 url = event.get('url')
                 if url:
-                    self.custom_api_data[url] = {
-                        'place': event.get('place', {}),
-                        'dates_html': event.get('dates'),
-                        'image_html': event.get('image'),
-                        'excerpt': event.get('excerpt'),
-                    }
+                    self.custom_api_data.set(url, self._extract_custom_fields(event))
 
-            self.logger.info(f"Memorizzati {len(self.custom_api_data)} eventi dall'API custom")
+            self.logger.info(
+                f"Memorizzati {len(self.custom_api_data)} eventi dall'API custom "
+                f"({self.custom_api_data.spilled()} su disco)"
+            )
+            self.crawler.stats.set_value("custom_api/stored", len(self.custom_api_data))
+            self.crawler.stats.set_value("custom_api/spilled", self.custom_api_data.spilled())
 
         except Exception as e:
             self.logger.warning(f"Errore parsing API custom: {e}")
 
         # 2. Avvia scraping dall'endpoint standard (paginazione completa)
-        yield scrapy.Request(
-            f"https://www.artribune.com/wp-json/wp/v2/event?per_page={self.per_page}&page=1",
-            callback=self.parse
+        yield scrapy.Request(self._wp_events_url(1), callback=self.parse, errback=self._wp_page_failed)
+
+    def _extract_custom_fields(self, event):
+        """Campi dell'item ricavati da un evento dell'endpoint custom (luogo, date, URL immagini)"""
+        fields = {}
+
+        # Estrai dati strutturati da place
+        place = event.get('place', {})
+        if isinstance(place, dict):
+            fields['location_name'] = place.get('title')
+            place_map = place.get('map', {})
+            if isinstance(place_map, dict):
+                fields['location_address'] = place_map.get('address')
+            place_city = place.get('city', {})
+            if isinstance(place_city, dict):
+                city_title = place_city.get('title', '')
+                fields['city'] = PROVINCE_SUFFIX_RE.sub('', city_title).strip()
+
+        # Estrai date dal campo dates HTML
+        dates_html = event.get('dates') or ''
+        if dates_html and '<time' in dates_html:
+            dt_matches = DATETIME_RE.findall(dates_html)
+            if len(dt_matches) >= 1:
+                fields['date_start'] = dt_matches[0]
+            if len(dt_matches) >= 2:
+                fields['date_end'] = dt_matches[1]
+            elif len(dt_matches) == 1:
+                fields['date_end'] = dt_matches[0]
+
+        # Estrai immagini
+        image_html = event.get('image') or ''
+        fields['image_urls'] = []
+        if image_html and '<img' in image_html:
+            fields['image_urls'] = IMG_SRC_RE.findall(image_html)
+
+        return fields
+
+    def _wp_events_url(self, page):
+        # In modalità incrementale solo gli eventi modificati dopo il mark (e quindi solo i loro dettagli)
+        modified_after = f"&modified_after={self.modified_after}" if self.modified_after else ""
+        return (
+            f"https://www.artribune.com/wp-json/wp/v2/event?per_page={self.per_page}&page={page}"
+            f"&_fields={','.join(self.wp_fields)}{modified_after}"
         )
 
+    def _wp_page_failed(self, failure):
+        self.logger.error(f"Errore pagina API {failure.request.url}: {failure.value!r}")
+        self.incomplete = True
+
+    def _detail_failed(self, failure):
+        # L'evento andrebbe perso fino alla prossima modifica: il mark resta fermo
+        self.logger.warning(f"Errore pagina dettaglio {failure.request.url}: {failure.value!r}")
+        self.crawler.stats.inc_value("detail_page_failed")
+        self.incomplete = True
+
     def parse(self, response):
         """
         Estrae gli eventi dalla risposta JSON delle API WP REST.
         Gestisce la paginazione tramite header X-WP-TotalPages.
         """
         try:
-            events_list = response.json()
+            events_list = decode_json(response, self.crawler.stats, "wp_event")
 
             # Estrai info paginazione dagli header
             total_events = int(response.headers.get('X-WP-Total', b'0').decode())
@@ -98,44 +216,20 @@ class ArtribuneSpider(scrapy.Spider):
                     'id': event_data.get('id'),
                     'slug': event_data.get('slug'),
                     'date_published': event_data.get('date'),
+                    'date_modified': event_data.get('modified'),
                 }
+                modified = event_data.get('modified')
+                if modified and (self.max_modified is None or modified > self.max_modified):
+                    self.max_modified = modified
 
-                # Arricchisci con dati dall'API custom se disponibili
-                custom_data = self.custom_api_data.get(item['url'], {})
+                # Arricchisci con dati dall'API custom se disponibili (ogni URL viene usato una volta)
+                custom_data = self.custom_api_data.pop(item['url'], None) if item['url'] else None
                 if custom_data:
                     item['raw_data']['custom_api'] = custom_data
-
-                    # Estrai dati strutturati da place
-                    place = custom_data.get('place', {})
-                    if isinstance(place, dict):
-                        item['location_name'] = place.get('title')
-                        place_map = place.get('map', {})
-                        if isinstance(place_map, dict):
-                            item['location_address'] = place_map.get('address')
-                        place_city = place.get('city', {})
-                        if isinstance(place_city, dict):
-                            city_title = place_city.get('title', '')
-                            item['city'] = re.sub(r'\s*\([A-Z]{2}\)$', '', city_title).strip()
-
-                    # Estrai date dal campo dates HTML
-                    dates_html = custom_data.get('dates_html', '')
-                    if dates_html and '<time' in dates_html:
-                        dt_matches = re.findall(r'datetime=["\'](\d{4}-\d{2}-\d{2})["\']', dates_html)
-                        if len(dt_matches) >= 1:
-                            item['date_start'] = dt_matches[0]
-                        if len(dt_matches) >= 2:
-                            item['date_end'] = dt_matches[1]
-                        elif len(dt_matches) == 1:
-                            item['date_end'] = dt_matches[0]
-
-                    # Estrai immagini
-                    image_html = custom_data.get('image_html', '')
-                    item['image_urls'] = []
-                    if image_html and '<img' in image_html:
-                        urls = re.findall(r'src=["\'](.*?)["\']', image_html)
-                        item['image_urls'].extend(urls)
-                        if urls:
-                            item['image_url'] = urls[0]
+                    for field, value in custom_data.items():
+                        item[field] = list(value) if field == 'image_urls' else value
+                    if custom_data.get('image_urls'):
+                        item['image_url'] = custom_data['image_urls'][0]
                 else:
                     item['image_urls'] = []
 
@@ -144,6 +238,7 @@ class ArtribuneSpider(scrapy.Spider):
                     yield response.follow(
                         item['url'],
                         callback=self.parse_event_detail,
+                        errback=self._detail_failed,
                         meta={'item': item}
                     )
                 else:
@@ -155,12 +250,16 @@ class ArtribuneSpider(scrapy.Spider):
             max_pages = self.max_pages or total_pages
             if current_page < max_pages:
                 next_page = current_page + 1
-                next_url = f"https://www.artribune.com/wp-json/wp/v2/event?per_page={self.per_page}&page={next_page}"
+                next_url = self._wp_events_url(next_page)
                 self.logger.info(f"Paginazione: richiedo pagina {next_page}")
-                yield scrapy.Request(next_url, callback=self.parse)
+                yield scrapy.Request(next_url, callback=self.parse, errback=self._wp_page_failed)
+            elif max_pages < total_pages:
+                # Pagine escluse da max_pages: il crawl non copre tutti gli eventi
+                self.incomplete = True
 
         except Exception as e:
             self.logger.error(f"Errore parsing API pagina {response.url}: {e}")
+            self.incomplete = True
 
     def parse_event_detail(self, response):
         """
@@ -357,6 +456,16 @@ class ArtribuneSpider(scrapy.Spider):
 
         yield item
 
+    def coverage(self):
+        """
+        Copertura scritta nel manifest: solo un giro completo senza errori vede tutti gli eventi
+        pubblicati (tutte le città, nessun limite di date). Un crawl incrementale contiene solo
+        gli eventi modificati e non copre nulla.
+        """
+        if self.crawl_mode != "full" or self.incomplete:
+            return []
+        return [{"city": None, "date_start": None, "date_end": None}]
+
     def _generate_hashes(self, item):
         """Genera UUID e content_hash per deduplicazione"""
         s_title = item.get('title') or ""
@@ -370,3 +479,23 @@ class ArtribuneSpider(scrapy.Spider):
 
         content_string = f"{c_desc}{c_price}"
         item["content_hash"] = hashlib.sha256(content_string.encode('utf-8')).hexdigest()[:16]
+
+    def closed(self, reason):
+        # Medie per pagina di byte e tempo di decodifica delle risposte API
+        summarize_api_stats(self.crawler.stats)
+        self.custom_api_data.close()
+
+        if self.crawl_state is None:
+            return
+        # Il mark avanza solo dopo un crawl completo: altrimenti il prossimo run riparte dallo stesso punto
+        if reason == "finished" and not self.incomplete:
+            high_water_mark = self.crawl_state.get("high_water_mark")
+            if self.max_modified and (not high_water_mark or self.max_modified > high_water_mark):
+                self.crawl_state.set("high_water_mark", self.max_modified)
+                high_water_mark = self.max_modified
+            if self.crawl_mode == "full":
+                self.crawl_state.set("last_full_sweep", self.started_at)
+            self.crawler.stats.set_value("crawl/high_water_mark", high_water_mark)
+        else:
+            self.logger.warning(f"Crawl non completo ({reason}): high-water mark non aggiornato")
+        self.crawl_state.close()
@@ -8,12 +8,23 @@ from datetime import datetime
 
 # Aggiungi la directory corrente al path per trovare il modulo events
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+# Moduli condivisi (scraping/shared)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.feeds import FEED_FORMATS, COMPRESSIONS, build_feed, crawl_coverage, crawl_item_count, write_manifest
+from shared.stream import stream_incomplete
 
 
 def main():
     parser = argparse.ArgumentParser(description='Artribune Events Scraper')
     parser.add_argument('cities', nargs='*', help='Lista di città da scaricare (opzionale, altrimenti tutte)')
+    parser.add_argument('--format', choices=list(FEED_FORMATS), default='json', help='Formato di output (default: json)')
+    parser.add_argument('--compress', choices=list(COMPRESSIONS), default=None, help='Compressione (solo con --format=jsonl)')
+    parser.add_argument('--mode', choices=['auto', 'incremental', 'full'], default=None,
+                        help='Crawl incrementale o completo (default: CRAWL_MODE delle settings)')
     args = parser.parse_args()
+    if args.compress and args.format != 'jsonl':
+        parser.error('--compress richiede --format=jsonl')
 
     # Setup Scrapy settings
     os.environ.setdefault('SCRAPY_SETTINGS_MODULE', 'artribune_scraper.settings')
@@ -25,15 +36,10 @@ def main():
     os.makedirs(output_dir, exist_ok=True)
     
     city_suffix = f"_{'_'.join(args.cities)}" if args.cities else ""
-    output_file = os.path.join(output_dir, f'eventi_artribune{city_suffix}_{timestamp}.json')
-    
-    settings.set('FEEDS', {
-        output_file: {
-            'format': 'json',
-            'encoding': 'utf8',
-            'indent': 4,
-        }
-    })
+    output_base = os.path.join(output_dir, f'eventi_artribune{city_suffix}_{timestamp}')
+    output_file, feed_options = build_feed(output_base, args.format, args.compress)
+
+    settings.set('FEEDS', {output_file: feed_options})
 
     process = CrawlerProcess(settings)
     
@@ -41,9 +47,26 @@ def main():
     spider_args = {}
     if args.cities:
         spider_args['cities'] = args.cities
-        
-    process.crawl('artribune', **spider_args)
+    if args.mode:
+        spider_args['mode'] = args.mode
+
+    crawler = process.create_crawler('artribune')
+    process.crawl(crawler, **spider_args)
     process.start()
+    crawl_mode = crawler.stats.get_value('crawl/mode')
+
+    # Manifest con numero di item e checksum (scritto solo a crawl terminato)
+    manifest = write_manifest(
+        output_file,
+        source='artribune',
+        item_count=crawl_item_count(crawler),
+        cities=args.cities,
+        format=args.format,
+        compression=args.compress,
+        # Un crawl incrementale contiene solo gli eventi modificati: non va usato per disattivare gli altri
+        crawl_mode=crawl_mode,
+        coverage=crawl_coverage(crawler),
+    )
 
     print(f"\n" + "=" * 40)
     print(f"{ 'REPORT SCRAPING':^40}")
@@ -52,10 +75,18 @@ def main():
         print(f"Città richieste: {', '.join(args.cities)}")
     else:
         print("Scraping completo (tutte le città)")
+    print(f"Modalità: {crawl_mode}")
     print("-" * 40)
     print(f"File output: {output_file}")
+    if manifest:
+        print(f"Manifest: {manifest['item_count']} item, sha256 {manifest['sha256'][:12]}...")
     print("=" * 40 + "\n")
 
+    # Item nello stream Redis senza eof: il loader non li userà, il task va ritentato
+    if stream_incomplete(crawler):
+        print("Stream incompleto (nessun eof): rilanciare il task\n")
+        sys.exit(1)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,383 @@
+#!/usr/bin/env python
+"""
+Server HTTP locale che emula i siti crawlati, per test di carico del crawl completo.
+
+Serve, a partire dai file di benchmarks/corpus/:
+- *today.it: liste /eventi/dal/<data>/al/<data>/[pag/N/] e dettagli /eventi/<slug>.html
+- zero.eu: /api/wp/v2/citta, /api/v2/events (paginata, header X-WP-Total/X-WP-TotalPages),
+  /api/wp/v2/venue/<id>, pagine evento /it/eventi/...
+- artribune.com: /wp-json/a7e/v1/events, /wp-json/wp/v2/event (paginata) e pagine di dettaglio
+
+Gli oggetti delle API hanno i campi standard di WP REST (guid, excerpt, yoast_head, _links, ...)
+e rispettano _fields e _embed come il sito, così la differenza di payload è misurabile.
+wp/v2/event di Artribune filtra anche per modified_after (un evento modificato ogni 10 minuti
+a ritroso dall'avvio del server).
+
+Il sito emulato si sceglie dall'header X-Mock-Host (impostato dal download handler
+shared/mocksite.py) o, in mancanza, dall'header Host. Gli eventi sono generati in modo
+deterministico dai file del corpus con URL, id e titoli univoci; latenza, tasso di errore e
+dimensioni della paginazione sono configurabili.
+
+Utilizzo:
+    python mock_server.py [--port=8900] [--latency=0.05] [--error-rate=0.01] ...
+    python ../run_crawl.py --mock=http://127.0.0.1:8900 --city-today=milano,roma --zero-eu=milano --artribune
+"""
+
+import argparse
+import copy
+import json
+import os
+import random
+import re
+import signal
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS_DIR = os.path.join(BENCH_DIR, "corpus")
+
+MOCK_HOST_HEADER = "X-Mock-Host"
+
+TODAY_LIST_RE = re.compile(r"^/eventi/dal/(\d{4}-\d{2}-\d{2})/al/(\d{4}-\d{2}-\d{2})/(?:pag/(\d+)/)?$")
+TODAY_DETAIL_RE = re.compile(r"^/eventi/[^/]+\.html$")
+CARD_RE = re.compile(r"<article class=\"c-card.*?</article>", re.S)
+PAGINATION_RE = re.compile(r"<nav class=\"c-pagination\">.*?</nav>", re.S)
+EVENT_LINK_RE = re.compile(r"(/eventi/[^\"'&\s]+?)\.html")
+H1_RE = re.compile(r"(<h1[^>]*>)(.*?)(</h1>)", re.S)
+ZERO_VENUE_RE = re.compile(r"^/api/wp/v2/venue/(\d+)/?$")
+
+
+def read_corpus(relative_path):
+    with open(os.path.join(CORPUS_DIR, relative_path), "rb") as f:
+        return f.read()
+
+
+def read_corpus_files(directory, prefix):
+    source_dir = os.path.join(CORPUS_DIR, directory)
+    names = sorted(n for n in os.listdir(source_dir) if n.startswith(prefix) and n.endswith(".html"))
+    return [read_corpus(os.path.join(directory, n)) for n in names]
+
+
+def pick(pages, key):
+    """Pagina del corpus scelta in modo stabile dal path richiesto"""
+    return pages[zlib.crc32(key.encode()) % len(pages)]
+
+
+def wp_object(obj, object_type, base_url):
+    """Aggiunge all'oggetto i campi standard di WP REST che gli spider non leggono"""
+    obj_id = obj.get("id")
+    named = obj.get("title") or obj.get("name")
+    title = (named.get("rendered") or named.get("plain") or "") if isinstance(named, dict) else ""
+    link = obj.get("link") or f"{base_url}/?p={obj_id}"
+    yoast_meta = "".join(
+        f'<meta property="{prop}" content="{title} {link}" />'
+        for prop in ("og:title", "og:description", "og:url", "og:site_name", "twitter:title", "twitter:description")
+    )
+    extras = {
+        "date_gmt": obj.get("date") or "2026-10-01T08:00:00",
+        "guid": {"rendered": f"{base_url}/?post_type={object_type}&p={obj_id}"},
+        "modified": "2026-10-02T10:00:00",
+        "modified_gmt": "2026-10-02T08:00:00",
+        "status": "publish",
+        "type": object_type,
+        "template": "",
+        "meta": {"_acf_changed": False, "footnotes": ""},
+        "excerpt": {"rendered": f"<p>{title}</p>\n", "protected": False},
+        "yoast_head": f'<title>{title}</title><link rel="canonical" href="{link}" />{yoast_meta}' * 4,
+        "yoast_head_json": {"title": title, "canonical": link, "og_locale": "it_IT", "og_type": "article",
+                            "og_title": title, "og_url": link, "schema": {"@context": "https://schema.org"}},
+    }
+    links = {
+        "self": [{"href": f"{base_url}/wp-json/wp/v2/{object_type}/{obj_id}"}],
+        "collection": [{"href": f"{base_url}/wp-json/wp/v2/{object_type}"}],
+        "about": [{"href": f"{base_url}/wp-json/wp/v2/types/{object_type}"}],
+        "wp:attachment": [{"href": f"{base_url}/wp-json/wp/v2/media?parent={obj_id}"}],
+    }
+    links.update(obj.get("_links", {}))
+    return {**extras, **obj, "_links": links}
+
+
+def select_fields(obj, query):
+    """_fields di WP REST (campi di primo livello; _links solo se richiesto, come il sito)"""
+    if "_fields" not in query:
+        return obj
+    fields = {field.split(".")[0] for value in query["_fields"] for field in value.split(",") if field}
+    return {key: value for key, value in obj.items() if key in fields}
+
+
+class MockSites:
+    """Contenuti emulati (generati dal corpus) e routing per host"""
+
+    def __init__(self, args):
+        self.args = args
+
+        list_html = read_corpus("city_today/list_milano.html").decode("utf-8")
+        cards = CARD_RE.findall(list_html)
+        if not cards:
+            raise ValueError("Nessuna card article.c-card nella lista del corpus")
+        start = list_html.index(cards[0])
+        end = list_html.rindex(cards[-1]) + len(cards[-1])
+        self.today_list_head = PAGINATION_RE.sub("", list_html[:start])
+        self.today_list_tail = PAGINATION_RE.sub("{pagination}", list_html[end:])
+        if "{pagination}" not in self.today_list_tail:
+            self.today_list_tail = self.today_list_tail.replace("</main>", "{pagination}</main>", 1)
+        self.today_cards = cards
+        self.today_details = [page.decode("utf-8") for page in read_corpus_files("city_today", "detail_")]
+
+        self.zero_citta = read_corpus("zero_eu/citta.json")
+        self.zero_events = json.loads(read_corpus("zero_eu/events_milano.json"))
+        # Luoghi per id (il primo evento del corpus che li incorpora), serviti da /api/wp/v2/venue/<id>
+        self.zero_venues = {}
+        for event in self.zero_events:
+            for venue in event.get("_embedded", {}).get("venue", []):
+                self.zero_venues.setdefault(venue["id"], wp_object(venue, "venue", "https://zero.eu"))
+        self.zero_pages = read_corpus_files("zero_eu", "event_page_")
+
+        a7e = json.loads(read_corpus("artribune/a7e_events.json"))
+        self.artribune_custom = a7e.get("events", []) if isinstance(a7e, dict) else a7e
+        self.artribune_events = json.loads(read_corpus("artribune/wp_event_page_1.json"))
+        self.artribune_details = read_corpus_files("artribune", "detail_")
+        self.started = datetime.now().replace(microsecond=0)
+
+    # Routing
+
+    def route(self, host, path, query):
+        """Ritorna (route, status, content_type, body, header extra)"""
+        host = host.split(":")[0].lower()
+        if path == "/robots.txt":
+            return "robots", 200, "text/plain", b"User-agent: *\nDisallow:\n", {}
+        if host.endswith("today.it"):
+            return self.route_today(host, path)
+        if host.endswith("zero.eu"):
+            return self.route_zero(path, query)
+        if host.endswith("artribune.com"):
+            return self.route_artribune(path, query)
+        return "unknown", 404, "text/plain", b"host non emulato", {}
+
+    def route_today(self, host, path):
+        match = TODAY_LIST_RE.match(path)
+        if match:
+            date_start, date_end, page = match.group(1), match.group(2), int(match.group(3) or 1)
+            if page > self.args.today_pages:
+                return "today/list", 404, "text/html", b"<html><body>Pagina non trovata</body></html>", {}
+            return "today/list", 200, "text/html", self.today_list(host, date_start, date_end, page), {}
+        if TODAY_DETAIL_RE.match(path):
+            return "today/detail", 200, "text/html", self.today_detail(path), {}
+        return "today/other", 404, "text/html", b"<html><body>Pagina non trovata</body></html>", {}
+
+    def route_zero(self, path, query):
+        if path.startswith("/api/wp/v2/citta"):
+            return "zero/citta", 200, "application/json", self.zero_citta, {}
+        if path.startswith("/api/v2/events"):
+            return self.paginated(
+                "zero/events", query, range(self.args.zero_events), self.args.zero_page_size,
+                lambda i: self.zero_event(i, query.get("citta", ["0"])[0], "_embed" in query), query,
+            )
+        venue_match = ZERO_VENUE_RE.match(path)
+        if venue_match:
+            venue = self.zero_venues.get(int(venue_match.group(1)))
+            if venue is None:
+                return "zero/venue", 404, "application/json", b'{"code": "rest_post_invalid_id"}', {}
+            body = json.dumps(select_fields(venue, query), ensure_ascii=False).encode()
+            return "zero/venue", 200, "application/json", body, {}
+        if path.startswith("/it/eventi/") or path.startswith("/en/eventi/"):
+            return "zero/page", 200, "text/html", pick(self.zero_pages, path), {}
+        return "zero/other", 404, "text/html", b"<html><body>Pagina non trovata</body></html>", {}
+
+    def route_artribune(self, path, query):
+        if path.startswith("/wp-json/a7e/v1/events"):
+            events = [self.artribune_custom_event(i) for i in range(self.args.artribune_events)]
+            return "artribune/a7e", 200, "application/json", json.dumps({"events": events}).encode(), {}
+        if path.startswith("/wp-json/wp/v2/event"):
+            indices = range(self.args.artribune_events)
+            if "modified_after" in query:
+                modified_after = query["modified_after"][0]
+                indices = [i for i in indices if self.artribune_modified(i) > modified_after]
+            return self.paginated(
+                "artribune/wp", query, indices, self.args.artribune_page_size,
+                self.artribune_event, query,
+            )
+        if path.startswith("/wp-json/"):
+            return "artribune/other", 404, "application/json", b'{"code": "rest_no_route"}', {}
+        return "artribune/detail", 200, "text/html", pick(self.artribune_details, path), {}
+
+    def paginated(self, route, query, indices, max_page_size, build, fields_query):
+        """Pagina di una collection WP REST (per_page limitato come sul sito, 400 oltre l'ultima pagina)"""
+        total = len(indices)
+        per_page = min(int(query.get("per_page", ["10"])[0]), max_page_size)
+        page = int(query.get("page", ["1"])[0])
+        total_pages = max(1, -(-total // per_page))
+        headers = {"X-WP-Total": str(total), "X-WP-TotalPages": str(total_pages)}
+        if page > total_pages:
+            body = b'{"code": "rest_post_invalid_page_number", "data": {"status": 400}}'
+            return route, 400, "application/json", body, headers
+        first = (page - 1) * per_page
+        events = [select_fields(build(indices[n]), fields_query) for n in range(first, min(first + per_page, total))]
+        return route, 200, "application/json", json.dumps(events, ensure_ascii=False).encode(), headers
+
+    # Contenuti
+
+    def today_list(self, host, date_start, date_end, page):
+        city = host.split(".")[-2].replace("today", "") if host.count(".") >= 2 else host
+        base = f"/eventi/dal/{date_start}/al/{date_end}/"
+        cards = []
+        for n in range(self.args.today_cards):
+            card = self.today_cards[n % len(self.today_cards)]
+            token = f"{city}-{date_start}-{page}-{n}"
+            cards.append(EVENT_LINK_RE.sub(lambda m: f"{m.group(1)}-{token}.html", card))
+        links = "".join(f'<a class="c-pagination__link" href="{base}pag/{p}/">{p}</a>'
+                        for p in range(2, self.args.today_pages + 1))
+        pagination = f'<nav class="c-pagination">{links}</nav>'
+        return (self.today_list_head + "".join(cards) + self.today_list_tail.replace("{pagination}", pagination)).encode()
+
+    def today_detail(self, path):
+        slug = path.rsplit("/", 1)[-1][:-len(".html")]
+        page = pick(self.today_details, path)
+        # Titolo univoco per evento (uuid distinti a valle)
+        return H1_RE.sub(lambda m: f"{m.group(1)}{m.group(2)} {slug[-24:]}{m.group(3)}", page, count=1).encode()
+
+    def zero_event(self, i, citta, embed):
+        event = copy.deepcopy(self.zero_events[i % len(self.zero_events)])
+        venues = event.pop("_embedded", {}).get("venue", [])
+        event_id = int(citta or 0) * 1_000_000 + i
+        event["id"] = event_id
+        event["slug"] = f"{event.get('slug') or 'evento'}-{event_id}"
+        event["link"] = f"https://zero.eu/it/eventi/{event['slug']}/"
+        if isinstance(event.get("name"), dict):
+            event["name"]["plain"] = f"{event['name'].get('plain') or ''} #{event_id}"
+        if venues:
+            venue_id = venues[0]["id"]
+            event["_links"] = {"venue": [{"embeddable": True, "href": f"https://zero.eu/api/wp/v2/venue/{venue_id}"}]}
+        event = wp_object(event, "event", "https://zero.eu")
+        if embed and venues:
+            event["_embedded"] = {"venue": [self.zero_venues[venues[0]["id"]]]}
+        return event
+
+    def artribune_url(self, i):
+        return f"https://www.artribune.com/mostre-evento-arte/evento-{i}/"
+
+    def artribune_custom_event(self, i):
+        event = copy.deepcopy(self.artribune_custom[i % len(self.artribune_custom)])
+        event["url"] = self.artribune_url(i)
+        return event
+
+    def artribune_modified(self, i):
+        """Ultima modifica dell'evento i (ora locale del sito): uno ogni 10 minuti a ritroso dall'avvio"""
+        modified = self.started - timedelta(minutes=10 * i)
+        return modified.strftime("%Y-%m-%dT%H:%M:%S")
+
+    def artribune_event(self, i):
+        event = copy.deepcopy(self.artribune_events[i % len(self.artribune_events)])
+        event["id"] = 1_000_000 + i
+        event["slug"] = f"evento-{i}"
+        event["link"] = self.artribune_url(i)
+        event["modified"] = self.artribune_modified(i)
+        if isinstance(event.get("title"), dict):
+            event["title"]["rendered"] = f"{event['title'].get('rendered') or ''} #{i}"
+        return wp_object(event, "event", "https://www.artribune.com")
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockSites/1.0"
+
+    def do_GET(self):
+        args = self.server.args
+        parts = urlsplit(self.path)
+        host = self.headers.get(MOCK_HOST_HEADER) or self.headers.get("Host", "")
+        route, status, content_type, body, headers = self.server.sites.route(
+            host, parts.path, parse_qs(parts.query)
+        )
+
+        if args.latency:
+            time.sleep(max(0.0, random.uniform(1 - args.jitter, 1 + args.jitter) * args.latency))
+        if route != "robots" and status == 200 and random.random() < args.error_rate:
+            route, status, content_type, body, headers = route, args.error_status, "text/html", b"Errore emulato", {}
+
+        self.server.count(route, status, len(body))
+        self.send_response(status)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.args.verbose:
+            super().log_message(format, *args)
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, args):
+        super().__init__((args.host, args.port), MockHandler)
+        self.args = args
+        self.sites = MockSites(args)
+        self.requests = Counter()
+        self.bytes = Counter()
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+
+    def count(self, route, status, size):
+        with self.lock:
+            self.requests[(route, status)] += 1
+            self.bytes[(route, status)] += size
+
+    def report(self):
+        elapsed = time.monotonic() - self.started
+        total = sum(self.requests.values())
+        print("\n" + "=" * 64)
+        print(f"{'Route':<22} | {'Status':>6} | {'Richieste':>10} | {'Byte':>14}")
+        print("-" * 64)
+        for (route, status), count in sorted(self.requests.items()):
+            print(f"{route:<22} | {status:>6} | {count:>10} | {self.bytes[(route, status)]:>14,}")
+        print("-" * 64)
+        print(f"{'TOTALE':<22} | {'':>6} | {total:>10} | {sum(self.bytes.values()):>14,}"
+              f"  ({total / elapsed if elapsed else 0:.1f} rich/s)")
+        print("=" * 64 + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server locale che emula i siti crawlati")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.05, help="Latenza media per risposta (secondi)")
+    parser.add_argument("--jitter", type=float, default=0.5, help="Variazione della latenza (frazione, 0-1)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Frazione di risposte in errore (0-1)")
+    parser.add_argument("--error-status", type=int, default=503, help="Status HTTP delle risposte in errore")
+    parser.add_argument("--today-pages", type=int, default=5, help="Pagine per lista *today.it")
+    parser.add_argument("--today-cards", type=int, default=20, help="Card per pagina *today.it")
+    parser.add_argument("--zero-events", type=int, default=300, help="Eventi zero.eu per città")
+    parser.add_argument("--zero-page-size", type=int, default=100, help="per_page massimo dell'API zero.eu")
+    parser.add_argument("--artribune-events", type=int, default=300, help="Eventi Artribune")
+    parser.add_argument("--artribune-page-size", type=int, default=100, help="per_page massimo dell'API Artribune")
+    parser.add_argument("--seed", type=int, default=None, help="Seed per latenza ed errori (run ripetibili)")
+    parser.add_argument("--verbose", action="store_true", help="Log di ogni richiesta")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    # Report anche quando il server è avviato in background (SIGINT ignorato) o fermato con SIGTERM
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    server = MockServer(args)
+    print(f"Server di test su http://{args.host}:{args.port} "
+          f"(latenza {args.latency}s ±{args.jitter:.0%}, errori {args.error_rate:.1%} -> {args.error_status})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.report()
+
+
+if __name__ == "__main__":
+    main()
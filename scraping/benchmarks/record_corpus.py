@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+"""
+Registra il corpus del benchmark dai siti reali (sovrascrive i file in corpus/).
+
+Scarica una pagina lista di MilanoToday (prossimi 30 giorni) e i primi dettagli, la lista
+città e una pagina eventi dell'API zero.eu con le prime pagine evento, l'endpoint a7e/v1 e
+una pagina wp/v2/event di Artribune con i primi dettagli. Gli header di paginazione
+(X-WP-Total, X-WP-TotalPages) vengono salvati in corpus/index.json.
+
+Dopo la registrazione rigenerare la baseline: python run_benchmark.py --save-baseline
+
+Utilizzo:
+    python record_corpus.py [--details=N]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+import requests
+from parsel import Selector
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS_DIR = os.path.join(BENCH_DIR, "corpus")
+INDEX_FILE = os.path.join(CORPUS_DIR, "index.json")
+
+USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+PAGINATION_HEADERS = ("X-WP-Total", "X-WP-TotalPages")
+REQUEST_DELAY = 1.0
+
+
+def fetch(session, url, **kwargs):
+    time.sleep(REQUEST_DELAY)
+    response = session.get(url, timeout=30, **kwargs)
+    response.raise_for_status()
+    print(f"  {response.status_code} {len(response.content):>8} byte  {url}")
+    return response
+
+
+def save(relative_path, content):
+    path = os.path.join(CORPUS_DIR, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(content)
+
+
+def save_details(session, source, urls, limit, **kwargs):
+    """Salva i primi `limit` dettagli come <source>/<prefisso>_N.html (rimuove i vecchi)"""
+    prefix = "event_page" if source == "zero_eu" else "detail"
+    source_dir = os.path.join(CORPUS_DIR, source)
+    for name in os.listdir(source_dir):
+        if name.startswith(prefix + "_") and name.endswith(".html"):
+            os.remove(os.path.join(source_dir, name))
+    for n, url in enumerate(urls[:limit], start=1):
+        save(f"{source}/{prefix}_{n}.html", fetch(session, url, **kwargs).content)
+
+
+def case(index, source, callback):
+    return next(c for c in index[source] if c["callback"] == callback)
+
+
+def record_pagination_headers(index_case, response):
+    headers = {name: response.headers[name] for name in PAGINATION_HEADERS if name in response.headers}
+    if headers:
+        index_case["headers"] = headers
+
+
+def record_city_today(session, index, details):
+    print("city_today")
+    start = date.today()
+    url = f"https://www.milanotoday.it/eventi/dal/{start}/al/{start + timedelta(days=30)}/"
+    response = fetch(session, url)
+    save("city_today/list_milano.html", response.content)
+
+    links = []
+    for href in Selector(text=response.text).css("article.c-card a::attr(href)").getall():
+        full_url = requests.compat.urljoin(url, href)
+        if ".html" in href and "/eventi/" in href and full_url not in links:
+            links.append(full_url)
+    save_details(session, "city_today", links, details)
+
+
+def record_zero_eu(session, index, details):
+    print("zero_eu")
+    save("zero_eu/citta.json", fetch(session, case(index, "zero_eu", "parse_cities")["url"]).content)
+
+    events_case = case(index, "zero_eu", "parse_events")
+    response = fetch(session, events_case["url"])
+    save("zero_eu/events_milano.json", response.content)
+    record_pagination_headers(events_case, response)
+
+    links = [event["link"] for event in response.json() if event.get("link")]
+    save_details(session, "zero_eu", links, details, headers={"Accept-Language": "it-IT,it;q=0.9"})
+
+
+def record_artribune(session, index, details):
+    print("artribune")
+    save("artribune/a7e_events.json", fetch(session, case(index, "artribune", "parse_custom_api")["url"]).content)
+
+    page_case = case(index, "artribune", "parse")
+    response = fetch(session, page_case["url"])
+    save("artribune/wp_event_page_1.json", response.content)
+    record_pagination_headers(page_case, response)
+
+    links = [event["link"] for event in response.json() if event.get("link")]
+    save_details(session, "artribune", links, details)
+
+
+RECORDERS = {
+    "city_today": record_city_today,
+    "zero_eu": record_zero_eu,
+    "artribune": record_artribune,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Registra il corpus del benchmark dai siti reali")
+    parser.add_argument("sources", nargs="*", metavar="sorgente",
+                        help=f"Sorgenti da registrare ({', '.join(RECORDERS)}; default tutte)")
+    parser.add_argument("--details", type=int, default=5, help="Pagine di dettaglio per sorgente")
+    args = parser.parse_args()
+    invalid = [source for source in args.sources if source not in RECORDERS]
+    if invalid:
+        parser.error(f"sorgenti non valide: {', '.join(invalid)}")
+
+    with open(INDEX_FILE, "r", encoding="utf-8") as f:
+        index = json.load(f)
+
+    session = requests.Session()
+    session.headers["User-Agent"] = USER_AGENT
+    try:
+        for source in args.sources or list(RECORDERS):
+            RECORDERS[source](session, index, args.details)
+    except requests.RequestException as e:
+        print(f"\nErrore durante la registrazione: {e}")
+        sys.exit(1)
+    finally:
+        with open(INDEX_FILE, "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+
+    print("\nCorpus aggiornato. Rigenerare la baseline con: python run_benchmark.py --save-baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+"""
+Benchmark offline delle callback degli spider.
+
+Le risposte registrate in corpus/ (vedi corpus/index.json) vengono passate direttamente alle
+callback degli spider (city_today: parse, parse_event_detail; zero_eu: parse_cities,
+parse_events, _parse_single_event, parse_event_page; artribune: parse_custom_api, parse,
+parse_event_detail) con un crawler finto: nessuna rete, nessun reactor, nessuno scheduler.
+Si misura solo il costo di parsing ed estrazione.
+
+Per ogni callback: ms per chiamata (mediana), item e richieste prodotte, item/s; per sorgente
+il picco di RSS del processo. Con --save-baseline i risultati vengono scritti in baseline.json;
+i run successivi mostrano la variazione rispetto alla baseline, e con --max-regression=PCT
+il comando esce con codice 1 se una callback è più lenta di oltre PCT%. --note salva nella
+baseline il motivo per cui è stata registrata di nuovo (mostrato nei confronti successivi).
+
+Utilizzo:
+    python run_benchmark.py [sorgente ...] [--iterations=N] [-s SETTING=VALORE ...]
+                            [--baseline=FILE] [--save-baseline [--note=TESTO]] [--max-regression=PCT]
+"""
+
+import argparse
+import copy
+import glob
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import time
+from datetime import datetime
+from importlib import import_module
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRAPING_DIR = os.path.dirname(BENCH_DIR)
+CORPUS_DIR = os.path.join(BENCH_DIR, "corpus")
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+
+# Progetti Scrapy (pacchetti distinti, importabili insieme) e moduli condivisi
+sys.path.insert(0, SCRAPING_DIR)
+for project in ("city_today", "zero_eu", "artribune"):
+    sys.path.insert(0, os.path.join(SCRAPING_DIR, project))
+
+import scrapy
+from scrapy.crawler import Crawler
+from scrapy.http import HtmlResponse, Request, TextResponse
+from scrapy.settings import Settings
+from scrapy.statscollectors import MemoryStatsCollector
+
+SOURCES = {
+    "city_today": {
+        "settings": "events.settings",
+        "spider": "events.spiders.events_spider.EventsSpider",
+        "item": "events.items.EventItem",
+        "kwargs": {"cities": ["milano"]},
+    },
+    "zero_eu": {
+        "settings": "zero_scraper.settings",
+        "spider": "zero_scraper.spiders.events_spider.EventsSpider",
+        "item": "zero_scraper.items.EventItem",
+        "kwargs": {"city": "milano"},
+    },
+    "artribune": {
+        "settings": "artribune_scraper.settings",
+        "spider": "artribune_scraper.spiders.artribune_spider.ArtribuneSpider",
+        "item": "artribune_scraper.items.EventItem",
+        "kwargs": {},
+    },
+}
+
+# Settings che toccano disco o stato persistente: disattivati nel benchmark
+BENCHMARK_SETTINGS = {
+    "CARD_INDEX_ENABLED": False,
+    "CITY_MAP_ENABLED": False,
+    "VENUE_CACHE_ENABLED": False,
+    "INCREMENTAL_ENABLED": False,
+    "HTTPCACHE_ENABLED": False,
+    "LOG_ENABLED": False,
+}
+
+
+STATS_METHODS = ("get_value", "get_stats", "set_value", "inc_value", "max_value", "min_value")
+
+
+def load_object(path):
+    module, name = path.rsplit(".", 1)
+    return getattr(import_module(module), name)
+
+
+def build_spider(source, overrides):
+    """Spider collegato a un crawler finto (settings del progetto, stats in memoria)"""
+    config = SOURCES[source]
+    spidercls = load_object(config["spider"])
+    settings = Settings()
+    settings.setmodule(config["settings"], priority="project")
+    settings.update(BENCHMARK_SETTINGS, priority="cmdline")
+    settings.update(overrides, priority="cmdline")
+    crawler = Crawler(spidercls, settings)
+    crawler.stats = MemoryStatsCollector(crawler)
+    # Scrapy avvolge i metodi delle stats al primo accesso (inspect.signature, una volta per
+    # collector): fatto qui, altrimenti il costo finisce nella prima callback misurata
+    for name in STATS_METHODS:
+        getattr(crawler.stats, name)
+    return spidercls.from_crawler(crawler, **config["kwargs"])
+
+
+def expand_case(case):
+    """Un caso dell'indice con file glob diventa un caso per file ({name} = nome del file)"""
+    files = sorted(glob.glob(os.path.join(CORPUS_DIR, case["file"])))
+    if not files:
+        raise FileNotFoundError(f"Nessun file del corpus per {case['file']}")
+    for path in files:
+        name = os.path.splitext(os.path.basename(path))[0]
+        expanded = json.loads(json.dumps(case).replace("{name}", name))
+        expanded["path"] = path
+        with open(path, "rb") as f:
+            expanded["body"] = f.read()
+        yield expanded
+
+
+def build_response(case, item_cls):
+    meta = copy.deepcopy(case.get("meta", {}))
+    if isinstance(meta.get("item"), dict):
+        meta["item"] = item_cls(meta["item"])
+    request = Request(case["url"], meta=meta)
+    response_cls = HtmlResponse if case["path"].endswith(".html") else TextResponse
+    return response_cls(
+        url=case["url"],
+        body=case["body"],
+        encoding="utf-8",
+        headers=case.get("headers", {}),
+        request=request,
+    )
+
+
+def run_callback(source, case, item_cls, overrides, setup_cases=()):
+    """
+    Esegue la callback una volta su uno spider nuovo (nessuno stato tra le chiamate: deduplica
+    degli URL, pagine già schedulate); ritorna (secondi, item, richieste). Le callback di
+    setup_cases girano prima sullo stesso spider, fuori dal tempo misurato
+    """
+    spider = build_spider(source, overrides)
+    for setup_case in setup_cases:
+        list(getattr(spider, setup_case["callback"])(build_response(setup_case, item_cls)) or [])
+    callback = getattr(spider, case["callback"])
+    if case["callback"] == "_parse_single_event":
+        # Riceve i singoli eventi dell'API, non una risposta
+        events = json.loads(case["body"])
+        start = time.perf_counter()
+        results = [result for event in events for result in callback(event)]
+    else:
+        response = build_response(case, item_cls)
+        start = time.perf_counter()
+        results = list(callback(response) or [])
+    elapsed = time.perf_counter() - start
+    requests = sum(1 for result in results if isinstance(result, scrapy.Request))
+    return elapsed, len(results) - requests, requests
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss è in KB su Linux, in byte su macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def benchmark_source(source, cases, iterations, overrides):
+    item_cls = load_object(SOURCES[source]["item"])
+    results = {}
+
+    # "setup" nell'indice: callback da eseguire prima sullo stesso spider (es. parse_custom_api di
+    # artribune, che riempie i dati usati da parse)
+    by_callback = {case["callback"]: case for case in cases}
+    for case in cases:
+        key = f"{source}/{case['callback']}"
+        timings, items, requests = [], 0, 0
+        setup_cases = [expanded for name in case.get("setup", []) for expanded in expand_case(by_callback[name])]
+        for expanded in expand_case(case):
+            run_callback(source, expanded, item_cls, overrides, setup_cases)  # warm-up
+            for _ in range(iterations):
+                elapsed, n_items, n_requests = run_callback(source, expanded, item_cls, overrides, setup_cases)
+                timings.append(elapsed)
+                items += n_items
+                requests += n_requests
+        total = sum(timings)
+        results[key] = {
+            "calls": len(timings),
+            "ms_per_call": round(statistics.median(timings) * 1000, 4),
+            "items_per_call": round(items / len(timings), 2),
+            "requests_per_call": round(requests / len(timings), 2),
+            "items_per_sec": round(items / total, 1) if total else 0,
+            "results_per_sec": round((items + requests) / total, 1) if total else 0,
+        }
+    return results, round(peak_rss_mb(), 1)
+
+
+def parse_overrides(values):
+    overrides = {}
+    for value in values:
+        if "=" not in value:
+            raise SystemExit(f"Errore: setting non valido '{value}' (atteso SETTING=VALORE)")
+        key, val = value.split("=", 1)
+        overrides[key] = val
+    return overrides
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def delta_pct(current, reference):
+    if not reference:
+        return None
+    return (current - reference) / reference * 100
+
+
+def print_report(report, baseline):
+    base_callbacks = baseline.get("callbacks", {}) if baseline else {}
+    print("\n" + "=" * 108)
+    if baseline:
+        note = f": {baseline['note']}" if baseline.get("note") else ""
+        print(f"Baseline del {baseline.get('created_at', '?')}{note}")
+    print(
+        f"{'Callback':<34} | {'ms/chiamata':>11} | {'item/chiam.':>11} | {'rich/chiam.':>11} | "
+        f"{'item/s':>9} | {'risult./s':>9} | {'vs base':>7}"
+    )
+    print("-" * 108)
+    for key, result in report["callbacks"].items():
+        delta = delta_pct(result["ms_per_call"], base_callbacks.get(key, {}).get("ms_per_call"))
+        delta_str = f"{delta:+6.1f}%" if delta is not None else "      -"
+        print(
+            f"{key:<34} | {result['ms_per_call']:>11.3f} | {result['items_per_call']:>11} | "
+            f"{result['requests_per_call']:>11} | {result['items_per_sec']:>9} | "
+            f"{result['results_per_sec']:>9} | {delta_str:>7}"
+        )
+    print("-" * 108)
+    for source, rss in report["peak_rss_mb"].items():
+        base_rss = (baseline or {}).get("peak_rss_mb", {}).get(source)
+        delta = delta_pct(rss, base_rss)
+        delta_str = f" ({delta:+.1f}% vs base)" if delta is not None else ""
+        print(f"Picco RSS dopo {source:<12}: {rss:8.1f} MB{delta_str}")
+    print("=" * 108 + "\n")
+
+
+def regressions(report, baseline, max_regression):
+    base_callbacks = baseline.get("callbacks", {})
+    slower = []
+    for key, result in report["callbacks"].items():
+        delta = delta_pct(result["ms_per_call"], base_callbacks.get(key, {}).get("ms_per_call"))
+        if delta is not None and delta > max_regression:
+            slower.append((key, delta))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline delle callback degli spider")
+    parser.add_argument("sources", nargs="*", metavar="sorgente",
+                        help=f"Sorgenti da misurare ({', '.join(SOURCES)}; default tutte)")
+    parser.add_argument("--iterations", type=int, default=20, help="Esecuzioni per risposta del corpus")
+    parser.add_argument("-s", "--set", dest="overrides", action="append", default=[], metavar="SETTING=VALORE",
+                        help="Sovrascrive un setting degli spider (es. -s EXTRACTION_BACKEND=xpath)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="File della baseline")
+    parser.add_argument("--save-baseline", action="store_true", help="Salva i risultati come nuova baseline")
+    parser.add_argument("--note", default=None, help="Motivo della nuova baseline (con --save-baseline)")
+    parser.add_argument("--max-regression", type=float, default=None, metavar="PCT",
+                        help="Esce con codice 1 se una callback è più lenta della baseline di oltre PCT%%")
+    args = parser.parse_args()
+    invalid = [source for source in args.sources if source not in SOURCES]
+    if invalid:
+        parser.error(f"sorgenti non valide: {', '.join(invalid)}")
+
+    with open(os.path.join(CORPUS_DIR, "index.json"), "r", encoding="utf-8") as f:
+        index = json.load(f)
+
+    overrides = parse_overrides(args.overrides)
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "scrapy": scrapy.__version__,
+        "iterations": args.iterations,
+        "overrides": overrides,
+        "note": args.note,
+        "callbacks": {},
+        "peak_rss_mb": {},
+    }
+    for source in args.sources or list(SOURCES):
+        results, rss = benchmark_source(source, index[source], args.iterations, overrides)
+        report["callbacks"].update(results)
+        report["peak_rss_mb"][source] = rss
+
+    baseline = None if args.save_baseline else load_baseline(args.baseline)
+    print_report(report, baseline)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        print(f"Baseline salvata in {args.baseline}")
+    elif args.max_regression is not None and baseline:
+        slower = regressions(report, baseline, args.max_regression)
+        for key, delta in slower:
+            print(f"REGRESSIONE {key}: {delta:+.1f}% (limite {args.max_regression}%)")
+        sys.exit(1 if slower else 0)
+
+
+if __name__ == "__main__":
+    main()
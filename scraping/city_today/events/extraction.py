@@ -0,0 +1,113 @@
+"""
+Backend di estrazione per le pagine di dettaglio *Today.it.
+
+Un backend individua le sezioni etichettate della griglia info (Dove, Quando, Prezzo,
+Altre informazioni) e le restituisce come SelectorList; la lettura dei campi dalle sezioni
+resta nello spider ed è la stessa per tutti i backend.
+
+- xpath: una query `contains(text(), ...)` sulla griglia per ogni etichetta, più una query
+  sull'intero documento come fallback (comportamento storico)
+- lxml: una sola visita dell'albero lxml già costruito da parsel, che indicizza griglie e
+  sezioni etichettate; nessun nuovo parsing del documento
+
+Il backend si sceglie con il setting EXTRACTION_BACKEND; tests/test_extraction_backends.py
+confronta gli item prodotti dai due backend sul corpus dei benchmark.
+"""
+
+from scrapy import Selector
+from scrapy.selector import SelectorList
+
+INFO_LABELS = ("Dove", "Quando", "Prezzo", "Altre informazioni")
+
+
+class XPathBackend:
+    name = "xpath"
+
+    def info_sections(self, response):
+        """Sezioni etichettate della griglia info: {etichetta: SelectorList}"""
+        info_grid = response.css("div.l-grid.l-grid--square")
+        if not info_grid:
+            info_grid = response.css("section.l-entry__body")
+
+        sections = {}
+        for label in INFO_LABELS:
+            section = info_grid.xpath(f'.//span[contains(text(), "{label}")]/parent::div')
+            if not section:
+                section = response.xpath(
+                    f'//span[contains(text(), "{label}")]/parent::div[contains(@class, "l-grid__item")]'
+                )
+            sections[label] = section
+        return sections
+
+
+class LxmlIndexBackend:
+    name = "lxml"
+
+    def info_sections(self, response):
+        """Come XPathBackend.info_sections, con una sola visita del documento"""
+        root = response.selector.root
+        order = {}
+        square_grids = []
+        body_sections = []
+        labelled = []  # (etichette, span, div padre)
+
+        for position, el in enumerate(root.iter()):
+            tag = el.tag
+            if not isinstance(tag, str):
+                continue  # commenti, processing instruction
+            order[el] = position
+            if tag == "div":
+                classes = el.get("class", "").split()
+                if "l-grid" in classes and "l-grid--square" in classes:
+                    square_grids.append(el)
+            elif tag == "section":
+                if "l-entry__body" in el.get("class", "").split():
+                    body_sections.append(el)
+            elif tag == "span":
+                text = _first_text_node(el)
+                if not text:
+                    continue
+                labels = [label for label in INFO_LABELS if label in text]
+                parent = el.getparent()
+                if labels and parent is not None and parent.tag == "div":
+                    labelled.append((labels, el, parent))
+
+        grids = square_grids or body_sections
+        sections = {}
+        for label in INFO_LABELS:
+            matches = [(span, parent) for labels, span, parent in labelled if label in labels]
+            found = []
+            for grid in grids:
+                parents = {parent for span, parent in matches if _is_descendant(span, grid)}
+                found.extend(sorted(parents, key=order.__getitem__))
+            if not found:
+                parents = {parent for _, parent in matches if "l-grid__item" in parent.get("class", "")}
+                found = sorted(parents, key=order.__getitem__)
+            sections[label] = SelectorList([Selector(root=el, type="html") for el in found])
+        return sections
+
+
+def _first_text_node(el):
+    """Primo nodo di testo figlio dell'elemento (come text() in contains(text(), ...))"""
+    if el.text is not None:
+        return el.text
+    for child in el:
+        if child.tail is not None:
+            return child.tail
+    return None
+
+
+def _is_descendant(el, ancestor):
+    return any(a is ancestor for a in el.iterancestors())
+
+
+BACKENDS = {
+    XPathBackend.name: XPathBackend,
+    LxmlIndexBackend.name: LxmlIndexBackend,
+}
+
+
+def get_backend(name):
+    if name not in BACKENDS:
+        raise ValueError(f"Backend di estrazione '{name}' non supportato. Disponibili: {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
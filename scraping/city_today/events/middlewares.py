@@ -3,7 +3,10 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import time
+
 from scrapy import signals
+from scrapy.utils.httpobj import urlparse_cached
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
@@ -98,3 +101,79 @@ class MilanoEventsDownloaderMiddleware:
 
     def spider_opened(self, spider):
         spider.logger.info("Spider opened: %s" % spider.name)
+
+
+class DomainStatsMiddleware:
+    """
+    Statistiche per dominio: risposte, byte, latenza media/massima, throughput e
+    ritardo finale dello slot di download. A fine crawl vengono esportate nelle stats
+    del crawler con chiavi per_domain/<dominio>/<metrica> e riassunte nel log.
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.domains = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = cls(crawler)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def _domain(self, request):
+        domain = urlparse_cached(request).hostname or ""
+        if domain not in self.domains:
+            self.domains[domain] = {
+                "requests": 0,
+                "responses": 0,
+                "bytes": 0,
+                "latency_total": 0.0,
+                "latency_count": 0,
+                "latency_max": 0.0,
+                "first_request": time.monotonic(),
+                "last_response": None,
+            }
+        return self.domains[domain]
+
+    def process_request(self, request, spider=None):
+        self._domain(request)["requests"] += 1
+        return None
+
+    def process_response(self, request, response, spider=None):
+        d = self._domain(request)
+        d["responses"] += 1
+        d["bytes"] += len(response.body)
+        d["last_response"] = time.monotonic()
+
+        # download_latency manca per le risposte non scaricate (es. cache)
+        latency = request.meta.get("download_latency")
+        if latency is not None:
+            d["latency_total"] += latency
+            d["latency_count"] += 1
+            d["latency_max"] = max(d["latency_max"], latency)
+        return response
+
+    def spider_closed(self, spider):
+        stats = self.crawler.stats
+        slots = self.crawler.engine.downloader.slots if self.crawler.engine else {}
+
+        for domain, d in sorted(self.domains.items()):
+            elapsed = (d["last_response"] or d["first_request"]) - d["first_request"]
+            latency_avg = d["latency_total"] / d["latency_count"] if d["latency_count"] else 0.0
+            responses_per_sec = d["responses"] / elapsed if elapsed > 0 else float(d["responses"])
+            slot = slots.get(domain)
+
+            prefix = f"per_domain/{domain}"
+            stats.set_value(f"{prefix}/requests", d["requests"])
+            stats.set_value(f"{prefix}/responses", d["responses"])
+            stats.set_value(f"{prefix}/bytes", d["bytes"])
+            stats.set_value(f"{prefix}/latency_avg", round(latency_avg, 3))
+            stats.set_value(f"{prefix}/latency_max", round(d["latency_max"], 3))
+            stats.set_value(f"{prefix}/responses_per_sec", round(responses_per_sec, 3))
+            if slot is not None:
+                stats.set_value(f"{prefix}/final_delay", round(slot.delay, 3))
+
+            spider.logger.info(
+                f"{domain}: {d['responses']} risposte, latenza media {latency_avg:.3f}s "
+                f"(max {d['latency_max']:.3f}s), {responses_per_sec:.2f} risposte/s"
+            )
@@ -26,6 +26,38 @@ ROBOTSTXT_OBEY = True
 CONCURRENT_REQUESTS_PER_DOMAIN = 1
 DOWNLOAD_DELAY = 1
 
+# Scheduling per dominio: ogni dominio *today.it ha il proprio slot con ritardo adattivo
+# (AutoThrottle, guidato dalla latenza; DOWNLOAD_DELAY resta il minimo) e la concorrenza
+# globale diventa PER_HOST_CONCURRENCY x numero di domini crawlati (vedi EventsSpider.from_crawler)
+PER_HOST_SCHEDULING = True
+PER_HOST_CONCURRENCY = 1
+
+# Pagine della lista eventi seguite per città (argomento spider max_pages per il singolo run)
+MAX_PAGES_PER_CITY = 20
+
+# Divide il periodo in sotto-periodi di N giorni, crawlati come liste indipendenti
+# (argomento spider shard_days per il singolo run). 0 = un'unica lista dal/al per città
+DATE_SHARD_DAYS = 0
+
+# Backend di estrazione delle sezioni del dettaglio: "lxml" (una sola visita del documento)
+# o "xpath" (query per sezione, comportamento storico). Vedi events/extraction.py
+EXTRACTION_BACKEND = "lxml"
+
+# Indice dei fingerprint delle card in lista: se la card di un evento non è cambiata e il dettaglio
+# è stato scaricato entro CARD_INDEX_TTL_HOURS, l'item precedente viene riemesso senza scaricare
+# il dettaglio. Le voci non più viste da CARD_INDEX_RETENTION_DAYS vengono eliminate.
+# Un hit non rinnova fetched_at: con run giornalieri un dettaglio invariato viene riscaricato ogni TTL/24
+# giorni (72 ore -> 1/3 dei dettagli, 240 ore -> 1/10). Le modifiche visibili in lista cambiano il
+# fingerprint; il TTL limita solo il ritardo su quelle del solo dettaglio (descrizione, prezzo, orari).
+CARD_INDEX_ENABLED = True
+CARD_INDEX_TTL_HOURS = 240
+CARD_INDEX_RETENTION_DAYS = 30
+
+# Job ripristinabile (SCRAPY_JOB_ID, vedi scraping/shared/resume.py): coda, fingerprint e item già
+# emessi restano sul volume condiviso finché il crawl non si conclude, così un retry riprende.
+# Le directory di job mai conclusi vengono eliminate dopo RESUME_JOB_RETENTION_DAYS.
+RESUME_JOB_RETENTION_DAYS = 7
+
 # Disable cookies (enabled by default)
 #COOKIES_ENABLED = False
 
@@ -40,15 +72,19 @@ DOWNLOAD_DELAY = 1
 
 # Enable or disable spider middlewares
 # See https://docs.scrapy.org/en/latest/topics/spider-middleware.html
-#SPIDER_MIDDLEWARES = {
-#    "events.middlewares.MilanoEventsSpiderMiddleware": 543,
-#}
+SPIDER_MIDDLEWARES = {
+    # Ledger degli item emessi e pulizia del job (attivo solo con JOBDIR)
+    "shared.resume.ResumableJobMiddleware": 50,
+}
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
-#DOWNLOADER_MIDDLEWARES = {
-#    "events.middlewares.MilanoEventsDownloaderMiddleware": 543,
-#}
+DOWNLOADER_MIDDLEWARES = {
+    # Latenza e throughput per dominio, esportati nelle stats (per_domain/<dominio>/...)
+    "events.middlewares.DomainStatsMiddleware": 950,
+    "scrapy.downloadermiddlewares.httpcache.HttpCacheMiddleware": None,
+    "shared.httpcache.ConditionalCacheMiddleware": 900,
+}
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
@@ -58,9 +94,16 @@ DOWNLOAD_DELAY = 1
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
-#ITEM_PIPELINES = {
-#    "events.pipelines.MilanoEventsPipeline": 300,
-#}
+ITEM_PIPELINES = {
+    # Item nello stream Redis del run (attivo solo con SCRAPY_STREAM e REDIS_STREAM_URL)
+    "shared.stream.RedisStreamPipeline": 900,
+}
+
+# Sorgente negli item dello stream; back-pressure: lo spider aspetta finché lo stream ha
+# REDIS_STREAM_MAX_LEN voci non ancora caricate dall'ETL (vedi shared/stream.py)
+STREAM_SOURCE = "city_today"
+REDIS_STREAM_BATCH_SIZE = 100
+REDIS_STREAM_MAX_LEN = 20000
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
@@ -75,13 +118,14 @@ DOWNLOAD_DELAY = 1
 # Enable showing throttling stats for every response received:
 #AUTOTHROTTLE_DEBUG = False
 
-# Enable and configure HTTP caching (disabled by default)
-# See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html#httpcache-middleware-settings
-#HTTPCACHE_ENABLED = True
-#HTTPCACHE_EXPIRATION_SECS = 0
-#HTTPCACHE_DIR = "httpcache"
-#HTTPCACHE_IGNORE_HTTP_CODES = []
-#HTTPCACHE_STORAGE = "scrapy.extensions.httpcache.FilesystemCacheStorage"
+# Cache HTTP persistente con GET condizionali (ETag / Last-Modified), condivisa dai progetti
+# Vedi scraping/shared/httpcache.py; la directory è relativa a SCRAPY_STATE_DIR
+HTTPCACHE_ENABLED = True
+HTTPCACHE_POLICY = "shared.httpcache.ConditionalGetPolicy"
+HTTPCACHE_STORAGE = "shared.httpcache.BoundedFilesystemCacheStorage"
+HTTPCACHE_DIR = "httpcache"
+HTTPCACHE_MAX_BYTES = 512 * 1024 * 1024
+HTTPCACHE_GZIP = True
 
 # Set settings whose default value is deprecated to a future-proof value
 FEED_EXPORT_ENCODING = "utf-8"
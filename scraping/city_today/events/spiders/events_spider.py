@@ -2,9 +2,14 @@ import scrapy
 import html as html_lib
 import re
 import hashlib
+import json
+import time
 from datetime import datetime, timedelta
 from scrapy import Selector
 from events.items import EventItem
+from events.extraction import get_backend
+from shared.state import state_path
+from shared.store import JsonStore
 
 # Configurazione città supportate
 CITIES = {
@@ -268,6 +273,12 @@ CITIES = {
 # Periodi disponibili
 PERIODI = ["oggi", "domani", "weekend", "questa-settimana", "prossima-settimana", "questo-mese"]
 
+# Link di paginazione della lista eventi (.../eventi/dal/X/al/Y/pag/N/)
+PAGE_LINK_RE = re.compile(r"/pag/(\d+)")
+
+# Stato del crawl salvato in spider.state con JOBDIR (job ripristinabile, vedi shared/resume.py)
+CRAWL_STATE_ATTRS = ("pages_scheduled", "city_pages", "pages_capped", "seen_detail_urls", "incomplete_cities")
+
 
 def get_date_range(periodo):
     """Calcola date inizio/fine per il periodo specificato"""
@@ -315,6 +326,19 @@ def get_date_range(periodo):
         return today, sunday
 
 
+def split_date_range(date_start, date_end, days):
+    """Divide il periodo in sotto-periodi consecutivi di `days` giorni (days <= 0: periodo intero)"""
+    if days <= 0:
+        return [(date_start, date_end)]
+    ranges = []
+    current = date_start
+    while current <= date_end:
+        end = min(current + timedelta(days=days - 1), date_end)
+        ranges.append((current, end))
+        current = end + timedelta(days=1)
+    return ranges
+
+
 class EventsSpider(scrapy.Spider):
     """
     Spider per estrarre gli eventi da *Today.it
@@ -339,9 +363,104 @@ class EventsSpider(scrapy.Spider):
         "DOWNLOAD_DELAY": 1,
     }
 
-    def __init__(self, cities=None, periodo="questa-settimana", *args, **kwargs):
+    # Indice persistente dei fingerprint delle card (URL evento -> fingerprint, data dettaglio, item)
+    card_index = None
+
+    # Backend di estrazione delle sezioni del dettaglio (EXTRACTION_BACKEND)
+    extraction = get_backend("lxml")
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        settings = crawler.settings
+
+        # Scheduling per dominio: concorrenza globale proporzionale ai domini, ritardo adattivo per slot
+        if settings.getbool("PER_HOST_SCHEDULING"):
+            per_host = settings.getint("PER_HOST_CONCURRENCY", 1)
+            settings.set("CONCURRENT_REQUESTS_PER_DOMAIN", per_host, priority="spider")
+            settings.set("CONCURRENT_REQUESTS", per_host * len(spider.allowed_domains), priority="spider")
+            settings.set("AUTOTHROTTLE_ENABLED", True, priority="spider")
+            settings.set("AUTOTHROTTLE_START_DELAY", settings.getfloat("DOWNLOAD_DELAY"), priority="spider")
+            settings.set("AUTOTHROTTLE_TARGET_CONCURRENCY", float(per_host), priority="spider")
+            spider.logger.info(
+                f"Scheduling per dominio: {len(spider.allowed_domains)} domini x {per_host} richieste"
+            )
+
+        spider.extraction = get_backend(settings.get("EXTRACTION_BACKEND", "lxml"))
+
+        if spider.max_pages is None:
+            spider.max_pages = settings.getint("MAX_PAGES_PER_CITY", 20)
+        if spider.shard_days is None and settings.getint("DATE_SHARD_DAYS", 0):
+            spider.shard_days = settings.getint("DATE_SHARD_DAYS")
+            spider._build_start_urls()
+        if spider.shard_days:
+            spider.logger.info(f"Periodo diviso in sotto-periodi di {spider.shard_days} giorni")
+
+        if settings.getbool("CARD_INDEX_ENABLED"):
+            spider.card_index = JsonStore(state_path("city_today", "card_index.sqlite"), stats=crawler.stats)
+        return spider
+
+    async def start(self):
+        self._restore_crawl_state()
+        for url in self.start_urls:
+            yield scrapy.Request(url, dont_filter=True, errback=self._request_failed)
+
+    def _request_failed(self, failure):
+        """Pagina della lista o dettaglio non scaricato: la città non è coperta per intero"""
+        city_key = self._get_city_key_from_url(failure.request.url)
+        self.logger.warning(f"Richiesta fallita {failure.request.url}: {failure.value!r}")
+        self.crawler.stats.inc_value("request_failed")
+        if city_key:
+            self.incomplete_cities.add(city_key)
+
+    def coverage(self):
+        """
+        Finestre (città, periodo) scaricate per intero, scritte nel manifest: l'ETL disattiva gli
+        eventi della città che iniziano nel periodo e non sono più pubblicati. Le città con pagine
+        oltre il limite o richieste fallite restano fuori.
+        """
+        return [
+            {"city": CITIES[city]["name"], "date_start": self.date_start.isoformat(),
+             "date_end": self.date_end.isoformat()}
+            for city in self.cities
+            if city not in self.pages_capped and city not in self.incomplete_cities
+        ]
+
+    def _restore_crawl_state(self):
+        """
+        Con JOBDIR lo stato della paginazione e della deduplica vive in spider.state (salvato da
+        Scrapy alla chiusura): alla ripresa le pagine della lista già schedulate e i dettagli già
+        richiesti non vengono ripetuti, e le card dall'indice non riemettono item già nel ledger.
+        """
+        state = getattr(self, "state", None)
+        if state is None:
+            return
+        for attr in CRAWL_STATE_ATTRS:
+            setattr(self, attr, state.setdefault(attr, getattr(self, attr)))
+
+    def closed(self, reason):
+        if self.card_index is not None:
+            retention = self.settings.getfloat("CARD_INDEX_RETENTION_DAYS", 30) * 86400
+            pruned = self.card_index.prune(retention)
+            self.logger.info(f"Indice card: {len(self.card_index)} eventi ({pruned} rimossi)")
+            self.card_index.close()
+
+    def __init__(self, cities=None, periodo="questa-settimana", max_pages=None, shard_days=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
+        # Limite di pagine della lista per città (default: MAX_PAGES_PER_CITY)
+        self.max_pages = int(max_pages) if max_pages else None
+        # Ultima pagina schedulata per lista, pagine schedulate per città, città che hanno raggiunto il limite
+        self.pages_scheduled = {}
+        self.city_pages = {}
+        self.pages_capped = set()
+        # Sotto-periodi di N giorni come start URL indipendenti (default: DATE_SHARD_DAYS, 0 = periodo intero)
+        self.shard_days = int(shard_days) if shard_days else None
+        # URL di dettaglio già richiesti (deduplica tra pagine e shard di date)
+        self.seen_detail_urls = set()
+        # Città con richieste fallite (fuori dalla copertura del manifest)
+        self.incomplete_cities = set()
+
         # Accetta lista di città
         if cities is None:
             self.cities = list(CITIES.keys())
@@ -361,17 +480,23 @@ class EventsSpider(scrapy.Spider):
             raise ValueError(f"Periodo '{self.periodo}' non supportato. Periodi disponibili: {', '.join(PERIODI)}")
 
         # Calcola date per il periodo
-        date_start, date_end = get_date_range(self.periodo)
-        date_path = f"dal/{date_start.strftime('%Y-%m-%d')}/al/{date_end.strftime('%Y-%m-%d')}/"
+        self.date_start, self.date_end = get_date_range(self.periodo)
 
-        # Configura domini e URL in base alle città selezionate e periodo
+        # Configura domini in base alle città selezionate (start URL in _build_start_urls)
         self.allowed_domains = [CITIES[city]["domain"] for city in self.cities]
+        self._build_start_urls()
+        self.logger.info(f"Scraping città: {', '.join([CITIES[c]['name'] for c in self.cities])}")
+        self.logger.info(f"Periodo: {self.periodo} ({self.date_start} - {self.date_end})")
+
+    def _build_start_urls(self):
+        """Start URL per città e periodo (o per sotto-periodo, con shard_days)"""
+        date_ranges = split_date_range(self.date_start, self.date_end, self.shard_days or 0)
         self.start_urls = [
-            f"https://{CITIES[city]['domain']}/eventi/{date_path}"
+            f"https://{CITIES[city]['domain']}/eventi/dal/{start.strftime('%Y-%m-%d')}/al/{end.strftime('%Y-%m-%d')}/"
             for city in self.cities
+            for start, end in date_ranges
         ]
-        self.logger.info(f"Scraping città: {', '.join([CITIES[c]['name'] for c in self.cities])}")
-        self.logger.info(f"Periodo: {self.periodo} ({date_start} - {date_end})")
+        self.city_pages = {city: len(date_ranges) for city in self.cities}
 
     def _get_city_from_url(self, url):
         """Estrae il nome della città dall'URL"""
@@ -391,7 +516,10 @@ class EventsSpider(scrapy.Spider):
         """Parse la pagina principale degli eventi - estrae dati grezzi dalla lista"""
         city_name = self._get_city_from_url(response.url)
         event_cards = response.css("article.c-card")
-        seen_urls = set()
+
+        if city_name:
+            self.crawler.stats.inc_value(f"pages_per_city/{city_name}")
+        yield from self._schedule_pages(response)
 
         for card in event_cards:
             # Inizializza raw_data per dati dalla lista
@@ -432,8 +560,9 @@ class EventsSpider(scrapy.Spider):
                         raw_list["location"] = self._clean_text(location_text)
 
             # Gestione contenuti lazy-loaded
+            # Il blocco lazy-loaded viene parsato solo se manca qualche dato della card
             async_html = card.css('script[type="text/async-html"]::text').get()
-            if async_html:
+            if async_html and not (all_links and all(raw_list[k] for k in ("title", "category", "image", "date", "location"))):
                 decoded_html = html_lib.unescape(async_html)
                 lazy_selector = Selector(text=decoded_html)
                 if not all_links:
@@ -475,21 +604,29 @@ class EventsSpider(scrapy.Spider):
                 continue
 
             full_url = response.urljoin(event_link)
-            if full_url in seen_urls:
+            if full_url in self.seen_detail_urls:
+                self.crawler.stats.inc_value("detail_duplicates")
                 continue
-            seen_urls.add(full_url)
+            self.seen_detail_urls.add(full_url)
 
             # Pulisci i dati grezzi della lista
             for key in raw_list:
                 if isinstance(raw_list[key], str):
                     raw_list[key] = self._clean_text(raw_list[key])
 
+            # Card invariata e dettaglio recente: riemetti l'item salvato senza scaricare il dettaglio
+            cached_item = self._lookup_card_index(full_url, self._card_fingerprint(raw_list))
+            if cached_item is not None:
+                yield cached_item
+                continue
+
             # Ottieni city_key per lookup city_id
             city_key = self._get_city_key_from_url(response.url)
 
             yield response.follow(
                 event_link,
                 callback=self.parse_event_detail,
+                errback=self._request_failed,
                 meta={
                     "raw_list": raw_list,
                     "url": full_url,
@@ -499,6 +636,48 @@ class EventsSpider(scrapy.Spider):
                 },
             )
 
+    def _schedule_pages(self, response):
+        """
+        Schedula le pagine successive della lista: appena una pagina mostra il numero di pagine
+        vengono richieste tutte insieme, non una alla volta. Il limite max_pages vale per città,
+        sommando le pagine di tutti i sotto-periodi (shard di date).
+        """
+        city_key = self._get_city_key_from_url(response.url)
+        listing = response.meta.get("listing", response.url)
+        page_links = {}
+        for link in response.css("a::attr(href)").getall():
+            match = PAGE_LINK_RE.search(link)
+            if match and "/eventi/" in link:
+                page_links[int(match.group(1))] = link
+
+        if not page_links:
+            return
+
+        last_seen = max(page_links)
+        first_page = self.pages_scheduled.get(listing, 1) + 1
+        last_page = last_seen
+        if self.max_pages:
+            budget = max(self.max_pages - self.city_pages.get(city_key, 0), 0)
+            last_page = min(last_seen, first_page - 1 + budget)
+        if last_page < last_seen and city_key not in self.pages_capped:
+            self.pages_capped.add(city_key)
+            self.crawler.stats.inc_value("pages_capped")
+            self.logger.info(f"{city_key}: raggiunto il limite di {self.max_pages} pagine")
+
+        # Template: l'URL dell'ultima pagina vista, sostituendo solo il numero di pagina
+        template = page_links[last_seen]
+        match = PAGE_LINK_RE.search(template)
+        for page in range(first_page, last_page + 1):
+            page_url = f"{template[:match.start(1)]}{page}{template[match.end(1):]}"
+            yield response.follow(
+                page_url, callback=self.parse, errback=self._request_failed, priority=1,
+                meta={"page": page, "listing": listing},
+            )
+
+        if last_page >= first_page:
+            self.city_pages[city_key] = self.city_pages.get(city_key, 0) + last_page - first_page + 1
+            self.pages_scheduled[listing] = last_page
+
     def parse_event_detail(self, response):
         """Parse la pagina di dettaglio dell'evento - estrae dati grezzi e mappa al JSON finale"""
         raw_list = response.meta["raw_list"]
@@ -513,22 +692,20 @@ class EventsSpider(scrapy.Spider):
             "image": None
         }
 
-        # Cerca la griglia info
-        info_grid = response.css("div.l-grid.l-grid--square")
-        if not info_grid:
-            info_grid = response.css("section.l-entry__body")
+        # Sezioni etichettate della griglia info (backend di estrazione, vedi events/extraction.py)
+        sections = self.extraction.info_sections(response)
 
         # Estrai "Dove" (location completa)
-        raw_detail["dove"] = self._extract_raw_dove(response, info_grid)
+        raw_detail["dove"] = self._extract_raw_dove(sections["Dove"])
 
         # Estrai "Quando" (date e orari)
-        raw_detail["quando"] = self._extract_raw_quando(response, info_grid)
+        raw_detail["quando"] = self._extract_raw_quando(sections["Quando"])
 
         # Estrai "Prezzo"
-        raw_detail["prezzo"] = self._extract_raw_prezzo(response, info_grid)
+        raw_detail["prezzo"] = self._extract_raw_prezzo(sections["Prezzo"])
 
         # Estrai "Altre informazioni"
-        raw_detail["altre_informazioni"] = self._extract_raw_altre_info(response, info_grid)
+        raw_detail["altre_informazioni"] = self._extract_raw_altre_info(sections["Altre informazioni"])
 
         # Estrai descrizione
         raw_detail["descrizione"] = self._extract_raw_descrizione(response)
@@ -621,9 +798,48 @@ class EventsSpider(scrapy.Spider):
         if item.get("city"):
             self.crawler.stats.inc_value(f"items_per_city/{item['city']}")
 
+        if self.card_index is not None:
+            self.card_index.set(item["url"], {
+                "fingerprint": self._card_fingerprint(raw_list),
+                "fetched_at": time.time(),
+                "item": dict(item),
+            })
+
         yield item
 
-    def _extract_raw_dove(self, response, info_grid):
+    def _card_fingerprint(self, raw_list):
+        """Fingerprint dei dati della card in lista (titolo, data, location, categoria, immagine, stelle)"""
+        payload = json.dumps(raw_list, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+    def _lookup_card_index(self, url, fingerprint):
+        """Item salvato per l'evento se la card non è cambiata e il dettaglio è entro CARD_INDEX_TTL_HOURS"""
+        if self.card_index is None:
+            return None
+
+        stats = self.crawler.stats
+        entry = self.card_index.get(url)
+        if entry is None:
+            stats.inc_value("card_index/miss")
+            return None
+        if entry["fingerprint"] != fingerprint:
+            stats.inc_value("card_index/changed")
+            return None
+        if time.time() - entry["fetched_at"] > self.settings.getfloat("CARD_INDEX_TTL_HOURS", 240) * 3600:
+            stats.inc_value("card_index/expired")
+            return None
+
+        stats.inc_value("card_index/hit")
+        # Aggiorna l'ultimo avvistamento (la pulizia usa updated_at), non la data del dettaglio
+        self.card_index.set(url, entry)
+
+        item = EventItem(entry["item"])
+        item["scraped_at"] = datetime.now().isoformat()
+        if item.get("city"):
+            stats.inc_value(f"items_per_city/{item['city']}")
+        return item
+
+    def _extract_raw_dove(self, location_section):
         """Estrae dati grezzi della sezione 'Dove'"""
         dove = {
             "raw_text": None,
@@ -631,12 +847,6 @@ class EventsSpider(scrapy.Spider):
             "address": None
         }
 
-        location_section = info_grid.xpath('.//span[contains(text(), "Dove")]/parent::div')
-        if not location_section:
-            location_section = response.xpath(
-                '//span[contains(text(), "Dove")]/parent::div[contains(@class, "l-grid__item")]'
-            )
-
         if location_section:
             # Testo grezzo completo
             dove["raw_text"] = self._clean_text(location_section.xpath("string()").get())
@@ -655,7 +865,7 @@ class EventsSpider(scrapy.Spider):
 
         return dove
 
-    def _extract_raw_quando(self, response, info_grid):
+    def _extract_raw_quando(self, date_section):
         """Estrae dati grezzi della sezione 'Quando'"""
         quando = {
             "raw_text": None,
@@ -664,12 +874,6 @@ class EventsSpider(scrapy.Spider):
             "schedule": None
         }
 
-        date_section = info_grid.xpath('.//span[contains(text(), "Quando")]/parent::div')
-        if not date_section:
-            date_section = response.xpath(
-                '//span[contains(text(), "Quando")]/parent::div[contains(@class, "l-grid__item")]'
-            )
-
         if date_section:
             # Testo grezzo completo
             date_text = date_section.xpath("string()").get()
@@ -697,14 +901,8 @@ class EventsSpider(scrapy.Spider):
 
         return quando
 
-    def _extract_raw_prezzo(self, response, info_grid):
+    def _extract_raw_prezzo(self, price_section):
         """Estrae dati grezzi della sezione 'Prezzo'"""
-        price_section = info_grid.xpath('.//span[contains(text(), "Prezzo")]/parent::div')
-        if not price_section:
-            price_section = response.xpath(
-                '//span[contains(text(), "Prezzo")]/parent::div[contains(@class, "l-grid__item")]'
-            )
-
         if price_section:
             price = price_section.css("span.c-badge::text").get()
             if not price:
@@ -725,21 +923,13 @@ class EventsSpider(scrapy.Spider):
 
         return None
 
-    def _extract_raw_altre_info(self, response, info_grid):
+    def _extract_raw_altre_info(self, other_info_section):
         """Estrae dati grezzi della sezione 'Altre informazioni'"""
         altre_info = {
             "raw_text": None,
             "website": None
         }
 
-        other_info_section = info_grid.xpath(
-            './/span[contains(text(), "Altre informazioni")]/parent::div'
-        )
-        if not other_info_section:
-            other_info_section = response.xpath(
-                '//span[contains(text(), "Altre informazioni")]/parent::div[contains(@class, "l-grid__item")]'
-            )
-
         if other_info_section:
             altre_info["raw_text"] = self._clean_text(other_info_section.xpath("string()").get())
 
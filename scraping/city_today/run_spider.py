@@ -5,13 +5,17 @@ import os
 import sys
 from datetime import datetime
 
-# Aggiungi il path del progetto
+# Aggiungi il path del progetto e dei moduli condivisi (scraping/shared)
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from scrapy.crawler import CrawlerProcess
 from scrapy.utils.project import get_project_settings
 
 from events.spiders.events_spider import EventsSpider, CITIES, PERIODI
+from shared.feeds import FEED_FORMATS, COMPRESSIONS, build_feed, crawl_coverage, crawl_item_count, write_manifest
+from shared.resume import JOB_ID_ENV, job_settings, job_pending
+from shared.stream import stream_incomplete
 
 # Città disponibili
 AVAILABLE_CITIES = list(CITIES.keys())
@@ -29,13 +33,23 @@ def show_help():
     for periodo in PERIODI:
         default = " (default)" if periodo == "questa-settimana" else ""
         print(f"  - {periodo}{default}")
+    print("\nFormati di output:")
+    print("  --format=json (default) | --format=jsonl")
+    print("  --compress=zstd (solo con --format=jsonl)")
+    print("\nPaginazione:")
+    print("  --max-pages=N (pagine della lista per città, default MAX_PAGES_PER_CITY)")
+    print("  --shard-days=N (divide il periodo in sotto-periodi di N giorni, default DATE_SHARD_DAYS)")
+    print("\nJob ripristinabile:")
+    print(f"  {JOB_ID_ENV}=<id> (un crawl interrotto riprende al prossimo avvio con lo stesso id)")
     print("\nUtilizzo:")
-    print("  python run_spider.py <città> [città2] [--periodo=PERIODO]")
+    print("  python run_spider.py <città> [città2] [--periodo=PERIODO] [--format=FORMATO] [--compress=zstd] [--max-pages=N] [--shard-days=N]")
     print("\nEsempi:")
     print("  python run_spider.py milano")
     print("  python run_spider.py roma napoli")
     print("  python run_spider.py milano --periodo=prossima-settimana")
     print("  python run_spider.py roma bologna --periodo=questo-mese")
+    print("  python run_spider.py milano --format=jsonl --compress=zstd")
+    print("  python run_spider.py roma --periodo=questo-mese --shard-days=3")
     print("=" * 55 + "\n")
 
 
@@ -48,10 +62,22 @@ def main():
     # Separa città da opzioni
     requested_cities = []
     periodo = "questa-settimana"  # default
+    feed_format = "json"
+    compression = None
+    max_pages = None
+    shard_days = None
 
     for arg in sys.argv[1:]:
         if arg.startswith("--periodo="):
             periodo = arg.split("=", 1)[1].lower()
+        elif arg.startswith("--format="):
+            feed_format = arg.split("=", 1)[1].lower()
+        elif arg.startswith("--compress="):
+            compression = arg.split("=", 1)[1].lower() or None
+        elif arg.startswith("--max-pages="):
+            max_pages = arg.split("=", 1)[1]
+        elif arg.startswith("--shard-days="):
+            shard_days = arg.split("=", 1)[1]
         else:
             requested_cities.append(arg.lower())
 
@@ -73,6 +99,27 @@ def main():
         show_help()
         return
 
+    # Valida il limite di pagine
+    if max_pages is not None and (not max_pages.isdigit() or int(max_pages) < 1):
+        print(f"\nErrore: --max-pages non valido: {max_pages}")
+        show_help()
+        return
+
+    if shard_days is not None and not shard_days.isdigit():
+        print(f"\nErrore: --shard-days non valido: {shard_days}")
+        show_help()
+        return
+
+    # Valida formato e compressione
+    if feed_format not in FEED_FORMATS or (compression and compression not in COMPRESSIONS):
+        print(f"\nErrore: formato non valido: {feed_format}{'/' + compression if compression else ''}")
+        show_help()
+        return
+    if compression and feed_format != "jsonl":
+        print("\nErrore: --compress richiede --format=jsonl")
+        show_help()
+        return
+
     # Genera nome file con timestamp
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
 
@@ -82,9 +129,10 @@ def main():
 
     # Nome file basato sulle città e periodo
     if len(requested_cities) == 1:
-        output_file = os.path.join(output_dir, f"eventi_{requested_cities[0]}_{periodo}_{timestamp}.json")
+        output_base = os.path.join(output_dir, f"eventi_{requested_cities[0]}_{periodo}_{timestamp}")
     else:
-        output_file = os.path.join(output_dir, f"eventi_today_{periodo}_{timestamp}.json")
+        output_base = os.path.join(output_dir, f"eventi_today_{periodo}_{timestamp}")
+    output_file, feed_options = build_feed(output_base, feed_format, compression)
 
     print(f"\nAvvio scraping per: {', '.join([c.capitalize() for c in requested_cities])}")
     print(f"Periodo: {periodo}")
@@ -92,31 +140,43 @@ def main():
     # Carica settings del progetto
     settings = get_project_settings()
 
-    # Configura output JSON
-    settings.set(
-        "FEEDS",
-        {
-            output_file: {
-                "format": "json",
-                "encoding": "utf-8",
-                "indent": 2,
-            }
-        },
-    )
+    # Configura output (JSON array o JSON Lines)
+    settings.set("FEEDS", {output_file: feed_options})
+
+    # Con SCRAPY_JOB_ID coda, fingerprint e item emessi restano su disco fino a crawl concluso
+    settings.update(job_settings("city_today"), priority="cmdline")
 
     # Crea e avvia il crawler
     process = CrawlerProcess(settings)
 
-    # Passa le città e il periodo
-    process.crawl(EventsSpider, cities=requested_cities, periodo=periodo)
+    # Passa le città e il periodo (il crawler serve anche per le statistiche a fine crawl)
+    crawler = process.create_crawler(EventsSpider)
+    process.crawl(crawler, cities=requested_cities, periodo=periodo, max_pages=max_pages, shard_days=shard_days)
 
     print(f"Output file: {output_file}")
 
     process.start()
 
+    # Job interrotto: nessun manifest (il file è parziale, lo completa la ripresa) e uscita con errore
+    if job_pending(crawler):
+        print(f"\nCrawl interrotto: stato conservato in {crawler.settings.get('JOBDIR')}")
+        print(f"Rilanciare con lo stesso {JOB_ID_ENV} per riprendere.\n")
+        sys.exit(1)
+
+    # Manifest con numero di item e checksum (scritto solo a crawl terminato)
+    manifest = write_manifest(
+        output_file,
+        source="city_today",
+        item_count=crawl_item_count(crawler),
+        cities=requested_cities,
+        periodo=periodo,
+        format=feed_format,
+        compression=compression,
+        coverage=crawl_coverage(crawler),
+    )
+
     # Recupera statistiche
     try:
-        crawler = list(process.crawlers)[0]
         stats = crawler.stats
         total_count = stats.get_value('item_scraped_count', 0)
 
@@ -142,15 +202,41 @@ def main():
         if not city_stats and total_count > 0:
             print(f"{'Dettaglio non disponibile':<25} | {total_count:>10}")
 
+        replayed = stats.get_value("resume/items_replayed", 0)
+        if replayed:
+            print(f"{'Ripresi dal job':<25} | {replayed:>10}")
+
         print("-" * 10)
         print(f"{'TOTALE':<25} | {total_count:>10}")
 
         print("-" * 10)
-        print(f"File: {output_file}\n")
+
+        # Statistiche per dominio (DomainStatsMiddleware)
+        domains = sorted({key.split("/")[1] for key in all_stats if key.startswith("per_domain/")})
+        if domains:
+            print(f"{'Dominio':<25} | {'Risposte':>8} | {'Latenza':>8} | {'Risp/s':>6}")
+            for domain in domains:
+                prefix = f"per_domain/{domain}"
+                print(
+                    f"{domain:<25} | {all_stats.get(prefix + '/responses', 0):>8} | "
+                    f"{all_stats.get(prefix + '/latency_avg', 0):>7.3f}s | "
+                    f"{all_stats.get(prefix + '/responses_per_sec', 0):>6.2f}"
+                )
+            print("-" * 10)
+
+        print(f"File: {output_file}")
+        if manifest:
+            print(f"Manifest: {manifest['item_count']} item, sha256 {manifest['sha256'][:12]}...")
+        print()
         print("=" * 10 + "\n")
     except (IndexError, AttributeError):
         print(f"\nScraping completato. File: {output_file}\n")
 
+    # Item nello stream Redis senza eof: il loader non li userà, il task va ritentato
+    if stream_incomplete(crawler):
+        print("Stream incompleto (nessun eof): rilanciare il task\n")
+        sys.exit(1)
+
 
 if __name__ == "__main__":
     main()
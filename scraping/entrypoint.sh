@@ -5,40 +5,106 @@ set -e
 # Utilizzo:
 #   ./entrypoint.sh city_today milano roma --periodo=questa-settimana
 #   ./entrypoint.sh zero_eu milano bologna
+#   ./entrypoint.sh artribune --mode=full
+#   ./entrypoint.sh city_today milano --format=jsonl --compress=zstd
 #   ./entrypoint.sh city_today --help
+#   ./entrypoint.sh multi --city-today=milano,roma --zero-eu=milano --periodo=questa-settimana
 
 SOURCE=$1
 shift
 
+# Marcatore di inizio run: vengono copiati solo i file scritti da questo run, non quelli
+# rimasti nella directory di output da run precedenti
+RUN_MARKER=$(mktemp)
+trap 'rm -f "$RUN_MARKER"' EXIT
+
+# Copia i file di output (JSON, JSON Lines, zstd) nella directory condivisa.
+# I manifest vengono copiati per ultimi: il loader considera completo un file solo se ha il manifest.
+# Con SCRAPY_STREAM gli item sono già nello stream Redis del run: nessuna copia.
+copy_output() {
+    if [ -n "$SCRAPY_STREAM" ]; then
+        echo "Item pubblicati nello stream $SCRAPY_STREAM: output non copiato"
+        return
+    fi
+    for f in "$1"/*.json "$1"/*.jsonl "$1"/*.jsonl.zst; do
+        case "$f" in
+            *.manifest.json) continue ;;
+        esac
+        if [ -f "$f" ] && [ "$f" -nt "$RUN_MARKER" ]; then
+            cp -f "$f" /data/output/
+        fi
+    done
+    for f in "$1"/*.manifest.json; do
+        if [ -f "$f" ] && [ "$f" -nt "$RUN_MARKER" ]; then
+            cp -f "$f" /data/output/
+        fi
+    done
+}
+
+# Esegue il runner inoltrandogli SIGTERM/SIGINT: bash è PID 1 nel container e non li inoltra ai figli,
+# quindi docker stop (on_kill del DockerOperator) finirebbe in SIGKILL senza la chiusura pulita
+# che conserva il job ripristinabile (shared/resume.py). Ritorna il codice di uscita del runner.
+run_runner() {
+    "$@" &
+    local child=$!
+    trap 'kill -TERM "$child" 2>/dev/null' TERM INT
+    local status
+    while true; do
+        wait "$child" && status=0 || status=$?
+        # wait interrotto dal segnale: il runner sta ancora chiudendo, si aspetta che esca
+        kill -0 "$child" 2>/dev/null || break
+    done
+    trap - TERM INT
+    return "$status"
+}
+
 if [ -z "$SOURCE" ]; then
     echo "Utilizzo: entrypoint.sh <source> [città...] [--periodo=PERIODO]"
     echo ""
     echo "Sources disponibili:"
     echo "  - city_today"
     echo "  - zero_eu"
+    echo "  - artribune (copertura nazionale, crawl incrementale)"
+    echo "  - multi (più città e sorgenti in un solo processo)"
     exit 1
 fi
 
 case $SOURCE in
     city_today)
         cd /app/city_today
-        python run_spider.py "$@"
+        run_runner python run_spider.py "$@"
         # Copia output nella directory condivisa se esiste
         if [ -d "/data/output" ]; then
-            cp -f /app/city_today/output/*.json /data/output/ 2>/dev/null || true
+            copy_output /app/city_today/output
         fi
         ;;
     zero_eu)
         cd /app/zero_eu
-        python run_spider.py "$@"
+        run_runner python run_spider.py "$@"
+        # Copia output nella directory condivisa se esiste
+        if [ -d "/data/output" ]; then
+            copy_output /app/zero_eu/output
+        fi
+        ;;
+    artribune)
+        cd /app/artribune
+        run_runner python run_spider.py "$@"
+        # Copia output nella directory condivisa se esiste
+        if [ -d "/data/output" ]; then
+            copy_output /app/artribune/output
+        fi
+        ;;
+    multi)
+        cd /app
+        run_runner python run_crawl.py "$@"
         # Copia output nella directory condivisa se esiste
         if [ -d "/data/output" ]; then
-            cp -f /app/zero_eu/output/*.json /data/output/ 2>/dev/null || true
+            copy_output /app/output
         fi
         ;;
     *)
         echo "Source non valida: $SOURCE"
-        echo "Sources disponibili: city_today, zero_eu"
+        echo "Sources disponibili: city_today, zero_eu, artribune, multi"
         exit 1
         ;;
 esac
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+"""
+Runner multi-città e multi-sorgente: esegue più spider in un unico processo (un solo reactor).
+
+Evita di pagare avvio del container, import di Python e bootstrap di Scrapy/Twisted per ogni
+coppia città/sorgente. La politeness per dominio resta invariata:
+- city_today: un solo crawler per tutte le città, ogni dominio *today.it ha il suo slot
+  (CONCURRENT_REQUESTS_PER_DOMAIN / DOWNLOAD_DELAY delle settings del progetto)
+- zero_eu: un crawler per tutte le città (stesso dominio zero.eu, ID città dalla mappa persistente)
+- artribune: un crawler (copertura nazionale)
+
+Ogni crawler usa le settings del proprio progetto e scrive il proprio file di output con manifest.
+Con SCRAPY_JOB_ID il crawler city_today è ripristinabile (shared/resume.py): se viene interrotto
+il suo file resta senza manifest e il runner esce con errore, così il retry del task riprende.
+
+Con --mock=URL tutte le richieste vanno al server locale che emula i siti
+(benchmarks/mock_server.py): test di carico del crawl completo su una sola macchina, con
+output separato in output/mock/ (mai caricato dall'ETL).
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Moduli condivisi e progetti Scrapy (i package events, zero_scraper, artribune_scraper non collidono)
+sys.path.insert(0, BASE_DIR)
+for project_dir in ("city_today", "zero_eu", "artribune"):
+    sys.path.insert(0, os.path.join(BASE_DIR, project_dir))
+
+from scrapy.crawler import Crawler, CrawlerProcess
+from scrapy.settings import Settings
+from scrapy.utils.reactor import install_reactor
+
+from shared.feeds import FEED_FORMATS, COMPRESSIONS, build_feed, crawl_coverage, crawl_item_count, write_manifest
+from shared.mocksite import mock_settings
+from shared.resume import job_settings, job_pending
+from shared.stream import stream_incomplete
+
+PROJECT_SETTINGS = {
+    "city_today": "events.settings",
+    "zero_eu": "zero_scraper.settings",
+    "artribune": "artribune_scraper.settings",
+}
+
+
+def project_settings(source, output_file, feed_options, mock_url=None, overrides=None):
+    """Settings del progetto Scrapy della sorgente, con FEEDS sul file di output dedicato"""
+    settings = Settings()
+    settings.setmodule(PROJECT_SETTINGS[source], priority="project")
+    settings.set("FEEDS", {output_file: feed_options}, priority="cmdline")
+    if mock_url:
+        settings.update(mock_settings(mock_url), priority="cmdline")
+    settings.update(overrides or {}, priority="cmdline")
+    return settings
+
+
+def split_cities(value):
+    return [c.strip().lower() for c in value.split(",") if c.strip()] if value else []
+
+
+def main():
+    from events.spiders.events_spider import EventsSpider as CityTodaySpider, CITIES, PERIODI
+
+    parser = argparse.ArgumentParser(description="Runner multi-città (un solo processo Scrapy)")
+    parser.add_argument("--city-today", default="", help="Città city_today separate da virgola")
+    parser.add_argument("--zero-eu", default="", help="Città zero_eu separate da virgola")
+    parser.add_argument("--artribune", action="store_true", help="Includi lo spider artribune")
+    parser.add_argument("--periodo", default="questa-settimana", choices=PERIODI, help="Periodo city_today")
+    parser.add_argument("--max-pages", type=int, default=None, help="Pagine della lista per città city_today")
+    parser.add_argument("--shard-days", type=int, default=None, help="Sotto-periodi di N giorni per city_today")
+    parser.add_argument("--format", choices=list(FEED_FORMATS), default="jsonl", help="Formato di output (default: jsonl)")
+    parser.add_argument("--compress", choices=list(COMPRESSIONS), default=None, help="Compressione (solo con --format=jsonl)")
+    parser.add_argument("--mock", default=None, metavar="URL",
+                        help="Crawla il server locale che emula i siti (es. http://127.0.0.1:8900)")
+    parser.add_argument("-s", "--set", dest="overrides", action="append", default=[], metavar="SETTING=VALORE",
+                        help="Sovrascrive un setting di tutti gli spider (es. -s DOWNLOAD_DELAY=0)")
+    args = parser.parse_args()
+    if args.compress and args.format != "jsonl":
+        parser.error("--compress richiede --format=jsonl")
+    if any("=" not in value for value in args.overrides):
+        parser.error("-s richiede SETTING=VALORE")
+    overrides = dict(value.split("=", 1) for value in args.overrides)
+
+    cities_today = split_cities(args.city_today)
+    cities_zero = split_cities(args.zero_eu)
+    invalid_cities = [c for c in cities_today if c not in CITIES]
+    if invalid_cities:
+        parser.error(f"città city_today non valide: {', '.join(invalid_cities)}")
+    if not cities_today and not cities_zero and not args.artribune:
+        parser.error("nessuna sorgente da eseguire (usa --city-today, --zero-eu o --artribune)")
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_dir = os.path.join(BASE_DIR, "output", "mock") if args.mock else os.path.join(BASE_DIR, "output")
+    os.makedirs(output_dir, exist_ok=True)
+
+    process = CrawlerProcess(Settings())
+    # Un solo reactor condiviso: va installato prima di avviare i crawler (creati a mano, non da process)
+    install_reactor(process.settings["TWISTED_REACTOR"], process.settings["ASYNCIO_EVENT_LOOP"])
+    # (sorgente, crawler, file di output, extra manifest)
+    jobs = []
+
+    if cities_today:
+        if len(cities_today) == 1:
+            output_base = os.path.join(output_dir, f"eventi_{cities_today[0]}_{args.periodo}_{timestamp}")
+        else:
+            output_base = os.path.join(output_dir, f"eventi_today_{args.periodo}_{timestamp}")
+        output_file, feed_options = build_feed(output_base, args.format, args.compress)
+        crawler = Crawler(
+            CityTodaySpider,
+            project_settings("city_today", output_file, feed_options, args.mock, {**job_settings("city_today"), **overrides}),
+        )
+        process.crawl(
+            crawler,
+            cities=cities_today,
+            periodo=args.periodo,
+            max_pages=args.max_pages,
+            shard_days=args.shard_days,
+        )
+        jobs.append(("city_today", crawler, output_file, {"cities": cities_today, "periodo": args.periodo}))
+
+    if cities_zero:
+        from zero_scraper.spiders.events_spider import EventsSpider as ZeroSpider
+
+        if len(cities_zero) == 1:
+            output_base = os.path.join(output_dir, f"eventi_zero_{cities_zero[0]}_{timestamp}")
+        else:
+            output_base = os.path.join(output_dir, f"eventi_zero_{timestamp}")
+        output_file, feed_options = build_feed(output_base, args.format, args.compress)
+        crawler = Crawler(ZeroSpider, project_settings("zero_eu", output_file, feed_options, args.mock, overrides))
+        process.crawl(crawler, cities=cities_zero)
+        jobs.append(("zero_eu", crawler, output_file, {"cities": cities_zero}))
+
+    if args.artribune:
+        from artribune_scraper.spiders.artribune_spider import ArtribuneSpider
+
+        output_base = os.path.join(output_dir, f"eventi_artribune_{timestamp}")
+        output_file, feed_options = build_feed(output_base, args.format, args.compress)
+        crawler = Crawler(ArtribuneSpider, project_settings("artribune", output_file, feed_options, args.mock, overrides))
+        process.crawl(crawler)
+        jobs.append(("artribune", crawler, output_file, {"cities": []}))
+
+    print("\nAvvio runner multi-città")
+    if args.mock:
+        print(f"Modalità mock: richieste verso {args.mock}")
+    if cities_today:
+        print(f"city_today ({args.periodo}): {', '.join(cities_today)}")
+    if cities_zero:
+        print(f"zero_eu: {', '.join(cities_zero)}")
+    if args.artribune:
+        print("artribune: tutte le città")
+
+    process.start()
+
+    print("\n" + "=" * 80)
+    print(f"{'REPORT RUNNER MULTI-CITTÀ':^80}")
+    print("=" * 80)
+    print(f"{'Sorgente':<12} | {'Eventi':>8} | {'Durata':>8} | {'Eventi/s':>8} | {'Motivo chiusura':<16} | File")
+    print("-" * 80)
+    interrupted = []
+    for source, crawler, output_file, extra in jobs:
+        stats = crawler.stats.get_stats() if crawler.stats else {}
+        if job_pending(crawler):
+            # Output parziale: niente manifest, lo scriverà il tentativo che riprende il job
+            interrupted.append(source)
+            print(f"{source:<12} | {'-':>8} | {'-':>8} | {'-':>8} | {'job interrotto':<16} | {os.path.basename(output_file)}")
+            continue
+        if "crawl/mode" in stats:
+            # Crawl incrementale (artribune): il file contiene solo gli eventi modificati
+            extra = {**extra, "crawl_mode": stats["crawl/mode"]}
+        manifest = write_manifest(
+            output_file,
+            source=source,
+            item_count=crawl_item_count(crawler),
+            format=args.format,
+            compression=args.compress,
+            coverage=crawl_coverage(crawler),
+            **extra,
+        )
+        items = manifest["item_count"] if manifest else stats.get("item_scraped_count", 0)
+        reason = stats.get("finish_reason", "-")
+        elapsed = stats.get("elapsed_time_seconds", 0)
+        rate = items / elapsed if elapsed else 0
+        print(
+            f"{source:<12} | {items:>8} | {elapsed:>7.1f}s | {rate:>8.1f} | "
+            f"{reason:<16} | {os.path.basename(output_file)}"
+        )
+    print("=" * 80 + "\n")
+
+    if interrupted:
+        print(f"Job interrotti ({', '.join(interrupted)}): rilanciare con lo stesso SCRAPY_JOB_ID per riprendere\n")
+        sys.exit(1)
+
+    # Item nello stream Redis senza eof: il loader non li userà, il task va ritentato
+    incomplete = [source for source, crawler, _, _ in jobs if stream_incomplete(crawler)]
+    if incomplete:
+        print(f"Stream incompleto ({', '.join(incomplete)}, nessun eof): rilanciare il task\n")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
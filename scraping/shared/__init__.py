@@ -0,0 +1 @@
+# Componenti condivisi dai progetti Scrapy (city_today, zero_eu, artribune)
@@ -0,0 +1,36 @@
+"""
+Statistiche delle risposte JSON delle API (byte e tempo di decodifica per endpoint).
+
+Gli spider decodificano le risposte con decode_json() invece di response.json(); a fine crawl
+summarize_api_stats() aggiunge le medie per pagina, così l'effetto di _fields o di payload più
+piccoli si legge direttamente nelle stats:
+    api/<endpoint>/pages, api/<endpoint>/bytes, api/<endpoint>/decode_ms
+    api/<endpoint>/bytes_per_page, api/<endpoint>/decode_ms_per_page
+"""
+
+import time
+
+
+def decode_json(response, stats, endpoint):
+    start = time.perf_counter()
+    data = response.json()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    stats.inc_value(f"api/{endpoint}/pages")
+    stats.inc_value(f"api/{endpoint}/bytes", len(response.body))
+    stats.inc_value(f"api/{endpoint}/decode_ms", elapsed_ms)
+    return data
+
+
+def summarize_api_stats(stats):
+    all_stats = stats.get_stats()
+    endpoints = {key.split("/")[1] for key in all_stats if key.startswith("api/") and key.endswith("/pages")}
+    for endpoint in endpoints:
+        pages = all_stats.get(f"api/{endpoint}/pages", 0)
+        if not pages:
+            continue
+        stats.set_value(f"api/{endpoint}/bytes_per_page", round(all_stats.get(f"api/{endpoint}/bytes", 0) / pages))
+        stats.set_value(f"api/{endpoint}/decode_ms", round(all_stats.get(f"api/{endpoint}/decode_ms", 0), 3))
+        stats.set_value(
+            f"api/{endpoint}/decode_ms_per_page", round(all_stats.get(f"api/{endpoint}/decode_ms", 0) / pages, 3)
+        )
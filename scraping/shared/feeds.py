@@ -0,0 +1,143 @@
+"""
+Feed di output degli spider: JSON array (storico) o JSON Lines, opzionalmente compresso zstd.
+
+Ogni file prodotto viene accompagnato da un manifest `<file>.manifest.json` con numero di
+item e checksum, scritto solo a crawl terminato: il loader ETL lo usa per verificare il file.
+Il campo coverage del manifest elenca le finestre (città, date) scaricate per intero: l'ETL
+disattiva solo gli eventi mancanti dentro quelle finestre. Il campo run_id lega il file al DAG run
+che lo ha prodotto.
+"""
+
+import hashlib
+import json
+import os
+from datetime import datetime
+
+# Formati supportati: nome CLI -> (formato Scrapy, estensione)
+FEED_FORMATS = {
+    "json": ("json", ".json"),
+    "jsonl": ("jsonlines", ".jsonl"),
+}
+COMPRESSIONS = {
+    "zstd": ("shared.feeds.ZstdPlugin", ".zst"),
+}
+MANIFEST_SUFFIX = ".manifest.json"
+
+# DAG run che ha avviato il container (impostata dal DAG): il loader di un run carica solo i file
+# il cui manifest riporta il suo run_id, anche se il volume di output è condiviso tra i DAG
+RUN_ID_ENV = "SCRAPY_RUN_ID"
+
+
+class ZstdPlugin:
+    """
+    Plugin di postprocessing per FEEDS: comprime l'output con zstd.
+
+    Parametri accettati in feed_options:
+    - `zstd_compresslevel` (default 3)
+    """
+
+    def __init__(self, file, feed_options):
+        import zstandard
+
+        self.file = file
+        self.feed_options = feed_options
+        compress_level = self.feed_options.get("zstd_compresslevel", 3)
+        self.zstdfile = zstandard.ZstdCompressor(level=compress_level).stream_writer(self.file, closefd=False)
+
+    def write(self, data):
+        return self.zstdfile.write(data)
+
+    def close(self):
+        self.zstdfile.close()
+
+
+def build_feed(output_base, feed_format="json", compression=None):
+    """
+    Costruisce path e opzioni FEEDS per il formato richiesto.
+
+    :param output_base: path del file senza estensione
+    :return: (output_file, feed_options)
+    """
+    if feed_format not in FEED_FORMATS:
+        raise ValueError(f"Formato '{feed_format}' non supportato. Formati disponibili: {', '.join(FEED_FORMATS)}")
+    if compression and compression not in COMPRESSIONS:
+        raise ValueError(f"Compressione '{compression}' non supportata. Disponibili: {', '.join(COMPRESSIONS)}")
+    if compression and feed_format != "jsonl":
+        raise ValueError("La compressione è disponibile solo con --format=jsonl")
+
+    scrapy_format, extension = FEED_FORMATS[feed_format]
+    feed_options = {
+        "format": scrapy_format,
+        "encoding": "utf-8",
+    }
+    if scrapy_format == "json":
+        feed_options["indent"] = 2
+
+    if compression:
+        plugin, compressed_extension = COMPRESSIONS[compression]
+        feed_options["postprocessing"] = [plugin]
+        extension += compressed_extension
+
+    return output_base + extension, feed_options
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """SHA-256 del file su disco (letto a blocchi)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def crawl_coverage(crawler):
+    """
+    Finestre {city, date_start, date_end} coperte per intero dal crawl (spider.coverage()).
+    Vuota se il crawl non è terminato normalmente, se qualche callback è andata in errore o se
+    un job ripreso non ha ritrovato lo stato del tentativo precedente: gli eventi mancanti
+    potrebbero essere solo andati persi.
+    """
+    spider = getattr(crawler, "spider", None)
+    stats = crawler.stats.get_stats() if crawler.stats else {}
+    if spider is None or not hasattr(spider, "coverage"):
+        return []
+    if stats.get("finish_reason") != "finished" or stats.get("spider_exceptions/count"):
+        return []
+    if stats.get("resume/resumed") and not stats.get("resume/state_restored"):
+        # Ripresa senza coda e fingerprint del tentativo precedente: eventi potenzialmente persi
+        return []
+    return spider.coverage()
+
+
+def crawl_item_count(crawler):
+    """Item scritti nel feed dal crawl (item_scraped_count: ogni item emesso va nel feed)"""
+    return crawler.stats.get_value("item_scraped_count", 0) if crawler.stats else 0
+
+
+def write_manifest(output_file, source, item_count, **extra):
+    """
+    Scrive il manifest accanto al file di output e lo restituisce come dict.
+    item_count viene dal crawler (crawl_item_count), senza rileggere il file; run_id da
+    SCRAPY_RUN_ID (None fuori dal DAG). I campi extra (es. cities, periodo) vengono riportati così come sono.
+    """
+    if not os.path.exists(output_file):
+        return None
+
+    manifest = {
+        "file": os.path.basename(output_file),
+        "source": source,
+        "item_count": item_count,
+        "sha256": file_sha256(output_file),
+        "bytes": os.path.getsize(output_file),
+        "created_at": datetime.now().isoformat(),
+        "run_id": os.environ.get(RUN_ID_ENV),
+    }
+    manifest.update(extra)
+
+    # Scrittura atomica: il manifest compare solo quando è completo
+    manifest_path = output_file + MANIFEST_SUFFIX
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+    return manifest
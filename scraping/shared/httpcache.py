@@ -0,0 +1,143 @@
+"""
+Cache HTTP persistente con GET condizionali, condivisa dai progetti Scrapy.
+
+- ConditionalGetPolicy: memorizza solo le risposte 200 con ETag/Last-Modified e le rivalida
+  sempre (If-None-Match / If-Modified-Since); un 304 viene servito dalla cache locale
+- BoundedFilesystemCacheStorage: FilesystemCacheStorage con dimensione massima
+  (HTTPCACHE_MAX_BYTES per spider), eviction delle voci usate meno di recente
+- ConditionalCacheMiddleware: HttpCacheMiddleware con stats httpcache/bytes_saved e httpcache/hit_ratio
+
+Settings (per progetto):
+    HTTPCACHE_ENABLED = True
+    HTTPCACHE_POLICY = "shared.httpcache.ConditionalGetPolicy"
+    HTTPCACHE_STORAGE = "shared.httpcache.BoundedFilesystemCacheStorage"
+    HTTPCACHE_DIR = "httpcache"   # relativo alla directory di stato (shared.state)
+    HTTPCACHE_MAX_BYTES = 512 * 1024 * 1024
+    DOWNLOADER_MIDDLEWARES = {
+        "scrapy.downloadermiddlewares.httpcache.HttpCacheMiddleware": None,
+        "shared.httpcache.ConditionalCacheMiddleware": 900,
+    }
+"""
+
+import os
+import shutil
+import time
+
+from scrapy.downloadermiddlewares.httpcache import HttpCacheMiddleware
+from scrapy.extensions.httpcache import FilesystemCacheStorage, RFC2616Policy
+
+from shared.state import state_dir
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# Dopo un'eviction la cache scende a questa frazione del limite (evita un'eviction per ogni store)
+EVICTION_LOW_WATERMARK = 0.9
+
+
+class ConditionalGetPolicy(RFC2616Policy):
+    """Policy "sempre rivalida": nessuna risposta è fresca, ogni richiesta in cache diventa condizionale"""
+
+    def should_cache_response(self, response, request):
+        if b"no-store" in self._parse_cachecontrol(response):
+            return False
+        # Senza validatori non si può rivalidare: inutile occupare spazio
+        return response.status == 200 and (
+            b"ETag" in response.headers or b"Last-Modified" in response.headers
+        )
+
+    def is_cached_response_fresh(self, cachedresponse, request):
+        self._set_conditional_validators(request, cachedresponse)
+        return False
+
+
+class BoundedFilesystemCacheStorage(FilesystemCacheStorage):
+    """
+    FilesystemCacheStorage con limite di dimensione per spider.
+
+    L'ultimo accesso a una voce è la mtime della sua directory (aggiornata a ogni lettura):
+    superato HTTPCACHE_MAX_BYTES vengono eliminate le voci usate meno di recente.
+    """
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        if not os.path.isabs(settings["HTTPCACHE_DIR"]):
+            self.cachedir = state_dir(settings["HTTPCACHE_DIR"])
+        self.max_bytes = settings.getint("HTTPCACHE_MAX_BYTES", DEFAULT_MAX_BYTES)
+        self.entries = {}  # path voce -> (ultimo accesso, byte)
+        self.total_bytes = 0
+        self.evicted = 0
+
+    def open_spider(self, spider):
+        super().open_spider(spider)
+        self.stats = spider.crawler.stats
+        spider_dir = os.path.join(self.cachedir, spider.name)
+        if not os.path.isdir(spider_dir):
+            return
+        for prefix in os.scandir(spider_dir):
+            if not prefix.is_dir():
+                continue
+            for entry in os.scandir(prefix.path):
+                if entry.is_dir():
+                    self.entries[entry.path] = (entry.stat().st_mtime, self._entry_size(entry.path))
+        self.total_bytes = sum(size for _, size in self.entries.values())
+
+    def close_spider(self, spider):
+        self.stats.set_value("httpcache/size_bytes", self.total_bytes)
+        self.stats.set_value("httpcache/evicted", self.evicted)
+        super().close_spider(spider)
+
+    def retrieve_response(self, spider, request):
+        response = super().retrieve_response(spider, request)
+        if response is not None:
+            rpath = self._get_request_path(spider, request)
+            now = time.time()
+            os.utime(rpath, (now, now))
+            if rpath in self.entries:
+                self.entries[rpath] = (now, self.entries[rpath][1])
+        return response
+
+    def store_response(self, spider, request, response):
+        super().store_response(spider, request, response)
+        rpath = self._get_request_path(spider, request)
+        _, previous_size = self.entries.get(rpath, (0, 0))
+        size = self._entry_size(rpath)
+        self.entries[rpath] = (time.time(), size)
+        self.total_bytes += size - previous_size
+        if self.max_bytes and self.total_bytes > self.max_bytes:
+            self._evict(keep=rpath)
+
+    def _evict(self, keep):
+        target = self.max_bytes * EVICTION_LOW_WATERMARK
+        for rpath, (_, size) in sorted(self.entries.items(), key=lambda e: e[1][0]):
+            if self.total_bytes <= target:
+                break
+            if rpath == keep:
+                continue
+            shutil.rmtree(rpath, ignore_errors=True)
+            del self.entries[rpath]
+            self.total_bytes -= size
+            self.evicted += 1
+
+    @staticmethod
+    def _entry_size(rpath):
+        return sum(f.stat().st_size for f in os.scandir(rpath) if f.is_file())
+
+
+class ConditionalCacheMiddleware(HttpCacheMiddleware):
+    """HttpCacheMiddleware con statistiche su risposte servite dalla cache dopo un 304"""
+
+    def process_response(self, request, response, spider=None):
+        cachedresponse = request.meta.get("cached_response")
+        result = super().process_response(request, response)
+        if cachedresponse is not None and result is cachedresponse:
+            # Byte non riscaricati: il corpo in cache al posto di quello (vuoto) del 304
+            self.stats.inc_value("httpcache/bytes_saved", max(len(cachedresponse.body) - len(response.body), 0))
+        return result
+
+    def spider_closed(self, spider):
+        stats = self.stats
+        hits = stats.get_value("httpcache/revalidate", 0) + stats.get_value("httpcache/hit", 0)
+        lookups = hits + stats.get_value("httpcache/miss", 0) + stats.get_value("httpcache/invalidate", 0)
+        stats.set_value("httpcache/hit_ratio", round(hits / lookups, 3) if lookups else 0.0)
+        stats.set_value("httpcache/bytes_saved", stats.get_value("httpcache/bytes_saved", 0))
+        super().spider_closed(spider)
@@ -0,0 +1,193 @@
+"""
+Stato di crawl ripristinabile per task: un retry del DAG riprende da dove si era fermato.
+
+Con la variabile d'ambiente SCRAPY_JOB_ID (nel DAG: dag, task e run_id, uguale tra i tentativi
+dello stesso task) il runner imposta JOBDIR in <STATE_DIR>/jobs/<job id>/<sorgente>, sul volume
+condiviso. Scrapy vi salva la coda dello scheduler e i fingerprint delle richieste già viste
+(requests.seen), più spider.state; ResumableJobMiddleware aggiunge il ledger degli item già
+emessi (items.jsonl):
+- a ogni item emesso il ledger riceve una riga JSON
+- alla ripresa gli item del ledger vengono riemessi per primi, così il nuovo file di output è
+  completo (i dettagli già scaricati non vengono richiesti di nuovo: sono in requests.seen)
+- a crawl concluso (motivo diverso da "shutdown") la directory del job viene eliminata; quelle
+  rimaste da job mai conclusi vengono eliminate dopo RESUME_JOB_RETENTION_DAYS
+
+La ripresa richiede una chiusura pulita (SIGTERM/SIGINT, es. timeout del task): la coda dello
+scheduler (requests.queue/active.json) e spider.state vengono scritti solo alla chiusura dello
+spider, mentre requests.seen cresce a ogni richiesta. Dopo un'interruzione brusca (SIGKILL, OOM)
+i fingerprint coprirebbero richieste mai scaricate: il job viene ripreso solo se c'è il marker
+RESUME_MARKER, scritto alla chiusura con motivo "shutdown" insieme allo stato di Scrapy, altrimenti
+la directory del job viene eliminata e il crawl riparte da capo (stats resume/discarded). Il marker
+viene rimosso all'avvio della ripresa: un tentativo ripreso e interrotto di nuovo bruscamente
+riparte da capo.
+
+Solo city_today è ripristinabile: zero_eu (buffer di riordino degli item in memoria) e artribune
+(dati a7e e deduplica in memoria, crawl incrementale) ripartono da capo a ogni tentativo.
+
+Settings (per progetto):
+    SPIDER_MIDDLEWARES = {"shared.resume.ResumableJobMiddleware": 50}
+    RESUME_JOB_RETENTION_DAYS = 7
+"""
+
+import json
+import os
+import re
+import shutil
+import time
+
+from itemadapter import ItemAdapter
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+from shared.state import STATE_DIR, state_dir
+
+JOB_ID_ENV = "SCRAPY_JOB_ID"
+JOBS_DIR = "jobs"
+LEDGER_FILE = "items.jsonl"
+RESUME_MARKER = "resumable.json"
+# Stato scritto da Scrapy alla chiusura, necessario per riprendere (oltre al marker)
+SCRAPY_STATE_FILES = (os.path.join("requests.queue", "active.json"), "spider.state")
+DEFAULT_RETENTION_DAYS = 7
+
+# Motivi di chiusura che lasciano il job da riprendere (gli altri lo concludono)
+RESUMABLE_REASONS = ("shutdown",)
+
+# Caratteri ammessi nel nome della directory del job (il run_id di Airflow contiene ':' e '+')
+UNSAFE_JOB_CHARS_RE = re.compile(r"[^A-Za-z0-9._-]+")
+
+
+def job_settings(source, job_id=None):
+    """Settings da aggiungere al crawler della sorgente per renderlo ripristinabile (vuote senza job id)"""
+    job_id = job_id or os.environ.get(JOB_ID_ENV)
+    if not job_id:
+        return {}
+    return {"JOBDIR": state_dir(JOBS_DIR, UNSAFE_JOB_CHARS_RE.sub("_", job_id), source)}
+
+
+def job_pending(crawler):
+    """True se il crawler ha un job non concluso (directory ancora presente): l'output è parziale"""
+    jobdir = crawler.settings.get("JOBDIR")
+    return bool(jobdir) and os.path.isdir(jobdir)
+
+
+def job_resumable(jobdir):
+    """True se il job è stato chiuso in modo pulito (marker e stato di Scrapy presenti): si può riprendere"""
+    return all(os.path.exists(os.path.join(jobdir, name)) for name in (RESUME_MARKER,) + SCRAPY_STATE_FILES)
+
+
+def prune_jobs(older_than, keep=None):
+    """Elimina le directory dei job non modificate da più di older_than secondi, ritorna quante"""
+    jobs_root = os.path.join(STATE_DIR, JOBS_DIR)
+    if not os.path.isdir(jobs_root):
+        return 0
+    pruned = 0
+    for name in os.listdir(jobs_root):
+        path = os.path.join(jobs_root, name)
+        if path == keep or not os.path.isdir(path):
+            continue
+        mtimes = [os.path.getmtime(path)] + [
+            os.path.getmtime(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files
+        ]
+        if time.time() - max(mtimes) > older_than:
+            shutil.rmtree(path, ignore_errors=True)
+            pruned += 1
+    return pruned
+
+
+class ResumableJobMiddleware:
+    """
+    Ledger degli item emessi da un crawl con JOBDIR: li riemette alla ripresa e
+    pulisce la directory del job a crawl concluso.
+    """
+
+    def __init__(self, crawler, jobdir):
+        self.crawler = crawler
+        self.jobdir = jobdir
+        self.ledger_path = os.path.join(jobdir, LEDGER_FILE)
+        # Qui, prima che scheduler e dupefilter aprano la directory del job
+        self.resumed = job_resumable(jobdir)
+        self.discarded = not self.resumed and os.path.isdir(jobdir) and bool(os.listdir(jobdir))
+        if self.discarded:
+            # Interruzione brusca: fingerprint senza coda, si riparte da capo
+            shutil.rmtree(jobdir)
+            os.makedirs(jobdir)
+        elif self.resumed:
+            # Vale per un solo tentativo: il prossimo riprende solo dopo una nuova chiusura pulita
+            os.remove(os.path.join(jobdir, RESUME_MARKER))
+        self.ledger = None
+        # id() degli item riemessi dal ledger non ancora arrivati a item_scraped (da non riscrivere)
+        self.replaying = set()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        jobdir = crawler.settings.get("JOBDIR")
+        if not jobdir:
+            raise NotConfigured("JOBDIR non impostato")
+        mw = cls(crawler, jobdir)
+        crawler.signals.connect(mw.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(mw.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(mw.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(mw.item_discarded, signal=signals.item_dropped)
+        crawler.signals.connect(mw.item_discarded, signal=signals.item_error)
+        return mw
+
+    def spider_opened(self, spider):
+        retention = self.crawler.settings.getfloat("RESUME_JOB_RETENTION_DAYS", DEFAULT_RETENTION_DAYS) * 86400
+        pruned = prune_jobs(retention, keep=os.path.dirname(self.jobdir))
+        if pruned:
+            spider.logger.info(f"Job: {pruned} directory di job non conclusi eliminate")
+        self.crawler.stats.set_value("resume/resumed", self.resumed)
+        self.crawler.stats.set_value("resume/state_restored", self.resumed)
+        if self.resumed:
+            spider.logger.info(f"Job: ripresa da {self.jobdir}")
+        elif self.discarded:
+            self.crawler.stats.set_value("resume/discarded", True)
+            spider.logger.warning(
+                f"Job: {self.jobdir} non chiuso in modo pulito (processo terminato?), stato eliminato: crawl da capo"
+            )
+
+    async def process_start(self, start):
+        # Alla ripresa gli item già emessi vanno nel nuovo file di output prima di tutto il resto
+        for item in self._read_ledger():
+            self.replaying.add(id(item))
+            yield item
+        self.ledger = open(self.ledger_path, "a", encoding="utf-8")
+        async for item_or_request in start:
+            yield item_or_request
+
+    def _read_ledger(self):
+        if not os.path.exists(self.ledger_path):
+            return
+        with open(self.ledger_path, "r", encoding="utf-8") as f:
+            for line in f:
+                # Una riga troncata (processo interrotto a metà scrittura) viene scartata
+                if line.endswith("\n"):
+                    yield json.loads(line)
+
+    def item_scraped(self, item, spider):
+        if id(item) in self.replaying:
+            self.replaying.discard(id(item))
+            self.crawler.stats.inc_value("resume/items_replayed")
+            return
+        if self.ledger is None:
+            self.ledger = open(self.ledger_path, "a", encoding="utf-8")
+        self.ledger.write(json.dumps(ItemAdapter(item).asdict(), ensure_ascii=False, default=str) + "\n")
+        # Riga per riga: anche un'interruzione brusca perde al massimo l'ultimo item
+        self.ledger.flush()
+
+    def item_discarded(self, item, spider, **kwargs):
+        self.replaying.discard(id(item))
+
+    def spider_closed(self, spider, reason):
+        if self.ledger is not None:
+            self.ledger.close()
+        if reason in RESUMABLE_REASONS:
+            with open(os.path.join(self.jobdir, RESUME_MARKER), "w", encoding="utf-8") as f:
+                json.dump({"reason": reason, "closed_at": time.time()}, f)
+            spider.logger.info(f"Job interrotto ({reason}): stato conservato in {self.jobdir}")
+            return
+        # Crawl concluso: coda, fingerprint e ledger non servono più
+        shutil.rmtree(self.jobdir, ignore_errors=True)
+        job_root = os.path.dirname(self.jobdir)
+        if os.path.isdir(job_root) and not os.listdir(job_root):
+            os.rmdir(job_root)
@@ -0,0 +1,26 @@
+"""
+Directory di stato persistente tra un crawl e l'altro (cache HTTP, indici, ledger).
+
+Configurabile con la variabile d'ambiente SCRAPY_STATE_DIR (nell'immagine Docker punta al
+volume condiviso, così lo stato sopravvive ai container); default: scraping/.state
+"""
+
+import os
+
+STATE_DIR = os.environ.get("SCRAPY_STATE_DIR") or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".state"
+)
+
+
+def state_dir(*parts):
+    """Directory dentro la directory di stato (creata se non esiste)"""
+    path = os.path.join(STATE_DIR, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def state_path(*parts):
+    """Path dentro la directory di stato (crea le directory intermedie)"""
+    path = os.path.join(STATE_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
@@ -0,0 +1,197 @@
+"""
+Store chiave/valore persistente (SQLite) per lo stato degli spider tra un crawl e l'altro.
+
+I valori sono serializzati in JSON; ogni voce ha il timestamp dell'ultimo aggiornamento,
+usato per TTL e pulizia delle voci vecchie.
+
+Gli store in SCRAPY_STATE_DIR sono condivisi da più container insieme (shard e DAG diversi):
+journal WAL (le letture non aspettano le scritture) e ogni scrittura è una transazione a sé,
+così il lock di scrittura dura un solo statement.
+Un lock non ottenuto entro BUSY_TIMEOUT_MS (l'attesa blocca il reactor) non fa fallire la
+callback: l'operazione viene saltata (get() ritorna None, set() e delete() non scrivono) e
+contata nelle stats store/<nome>/errors.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+
+# Attesa massima di un lock tenuto da un altro processo durante il crawl (millisecondi)
+BUSY_TIMEOUT_MS = 500
+
+# Attesa del lock all'apertura (creazione della tabella, prima dell'avvio del crawl)
+OPEN_TIMEOUT = 10
+
+# Scritture accumulate prima di un commit negli store privati (shared=False, es. SpillStore)
+COMMIT_EVERY = 500
+
+# Righe per statement in set_many() (3 parametri per riga, sotto il limite di 999 di SQLite)
+SET_MANY_ROWS = 300
+
+logger = logging.getLogger(__name__)
+
+
+class JsonStore:
+    def __init__(self, path, table="entries", shared=True, stats=None):
+        self.path = path
+        self.table = table
+        self.shared = shared
+        self.stats = stats
+        self.stats_prefix = f"store/{os.path.splitext(os.path.basename(path))[0]}"
+        # Condiviso: autocommit (isolation_level None), ogni statement è una transazione
+        self.conn = sqlite3.connect(path, timeout=OPEN_TIMEOUT, isolation_level=None if shared else "")
+        self.conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self.conn.commit()
+        if shared:
+            # WAL: le letture non aspettano le scritture degli altri processi, e i commit non fanno fsync
+            self.conn.execute("PRAGMA journal_mode = WAL")
+            self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        self.pending = 0
+        self.errors = 0
+
+    def _execute(self, sql, params=()):
+        """Esegue lo statement; None se il database è bloccato da un altro processo (o in errore)"""
+        try:
+            return self.conn.execute(sql, params)
+        except sqlite3.OperationalError as e:
+            self.errors += 1
+            if self.stats is not None:
+                self.stats.inc_value(f"{self.stats_prefix}/errors")
+            if self.errors == 1:
+                logger.warning(f"Store {self.path}: {e} (operazione saltata, le successive vengono solo contate)")
+            return None
+
+    def get(self, key, max_age=None):
+        """Valore della chiave, None se assente o più vecchio di max_age secondi"""
+        entry = self.get_entry(key)
+        if entry is None:
+            return None
+        value, updated_at = entry
+        if max_age is not None and time.time() - updated_at > max_age:
+            return None
+        return value
+
+    def get_entry(self, key):
+        """(valore, updated_at) della chiave, None se assente"""
+        cursor = self._execute(f"SELECT value, updated_at FROM {self.table} WHERE key = ?", (key,))
+        row = cursor.fetchone() if cursor is not None else None
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, value, updated_at=None):
+        self._execute(
+            f"INSERT OR REPLACE INTO {self.table} (key, value, updated_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value, ensure_ascii=False), updated_at if updated_at is not None else time.time()),
+        )
+        self._written()
+
+    def set_many(self, entries, updated_at=None):
+        """Scrive le coppie (chiave, valore) con un INSERT per SET_MANY_ROWS righe, invece di un commit per voce"""
+        updated_at = updated_at if updated_at is not None else time.time()
+        rows = [(key, json.dumps(value, ensure_ascii=False), updated_at) for key, value in entries]
+        for start in range(0, len(rows), SET_MANY_ROWS):
+            chunk = rows[start:start + SET_MANY_ROWS]
+            self._execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, updated_at) VALUES "
+                + ", ".join(["(?, ?, ?)"] * len(chunk)),
+                [param for row in chunk for param in row],
+            )
+            self._written()
+
+    def delete(self, key):
+        self._execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+        self._written()
+
+    def _written(self):
+        if self.shared:
+            return
+        self.pending += 1
+        if self.pending >= COMMIT_EVERY:
+            self.commit()
+
+    def prune(self, older_than):
+        """Elimina le voci non aggiornate da più di older_than secondi, ritorna quante"""
+        cursor = self._execute(f"DELETE FROM {self.table} WHERE updated_at < ?", (time.time() - older_than,))
+        self.commit()
+        return cursor.rowcount if cursor is not None else 0
+
+    def __len__(self):
+        cursor = self._execute(f"SELECT COUNT(*) FROM {self.table}")
+        return cursor.fetchone()[0] if cursor is not None else 0
+
+    def commit(self):
+        self.conn.commit()
+        self.pending = 0
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+
+class SpillStore:
+    """
+    Mappa chiave/valore per i dati di un solo crawl: le prime max_items voci restano in memoria,
+    le successive vanno in un file SQLite temporaneo in directory (eliminato in close()).
+    La memoria resta limitata qualunque sia il numero di voci; pop() libera le voci già usate.
+    """
+
+    def __init__(self, max_items, directory=None):
+        self.max_items = max_items
+        self.directory = directory
+        self.memory = {}
+        self.spill = None
+        self.spill_path = None
+
+    def set(self, key, value):
+        if key in self.memory or len(self.memory) < self.max_items:
+            self.memory[key] = value
+            if self.spill is not None:
+                self.spill.delete(key)
+            return
+        if self.spill is None:
+            if self.directory:
+                os.makedirs(self.directory, exist_ok=True)
+            fd, self.spill_path = tempfile.mkstemp(prefix="spill_", suffix=".sqlite", dir=self.directory)
+            os.close(fd)
+            self.spill = JsonStore(self.spill_path, shared=False)
+        self.spill.set(key, value)
+
+    def get(self, key, default=None):
+        if key in self.memory:
+            return self.memory[key]
+        if self.spill is not None:
+            entry = self.spill.get_entry(key)
+            if entry is not None:
+                return entry[0]
+        return default
+
+    def pop(self, key, default=None):
+        if key in self.memory:
+            return self.memory.pop(key)
+        if self.spill is not None:
+            entry = self.spill.get_entry(key)
+            if entry is not None:
+                self.spill.delete(key)
+                return entry[0]
+        return default
+
+    def spilled(self):
+        """Numero di voci su disco"""
+        return len(self.spill) if self.spill is not None else 0
+
+    def __len__(self):
+        return len(self.memory) + self.spilled()
+
+    def close(self):
+        self.memory.clear()
+        if self.spill is not None:
+            self.spill.close()
+            os.remove(self.spill_path)
+            self.spill = None
@@ -0,0 +1,159 @@
+"""
+Handoff degli item all'ETL tramite uno stream Redis per run, in alternativa ai file su volume.
+
+Con le variabili d'ambiente SCRAPY_STREAM (chiave dello stream, nel DAG una per DAG run) e
+REDIS_STREAM_URL, RedisStreamPipeline scrive ogni item nello stream mentre il crawl è in corso;
+il task stream_to_staging del DAG lo legge con un consumer group e lo carica in staging.
+Voci dello stream (campo type):
+- start: un nuovo tentativo del produttore (task di scraping + sorgente) è partito, il loader
+  riparte da una partizione vuota per quel produttore
+- item: un item (JSON nel campo data)
+- eof: crawl concluso, con il numero di item scritti e la copertura (come nel manifest, vuota
+  se il crawl non è terminato normalmente): solo allora il loader aggancia la partizione
+  del produttore
+
+Back-pressure: gli item vengono scritti a blocchi di REDIS_STREAM_BATCH_SIZE; se lo stream
+contiene già REDIS_STREAM_MAX_LEN voci (il loader le elimina dopo averle confermate) lo spider
+aspetta, fino a REDIS_STREAM_WAIT_TIMEOUT secondi, poi chiude il crawl senza eof.
+Senza eof (stream pieno o processo interrotto, motivo "shutdown") stream_incomplete() è True e
+il runner esce con errore: il retry del task riparte con una nuova voce start.
+
+Settings (per progetto):
+    ITEM_PIPELINES = {"shared.stream.RedisStreamPipeline": 900}
+    STREAM_SOURCE = "city_today"
+"""
+
+import json
+import os
+import socket
+import time
+
+from itemadapter import ItemAdapter
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.defer import deferred_from_coro, maybe_deferred_to_future
+from twisted.internet.task import deferLater
+
+from shared.feeds import crawl_coverage
+
+STREAM_ENV = "SCRAPY_STREAM"
+URL_ENV = "REDIS_STREAM_URL"
+PRODUCER_ENV = "SCRAPY_STREAM_PRODUCER"
+ATTEMPT_ENV = "SCRAPY_STREAM_ATTEMPT"
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_MAX_LEN = 20000
+DEFAULT_WAIT_TIMEOUT = 600
+
+# Intervallo tra due controlli della lunghezza dello stream quando è pieno (secondi)
+BACKPRESSURE_POLL = 0.5
+
+# Motivi di chiusura senza eof: il task verrà ritentato (o ripreso, vedi shared/resume.py)
+NO_EOF_REASONS = ("shutdown",)
+
+
+def stream_incomplete(crawler):
+    """True se il crawler scriveva nello stream e non ha scritto l'eof: il loader non userà i suoi item"""
+    stats = crawler.stats.get_stats() if crawler.stats else {}
+    return bool(stats.get("stream/enabled")) and not stats.get("stream/eof")
+
+
+class RedisStreamPipeline:
+    """Scrive gli item nello stream Redis del run (attiva solo con SCRAPY_STREAM e REDIS_STREAM_URL)"""
+
+    def __init__(self, crawler, client, stream, producer, attempt, source):
+        self.crawler = crawler
+        self.client = client
+        self.stream = stream
+        self.producer = producer
+        self.attempt = attempt
+        self.source = source
+        settings = crawler.settings
+        self.batch_size = settings.getint("REDIS_STREAM_BATCH_SIZE", DEFAULT_BATCH_SIZE)
+        self.max_len = settings.getint("REDIS_STREAM_MAX_LEN", DEFAULT_MAX_LEN)
+        self.wait_timeout = settings.getfloat("REDIS_STREAM_WAIT_TIMEOUT", DEFAULT_WAIT_TIMEOUT)
+        self.buffer = []
+        self.sent = 0
+        self.broken = False
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        stream = os.environ.get(STREAM_ENV)
+        url = os.environ.get(URL_ENV)
+        if not stream or not url:
+            raise NotConfigured(f"{STREAM_ENV} o {URL_ENV} non impostati")
+        source = crawler.settings.get("STREAM_SOURCE")
+        if not source:
+            raise NotConfigured("STREAM_SOURCE non impostato")
+
+        import redis
+
+        producer = f"{os.environ.get(PRODUCER_ENV) or socket.gethostname()}.{source}"
+        pipeline = cls(crawler, redis.Redis.from_url(url), stream, producer, os.environ.get(ATTEMPT_ENV, "1"), source)
+        crawler.signals.connect(pipeline.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(pipeline.spider_closed, signal=signals.spider_closed)
+        return pipeline
+
+    def _entry(self, kind, **fields):
+        return {"type": kind, "producer": self.producer, "attempt": self.attempt, "source": self.source, **fields}
+
+    def spider_opened(self, spider):
+        self.client.xadd(self.stream, self._entry("start"))
+        self.crawler.stats.set_value("stream/enabled", True)
+        spider.logger.info(f"Stream: item in {self.stream} come {self.producer} (tentativo {self.attempt})")
+
+    async def process_item(self, item):
+        if self.broken:
+            return item
+        self.buffer.append(self._entry("item", data=json.dumps(ItemAdapter(item).asdict(), ensure_ascii=False, default=str)))
+        if len(self.buffer) >= self.batch_size:
+            await self._wait_for_room()
+            if not self.broken:
+                self._flush()
+        return item
+
+    async def _wait_for_room(self):
+        """Back-pressure: aspetta che il loader abbia smaltito lo stream sotto REDIS_STREAM_MAX_LEN"""
+        # Import qui: a livello di modulo installerebbe il reactor di default prima di quello del runner
+        from twisted.internet import reactor
+
+        started = time.monotonic()
+        while self.client.xlen(self.stream) >= self.max_len:
+            if self.broken:
+                return
+            if time.monotonic() - started > self.wait_timeout:
+                self.broken = True
+                self.crawler.spider.logger.error(
+                    f"Stream {self.stream} pieno da {self.wait_timeout:.0f}s (loader fermo?): crawl interrotto"
+                )
+                deferred_from_coro(self.crawler.engine.close_spider_async(reason="stream_backpressure"))
+                return
+            self.crawler.stats.inc_value("stream/backpressure_waits")
+            await maybe_deferred_to_future(deferLater(reactor, BACKPRESSURE_POLL, lambda: None))
+
+    def _flush(self):
+        if not self.buffer:
+            return
+        # Un solo round trip per blocco
+        pipe = self.client.pipeline(transaction=False)
+        for entry in self.buffer:
+            pipe.xadd(self.stream, entry)
+        pipe.execute()
+        self.sent += len(self.buffer)
+        self.crawler.stats.set_value("stream/items_sent", self.sent)
+        self.buffer = []
+
+    def spider_closed(self, spider, reason):
+        if self.broken:
+            return
+        self._flush()
+        # Senza eof il loader non aggancia mai la partizione del produttore
+        if reason not in NO_EOF_REASONS:
+            self.client.xadd(self.stream, self._entry(
+                "eof",
+                item_count=self.sent,
+                coverage=json.dumps(crawl_coverage(self.crawler), ensure_ascii=False),
+            ))
+            self.crawler.stats.set_value("stream/eof", True)
+            spider.logger.info(f"Stream: {self.sent} item scritti in {self.stream}")
+        self.client.close()
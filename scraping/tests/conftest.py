@@ -0,0 +1,12 @@
+"""
+Test offline degli spider: stesso ambiente del benchmark (progetti Scrapy sul path, crawler
+finto con stats in memoria, nessuno stato su disco), vedi benchmarks/run_benchmark.py.
+
+Utilizzo (dalla cartella scraping):
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
@@ -0,0 +1,52 @@
+"""
+Equivalenza dei backend di estrazione di city_today (events/extraction.py) sul corpus registrato:
+parse_event_detail deve produrre lo stesso item (scraped_at escluso) con ogni backend.
+Il riferimento è xpath, il comportamento storico.
+"""
+
+import json
+import os
+
+import pytest
+
+from run_benchmark import CORPUS_DIR, SOURCES, build_response, build_spider, expand_case, load_object
+from events.extraction import BACKENDS
+
+REFERENCE_BACKEND = "xpath"
+
+
+def detail_cases():
+    with open(os.path.join(CORPUS_DIR, "index.json"), "r", encoding="utf-8") as f:
+        index = json.load(f)
+    for case in index["city_today"]:
+        if case["callback"] == "parse_event_detail":
+            yield from expand_case(case)
+
+
+DETAIL_CASES = list(detail_cases())
+
+
+def extract(backend, case):
+    spider = build_spider("city_today", {"EXTRACTION_BACKEND": backend})
+    # Risposta nuova per ogni backend: nessun albero lxml condiviso tra le esecuzioni
+    response = build_response(case, load_object(SOURCES["city_today"]["item"]))
+    item = dict(next(iter(spider.parse_event_detail(response))))
+    item.pop("scraped_at", None)
+    return item
+
+
+@pytest.mark.parametrize("backend", [name for name in BACKENDS if name != REFERENCE_BACKEND])
+@pytest.mark.parametrize("case", DETAIL_CASES, ids=[os.path.basename(case["path"]) for case in DETAIL_CASES])
+def test_backend_matches_reference(backend, case):
+    reference = extract(REFERENCE_BACKEND, case)
+    item = extract(backend, case)
+    different = sorted(key for key in set(item) | set(reference) if item.get(key) != reference.get(key))
+    assert not different, f"{backend} diverso da {REFERENCE_BACKEND} nei campi: {', '.join(different)}"
+
+
+def test_reference_reads_info_sections():
+    """Il corpus deve esercitare le sezioni: un backend che non trova nulla sarebbe 'equivalente'"""
+    items = [extract(REFERENCE_BACKEND, case) for case in DETAIL_CASES]
+    assert DETAIL_CASES
+    assert any(item.get("location_address") for item in items)
+    assert any(item.get("price") for item in items)
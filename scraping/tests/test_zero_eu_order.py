@@ -0,0 +1,108 @@
+"""Ordine dell'output di zero_eu: una pagina o un evento malformati non devono bloccare gli item successivi"""
+
+import json
+
+import scrapy
+from scrapy.http import Request, TextResponse
+
+from run_benchmark import build_spider
+
+API_URL = "https://zero.eu/api/v2/events"
+
+
+def api_event(event_id, city):
+    """Evento dell'API con luogo incorporato, indirizzo e data: nessuna richiesta aggiuntiva"""
+    return {
+        "id": event_id,
+        "link": f"https://zero.eu/it/eventi/{event_id}-evento/",
+        "slug": f"evento-{event_id}",
+        "name": {"plain": f"Evento {event_id}"},
+        "content": {"rendered": "<p>Descrizione</p>"},
+        "venue_name": f"Luogo {city}",
+        "venue_address": "Via Roma 1",
+        "start_date": "2026-11-01",
+        "end_date": "2026-11-01",
+        "date_string": "1 novembre 2026",
+        "_embedded": {"venue": [{"id": event_id, "plain_address": "Via Roma 1"}]},
+    }
+
+
+def events_page(city_index, page, body, total_pages=1):
+    request = Request(f"{API_URL}?page={page}&city={city_index}", meta={"page": page, "city_index": city_index})
+    if not isinstance(body, bytes):
+        body = json.dumps(body).encode("utf-8")
+    return TextResponse(
+        url=request.url,
+        body=body,
+        encoding="utf-8",
+        headers={"X-WP-TotalPages": str(total_pages)},
+        request=request,
+    )
+
+
+def items_of(results):
+    return [result for result in results if not isinstance(result, scrapy.Request)]
+
+
+def build_zero_eu(cities):
+    spider = build_spider("zero_eu", {})
+    spider.cities = cities
+    spider.city_ids = {city: index + 1 for index, city in enumerate(cities)}
+    return spider
+
+
+def test_malformed_page_releases_following_cities():
+    spider = build_zero_eu(["milano", "roma"])
+    milano = [api_event(100 + i, "milano") for i in range(3)]
+    roma = [api_event(200 + i, "roma") for i in range(5)]
+
+    # Milano ha 2 pagine: Roma resta in attesa della pagina 2 di Milano
+    results = list(spider.parse_events(events_page(0, 1, milano, total_pages=2)))
+    assert sum(isinstance(result, scrapy.Request) for result in results) == 1
+    assert [item["id"] for item in items_of(results)] == [event["id"] for event in milano]
+    assert items_of(spider.parse_events(events_page(1, 1, roma))) == []
+
+    # La pagina 2 di Milano è malformata: Milano è incompleta, Roma viene emessa
+    emitted = items_of(spider.parse_events(events_page(0, 2, b"<html>errore</html>", total_pages=2)))
+    assert [item["id"] for item in emitted] == [event["id"] for event in roma]
+    assert spider.incomplete_cities == {"milano"}
+    assert spider.crawler.stats.get_value("events_api/page_failed") == 1
+    assert spider.pending_items == {}
+
+
+def test_malformed_first_page_ends_city():
+    spider = build_zero_eu(["milano", "roma"])
+    roma = [api_event(200 + i, "roma") for i in range(2)]
+
+    assert items_of(spider.parse_events(events_page(1, 1, roma))) == []
+    emitted = items_of(spider.parse_events(events_page(0, 1, b"not json")))
+    assert [item["id"] for item in emitted] == [event["id"] for event in roma]
+    assert spider.incomplete_cities == {"milano"}
+
+
+def test_broken_event_does_not_hold_back_page():
+    spider = build_zero_eu(["milano"])
+    events = [api_event(100 + i, "milano") for i in range(3)]
+    events[1]["name"] = "non un dizionario"
+
+    emitted = items_of(spider.parse_events(events_page(0, 1, events)))
+    assert [item["id"] for item in emitted] == [100, 102]
+    assert spider.incomplete_cities == {"milano"}
+    assert spider.crawler.stats.get_value("events_api/event_failed") == 1
+
+
+def test_malformed_venue_completes_waiting_events():
+    spider = build_zero_eu(["milano"])
+    events = [api_event(100 + i, "milano") for i in range(2)]
+    for event in events:
+        del event["_embedded"]
+        event["_links"] = {"venue": [{"href": "https://zero.eu/api/v2/venue/7"}]}
+
+    results = list(spider.parse_events(events_page(0, 1, events)))
+    venue_requests = [result for result in results if isinstance(result, scrapy.Request)]
+    assert items_of(results) == [] and len(venue_requests) == 1
+
+    response = TextResponse(url=venue_requests[0].url, body=b"{", encoding="utf-8", request=venue_requests[0])
+    emitted = items_of(spider.parse_venue(response))
+    assert [item["id"] for item in emitted] == [100, 101]
+    assert spider.crawler.stats.get_value("venue_api/failed") == 1
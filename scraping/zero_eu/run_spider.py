@@ -5,24 +5,19 @@ import os
 import sys
 from datetime import datetime
 
-# Aggiungi il path del progetto
+# Aggiungi il path del progetto e dei moduli condivisi (scraping/shared)
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from scrapy.crawler import CrawlerProcess
 from scrapy.utils.project import get_project_settings
 
-from zero_scraper.spiders.events_spider import EventsSpider
+from zero_scraper.spiders.events_spider import EventsSpider, FALLBACK_CITY_IDS
+from shared.feeds import FEED_FORMATS, COMPRESSIONS, build_feed, crawl_coverage, crawl_item_count, write_manifest
+from shared.stream import stream_incomplete
 
 # Città disponibili con i loro ID
-AVAILABLE_CITIES = {
-    "milano": 2,
-    "roma": 3,
-    "torino": 12,
-    "bologna": 13,
-    "firenze": 14,
-    "venezia": 15,
-    "napoli": 16
-}
+AVAILABLE_CITIES = FALLBACK_CITY_IDS
 
 
 def show_help():
@@ -33,10 +28,14 @@ def show_help():
     print("\nCittà disponibili:")
     for city in AVAILABLE_CITIES.keys():
         print(f"  - {city}")
+    print("\nFormati di output:")
+    print("  --format=json (default) | --format=jsonl")
+    print("  --compress=zstd (solo con --format=jsonl)")
     print("\nUtilizzo:")
-    print("  python run_spider.py <città1> [città2] [città3] ...")
+    print("  python run_spider.py <città1> [città2] [città3] ... [--format=FORMATO] [--compress=zstd]")
     print("\nEsempi:")
     print("  python run_spider.py roma napoli")
+    print("  python run_spider.py milano --format=jsonl --compress=zstd")
     print("=" * 50 + "\n")
 
 
@@ -46,8 +45,22 @@ def main():
         show_help()
         return
 
-    # Recupera le città dai parametri
-    requested_cities = [c.lower() for c in sys.argv[1:]]
+    # Separa città da opzioni
+    requested_cities = []
+    feed_format = "json"
+    compression = None
+
+    for arg in sys.argv[1:]:
+        if arg.startswith("--format="):
+            feed_format = arg.split("=", 1)[1].lower()
+        elif arg.startswith("--compress="):
+            compression = arg.split("=", 1)[1].lower() or None
+        else:
+            requested_cities.append(arg.lower())
+
+    if not requested_cities:
+        show_help()
+        return
 
     # Valida le città
     invalid_cities = [c for c in requested_cities if c not in AVAILABLE_CITIES]
@@ -56,6 +69,16 @@ def main():
         show_help()
         return
 
+    # Valida formato e compressione
+    if feed_format not in FEED_FORMATS or (compression and compression not in COMPRESSIONS):
+        print(f"\nErrore: formato non valido: {feed_format}{'/' + compression if compression else ''}")
+        show_help()
+        return
+    if compression and feed_format != "jsonl":
+        print("\nErrore: --compress richiede --format=jsonl")
+        show_help()
+        return
+
     # Assicura che la cartella output esista
     output_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "output")
     os.makedirs(output_dir, exist_ok=True)
@@ -65,44 +88,54 @@ def main():
 
     # Nome file basato sulle città
     if len(requested_cities) == 1:
-        output_file = os.path.join(output_dir, f"eventi_zero_{requested_cities[0]}_{timestamp}.json")
+        output_base = os.path.join(output_dir, f"eventi_zero_{requested_cities[0]}_{timestamp}")
     else:
-        output_file = os.path.join(output_dir, f"eventi_zero_{timestamp}.json")
+        output_base = os.path.join(output_dir, f"eventi_zero_{timestamp}")
+    output_file, feed_options = build_feed(output_base, feed_format, compression)
 
     print(f"\nAvvio scraping Zero.eu per: {', '.join([c.capitalize() for c in requested_cities])}")
 
     # Carica settings del progetto
     settings = get_project_settings()
 
-    # Configura output JSON
-    settings.set(
-        "FEEDS",
-        {
-            output_file: {
-                "format": "json",
-                "encoding": "utf-8",
-                "indent": 2,
-            }
-        },
-    )
+    # Configura output (JSON array o JSON Lines)
+    settings.set("FEEDS", {output_file: feed_options})
 
-    # Crea e avvia il crawler per ogni città
+    # Un solo crawler per tutte le città (una sola risoluzione slug -> ID, un solo file di output)
     process = CrawlerProcess(settings)
-
-    for city in requested_cities:
-        process.crawl(EventsSpider, city=city)
+    crawler = process.create_crawler(EventsSpider)
+    process.crawl(crawler, cities=requested_cities)
 
     print(f"Output file: {output_file}")
 
     process.start()
 
+    # Manifest con numero di item e checksum (scritto solo a crawl terminato)
+    manifest = write_manifest(
+        output_file,
+        source="zero_eu",
+        item_count=crawl_item_count(crawler),
+        cities=requested_cities,
+        format=feed_format,
+        compression=compression,
+        coverage=crawl_coverage(crawler),
+    )
+
     print(f"\n" + "=" * 10)
     print(f"{'REPORT SCRAPING':^10}")
     print("=" * 10)
     print(f"Città scaricate: {', '.join([c.capitalize() for c in requested_cities])}\n")
-    print(f"File: {output_file} \n")
+    print(f"File: {output_file}")
+    if manifest:
+        print(f"Manifest: {manifest['item_count']} item, sha256 {manifest['sha256'][:12]}...")
+    print()
     print("=" * 10 + "\n")
 
+    # Item nello stream Redis senza eof: il loader non li userà, il task va ritentato
+    if stream_incomplete(crawler):
+        print("Stream incompleto (nessun eof): rilanciare il task\n")
+        sys.exit(1)
+
 
 if __name__ == "__main__":
     main()
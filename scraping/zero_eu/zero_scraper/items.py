@@ -13,7 +13,9 @@ class EventItem(scrapy.Item):
     id = scrapy.Field()
     url = scrapy.Field()
     slug = scrapy.Field()
-    
+    uuid = scrapy.Field()  # Hash di titolo + data_start + location_name
+    content_hash = scrapy.Field()  # Hash di descrizione + prezzo + ora (per rilevare modifiche)
+
     # Info base
     title = scrapy.Field()
     description = scrapy.Field()
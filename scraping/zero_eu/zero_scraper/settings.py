@@ -26,6 +26,29 @@ ROBOTSTXT_OBEY = True
 CONCURRENT_REQUESTS_PER_DOMAIN = 1
 DOWNLOAD_DELAY = 1
 
+# Pagine dell'API eventi richieste in parallelo (slot di download dedicato, vedi spider):
+# appena la prima pagina riporta X-WP-TotalPages le restanti vengono schedulate tutte insieme
+API_CONCURRENCY = 4
+
+# Mappa slug città -> ID di /api/wp/v2/citta salvata su disco ($SCRAPY_STATE_DIR/zero_eu/city_map.sqlite):
+# l'API viene richiesta solo se manca lo slug di una città richiesta o la voce è più vecchia del TTL
+CITY_MAP_ENABLED = True
+CITY_MAP_TTL_HOURS = 168
+
+# Pagina HTML dell'evento (indirizzo completo e data leggibile):
+# "auto" la scarica solo se l'API non riporta indirizzo del luogo o date_string, "always" per ogni evento
+EVENT_PAGE_MODE = "auto"
+
+# Indirizzi letti dalle pagine evento salvati per venue_id ($SCRAPY_STATE_DIR/zero_eu/venues.sqlite):
+# gli eventi successivi nello stesso luogo, anche in run successivi, non scaricano la pagina per l'indirizzo.
+# Con la stessa durata sono salvati i dati dell'endpoint venue dell'API (venue_api.sqlite)
+VENUE_CACHE_ENABLED = True
+VENUE_CACHE_TTL_DAYS = 30
+
+# Payload dell'API eventi ridotto ai campi letti dallo spider (_fields); i dati del luogo vengono
+# chiesti all'endpoint venue una volta per luogo. False = oggetti completi con _embed=true
+API_TRIM_FIELDS = True
+
 # Disable cookies (enabled by default)
 #COOKIES_ENABLED = False
 
@@ -46,9 +69,10 @@ DOWNLOAD_DELAY = 1
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
-#DOWNLOADER_MIDDLEWARES = {
-#    "zero_scraper.middlewares.ZeroScraperDownloaderMiddleware": 543,
-#}
+DOWNLOADER_MIDDLEWARES = {
+    "scrapy.downloadermiddlewares.httpcache.HttpCacheMiddleware": None,
+    "shared.httpcache.ConditionalCacheMiddleware": 900,
+}
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
@@ -58,9 +82,16 @@ DOWNLOAD_DELAY = 1
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
-#ITEM_PIPELINES = {
-#    "zero_scraper.pipelines.ZeroScraperPipeline": 300,
-#}
+ITEM_PIPELINES = {
+    # Item nello stream Redis del run (attivo solo con SCRAPY_STREAM e REDIS_STREAM_URL)
+    "shared.stream.RedisStreamPipeline": 900,
+}
+
+# Sorgente negli item dello stream; back-pressure: lo spider aspetta finché lo stream ha
+# REDIS_STREAM_MAX_LEN voci non ancora caricate dall'ETL (vedi shared/stream.py)
+STREAM_SOURCE = "zero_eu"
+REDIS_STREAM_BATCH_SIZE = 100
+REDIS_STREAM_MAX_LEN = 20000
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
@@ -75,13 +106,14 @@ DOWNLOAD_DELAY = 1
 # Enable showing throttling stats for every response received:
 #AUTOTHROTTLE_DEBUG = False
 
-# Enable and configure HTTP caching (disabled by default)
-# See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html#httpcache-middleware-settings
-#HTTPCACHE_ENABLED = True
-#HTTPCACHE_EXPIRATION_SECS = 0
-#HTTPCACHE_DIR = "httpcache"
-#HTTPCACHE_IGNORE_HTTP_CODES = []
-#HTTPCACHE_STORAGE = "scrapy.extensions.httpcache.FilesystemCacheStorage"
+# Cache HTTP persistente con GET condizionali (ETag / Last-Modified), condivisa dai progetti
+# Vedi scraping/shared/httpcache.py; la directory è relativa a SCRAPY_STATE_DIR
+HTTPCACHE_ENABLED = True
+HTTPCACHE_POLICY = "shared.httpcache.ConditionalGetPolicy"
+HTTPCACHE_STORAGE = "shared.httpcache.BoundedFilesystemCacheStorage"
+HTTPCACHE_DIR = "httpcache"
+HTTPCACHE_MAX_BYTES = 512 * 1024 * 1024
+HTTPCACHE_GZIP = True
 
 # Set settings whose default value is deprecated to a future-proof value
 FEED_EXPORT_ENCODING = "utf-8"
@@ -2,9 +2,42 @@ import scrapy
 import json
 import re
 import hashlib
-from datetime import datetime
+from datetime import date, datetime
+from urllib.parse import urlsplit
+from shared.apistats import decode_json, summarize_api_stats
+from shared.state import state_path
+from shared.store import JsonStore
 from zero_scraper.items import EventItem
 
+# Slot di download dedicato alle pagine dell'API eventi (concorrenza API_CONCURRENCY)
+API_DOWNLOAD_SLOT = "zero.eu-api"
+API_PAGE_SIZE = 100
+
+# Campi chiesti all'API (_fields): solo quelli letti da _parse_single_event. I dati del luogo
+# non arrivano più con _embed=true ma dall'endpoint venue (_links.venue), una volta per luogo
+EVENT_FIELDS = (
+    "id", "link", "slug", "name", "content", "category", "featured_image",
+    "venue_name", "venue_coords", "venue_address", "price",
+    "start_date", "end_date", "date_string", "human_date", "start_time", "end_time", "date_scope",
+    "_links",
+)
+VENUE_FIELDS = ("id", "plain_address", "address_full", "address")
+
+# ID delle città usati se la mappa slug -> ID (cache o API /citta) non contiene lo slug
+FALLBACK_CITY_IDS = {
+    "milano": 2,
+    "bologna": 13,
+    "roma": 3,
+    "torino": 12,
+    "firenze": 14,
+    "venezia": 15,
+    "napoli": 16
+}
+
+# Distanza di priorità tra città: le pagine evento vengono scaricate città per città
+CITY_PRIORITY_SPAN = 1_000_000
+
+
 class EventsSpider(scrapy.Spider):
     name = "events"
     allowed_domains = ["zero.eu"]
@@ -16,91 +49,274 @@ class EventsSpider(scrapy.Spider):
         "DOWNLOAD_DELAY": 0.5,
     }
 
-    def __init__(self, city="milano", *args, **kwargs):
+    # Mappa persistente slug città -> ID (CITY_MAP_TTL_HOURS)
+    city_map = None
+    # Indirizzi dei luoghi letti dalle pagine evento, per venue_id (VENUE_CACHE_TTL_DAYS)
+    venue_cache = None
+    # Dati dei luoghi dall'endpoint venue dell'API, per venue_id (VENUE_CACHE_TTL_DAYS)
+    venue_api_cache = None
+    # Payload ridotti con _fields (False: oggetti completi con _embed=true, come in passato)
+    api_trim_fields = True
+    # Pagina HTML dell'evento: "auto" solo se mancano indirizzo o data leggibile, "always" sempre
+    event_page_mode = "auto"
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        settings = crawler.settings
+
+        # Pagine dell'API in uno slot a parte: fino a API_CONCURRENCY richieste in parallelo,
+        # mentre le pagine HTML degli eventi restano su CONCURRENT_REQUESTS_PER_DOMAIN
+        api_concurrency = settings.getint("API_CONCURRENCY", 4)
+        slots = dict(settings.getdict("DOWNLOAD_SLOTS"))
+        slots.setdefault(API_DOWNLOAD_SLOT, {
+            "concurrency": api_concurrency,
+            "delay": settings.getfloat("DOWNLOAD_DELAY"),
+        })
+        settings.set("DOWNLOAD_SLOTS", slots, priority="spider")
+        concurrency = settings.getint("CONCURRENT_REQUESTS_PER_DOMAIN") + slots[API_DOWNLOAD_SLOT]["concurrency"]
+        if settings.getint("CONCURRENT_REQUESTS") < concurrency:
+            settings.set("CONCURRENT_REQUESTS", concurrency, priority="spider")
+
+        if settings.getbool("CITY_MAP_ENABLED", True):
+            spider.city_map = JsonStore(state_path("zero_eu", "city_map.sqlite"), stats=crawler.stats)
+            spider.city_map_ttl = settings.getfloat("CITY_MAP_TTL_HOURS", 168) * 3600
+        if settings.getbool("VENUE_CACHE_ENABLED", True):
+            spider.venue_cache = JsonStore(state_path("zero_eu", "venues.sqlite"), stats=crawler.stats)
+            spider.venue_api_cache = JsonStore(state_path("zero_eu", "venue_api.sqlite"), stats=crawler.stats)
+            spider.venue_cache_ttl = settings.getfloat("VENUE_CACHE_TTL_DAYS", 30) * 86400
+        spider.api_trim_fields = settings.getbool("API_TRIM_FIELDS", True)
+
+        spider.event_page_mode = settings.get("EVENT_PAGE_MODE", "auto")
+        if spider.event_page_mode not in ("auto", "always"):
+            raise ValueError(f"EVENT_PAGE_MODE '{spider.event_page_mode}' non supportato (auto, always)")
+        return spider
+
+    def __init__(self, cities=None, city=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.target_city_slug = city.lower()
-        self.target_city_id = None
+        # Città richieste: lista o stringa separata da virgole (city: singola città, compatibilità)
+        cities = cities or city or "milano"
+        if isinstance(cities, str):
+            cities = cities.split(",")
+        self.cities = list(dict.fromkeys(c.strip().lower() for c in cities if c.strip()))
+        self.city_ids = {}
         self.cities_map = {}
+        self.citta_pages_pending = 0
+
+        # Ordine stabile dell'output: ogni evento ha la sua posizione (indice della città,
+        # (pagina - 1) * API_PAGE_SIZE + indice nella pagina) e gli item vengono emessi in
+        # quell'ordine, anche se pagine e dettagli arrivano in ordine sparso
+        self.pending_items = {}  # posizione -> item (None = evento senza item)
+        self.next_position = (0, 0)
+        self.city_positions = {}  # indice città -> numero di posizioni (noto dopo la pagina 1)
+
+        # Luoghi già letti dall'endpoint venue in questo crawl (venue_id -> dati, None = errore)
+        # ed eventi in attesa della risposta, così ogni luogo viene richiesto una volta sola
+        self.venues = {}
+        self.venue_waiters = {}
+
+        # Cities with failed API pages or lost events (left out of the manifest coverage)
+        self.incomplete_cities = set()
 
     def start_requests(self):
-        # Step 1: Fetch cities to map slug to ID
-        yield scrapy.Request(
-            url="https://zero.eu/api/wp/v2/citta?per_page=100", # Fetch plenty of cities
-            callback=self.parse_cities
+        # Step 1: slug -> ID from the persisted city map; the API is asked only for missing slugs
+        for city in self.cities:
+            city_id = self.city_map.get(city, max_age=self.city_map_ttl) if self.city_map is not None else None
+            if city_id:
+                self.city_ids[city] = city_id
+        missing = [city for city in self.cities if city not in self.city_ids]
+        self.crawler.stats.set_value("city_map/cached", len(self.city_ids))
+
+        if not missing:
+            self.logger.info(f"City IDs from cache: {self.city_ids}")
+            yield from self._start_events()
+            return
+
+        self.logger.info(f"City IDs missing for {', '.join(missing)}: refreshing the city map")
+        self.crawler.stats.set_value("city_map/refreshed", 1)
+        self.citta_pages_pending = 1
+        yield self._citta_page_request(1)
+
+    def _citta_page_request(self, page):
+        page_param = f"&page={page}" if page > 1 else ""
+        return scrapy.Request(
+            url=f"https://zero.eu/api/wp/v2/citta?per_page=100{page_param}",  # Fetch plenty of cities
+            callback=self.parse_cities,
+            errback=self._citta_page_failed,
+            meta={"page": page, "download_slot": API_DOWNLOAD_SLOT},
+            priority=2,
         )
 
     def parse_cities(self, response):
-        cities = response.json()
+        cities = decode_json(response, self.crawler.stats, "citta")
+        found = {}
         for city in cities:
             slug = city.get("slug")
             c_id = city.get("id")
             if slug and c_id:
-                self.cities_map[slug] = c_id
-                # Check for sub-cities if structure allows? 
+                found[slug] = c_id
                 # API doesn't list sub-cities recursively here effectively without parent param.
-                # But typically main cities are returned in the first page of results.
-        
-        # Check if we need more pages of cities? (Header X-WP-TotalPages)
-        # For now assume main cities are in the first 100.
-        
-        if self.target_city_slug in self.cities_map:
-            self.target_city_id = self.cities_map[self.target_city_slug]
-            self.logger.info(f"Found city ID for '{self.target_city_slug}': {self.target_city_id}")
-            
-            # Start fetching events with city filter
-            yield scrapy.Request(
-                url=f"https://zero.eu/api/v2/events?per_page=100&citta={self.target_city_id}&_embed=true", 
-                callback=self.parse_events,
-                meta={"page": 1}
-            )
-        else:
-            self.logger.error(f"City '{self.target_city_slug}' not found in API.")
-            # Fallback IDs
-            fallback_ids = {
-                "milano": 2,
-                "bologna": 13,
-                "roma": 3,
-                "torino": 12,
-                "firenze": 14,
-                "venezia": 15,
-                "napoli": 16
-            }
-            if self.target_city_slug in fallback_ids:
-                self.target_city_id = fallback_ids[self.target_city_slug]
-                self.logger.info(f"Using fallback ID for '{self.target_city_slug}': {self.target_city_id}")
-                yield scrapy.Request(
-                    url=f"https://zero.eu/api/v2/events?per_page=100&citta={self.target_city_id}&_embed=true",
-                    callback=self.parse_events,
-                    meta={"page": 1}
-                )
+        self.cities_map.update(found)
+        if self.city_map is not None:
+            # One statement for the whole page, not one commit per city on the shared store
+            self.city_map.set_many(found.items())
 
-    def parse_events(self, response):
-        events = response.json()
-        
-        # If empty list, stop
-        if not events:
+        # All the pages of the city list, requested together after the first one
+        if response.meta.get("page", 1) == 1:
+            total_pages = int(response.headers.get("X-WP-TotalPages", 1) or 1)
+            for page in range(2, total_pages + 1):
+                self.citta_pages_pending += 1
+                yield self._citta_page_request(page)
+
+        yield from self._citta_page_done()
+
+    def _citta_page_failed(self, failure):
+        self.logger.error(f"City list page {failure.request.meta.get('page', 1)} failed: {failure.value!r}")
+        yield from self._citta_page_done()
+
+    def _citta_page_done(self):
+        self.citta_pages_pending -= 1
+        if self.citta_pages_pending > 0:
             return
 
-        for event in events:
-            # Filter checks are redundant if API works but safe to keep
-            event_cities = event.get("citta", [])
-            # We check if target_city_id is in the list OR if we filtered by API (trust result)
-            # Some events might return city list slightly differently, so trusting the API filter is better if used
-            yield from self._parse_single_event(event)
-        
-        # Pagination
+        for city in self.cities:
+            if city in self.city_ids:
+                continue
+            if city in self.cities_map:
+                self.city_ids[city] = self.cities_map[city]
+                self.logger.info(f"Found city ID for '{city}': {self.city_ids[city]}")
+            elif city in FALLBACK_CITY_IDS:
+                self.logger.error(f"City '{city}' not found in API.")
+                self.city_ids[city] = FALLBACK_CITY_IDS[city]
+                self.logger.info(f"Using fallback ID for '{city}': {self.city_ids[city]}")
+            else:
+                self.logger.error(f"City '{city}' not found in API and no fallback ID.")
+        if self.city_map is not None:
+            self.city_map.commit()
+        yield from self._start_events()
+
+    def _start_events(self):
+        """Prima pagina eventi di ogni città (le città senza ID non hanno posizioni)"""
+        for city_index, city in enumerate(self.cities):
+            if city in self.city_ids:
+                yield self._events_page_request(city_index, 1)
+            else:
+                self.incomplete_cities.add(city)
+                yield from self._city_done(city_index, 0)
+
+    def coverage(self):
+        """
+        Città scaricate per intero, scritte nel manifest: l'API restituisce gli eventi da oggi in
+        poi, quindi la finestra è aperta (date_end None). Nomi città come nel campo city degli item.
+        """
+        today = date.today().isoformat()
+        return [
+            {"city": city.capitalize(), "date_start": today, "date_end": None}
+            for city in self.cities
+            if city not in self.incomplete_cities
+        ]
+
+    def _events_page_request(self, city_index, page):
+        city_id = self.city_ids[self.cities[city_index]]
+        page_param = f"&page={page}" if page > 1 else ""
+        if self.api_trim_fields:
+            payload_param = f"&_fields={','.join(EVENT_FIELDS)}"
+        else:
+            payload_param = "&_embed=true"
+        return scrapy.Request(
+            url=f"https://zero.eu/api/v2/events?per_page={API_PAGE_SIZE}&citta={city_id}{page_param}{payload_param}",
+            callback=self.parse_events,
+            errback=self._events_page_failed,
+            meta={"page": page, "city_index": city_index, "download_slot": API_DOWNLOAD_SLOT},
+            priority=1,
+        )
+
+    def parse_events(self, response):
         current_page = response.meta.get("page", 1)
-        total_pages = int(response.headers.get("X-WP-TotalPages", 0))
-        
-        if current_page < total_pages:
-            next_page = current_page + 1
-            yield scrapy.Request(
-                url=f"https://zero.eu/api/v2/events?per_page=100&citta={self.target_city_id}&page={next_page}&_embed=true",
-                callback=self.parse_events,
-                meta={"page": next_page}
+        city_index = response.meta.get("city_index", 0)
+        city = self.cities[city_index]
+        first_position = (current_page - 1) * API_PAGE_SIZE
+        # Positions of this page taken over by an event (released by the event itself)
+        handed = set()
+
+        try:
+            events = decode_json(response, self.crawler.stats, "events")
+
+            # Pagination: as soon as page 1 tells the total, all the remaining pages are requested
+            # together (bounded by the API download slot), instead of one after the other
+            if current_page == 1:
+                total_pages = int(response.headers.get("X-WP-TotalPages", 0))
+                self.logger.info(f"Events API: {total_pages} pages for '{city}'")
+                for page in range(2, total_pages + 1):
+                    yield self._events_page_request(city_index, page)
+                yield from self._city_done(city_index, max(total_pages, 1) * API_PAGE_SIZE)
+
+            for index, event in enumerate(events):
+                # Filter checks are redundant if API works but safe to keep
+                # We trust the API city filter (event "citta" lists are not always consistent)
+                position = (city_index, first_position + index)
+                try:
+                    yield from self._parse_single_event(event, position=position)
+                except Exception:
+                    self.logger.exception(f"Error parsing event at position {position} for '{city}'")
+                    self.crawler.stats.inc_value("events_api/event_failed")
+                    self.incomplete_cities.add(city)
+                    continue
+                handed.add(position)
+        except Exception:
+            # Malformed page: its events are lost, the following ones must still be emitted
+            self.logger.exception(f"Error parsing events API page {current_page} for '{city}'")
+            self.crawler.stats.inc_value("events_api/page_failed")
+            self.incomplete_cities.add(city)
+            if city_index not in self.city_positions:
+                # Page 1 broken before the total was known: the city ends with this page
+                self.city_positions[city_index] = API_PAGE_SIZE
+
+        # Positions of this page not taken over by an event (short or empty page, broken event
+        # or page) are released, unless already resolved
+        yield from self._resolve_positions(
+            position
+            for position in ((city_index, p) for p in range(first_position, first_position + API_PAGE_SIZE))
+            if position not in handed and position not in self.pending_items and position >= self.next_position
+        )
+
+    def _events_page_failed(self, failure):
+        page = failure.request.meta.get("page", 1)
+        city_index = failure.request.meta.get("city_index", 0)
+        self.logger.error(f"Events API page {page} for '{self.cities[city_index]}' failed: {failure.value!r}")
+        self.crawler.stats.inc_value("events_api/page_failed")
+        self.incomplete_cities.add(self.cities[city_index])
+        if page == 1:
+            yield from self._city_done(city_index, 0)
+        else:
+            first_position = (page - 1) * API_PAGE_SIZE
+            yield from self._resolve_positions(
+                (city_index, position) for position in range(first_position, first_position + API_PAGE_SIZE)
             )
 
-    def _parse_single_event(self, data):
+    def _city_done(self, city_index, positions):
+        """Numero di posizioni della città ormai noto: le città successive possono essere emesse"""
+        self.city_positions[city_index] = positions
+        yield from self._resolve_positions([])
+
+    def _resolve_positions(self, positions, item=None):
+        """Registra l'esito delle posizioni ed emette gli item pronti in ordine di posizione"""
+        for position in positions:
+            self.pending_items[position] = item
+        while self.next_position[0] < len(self.cities):
+            city_index, position = self.next_position
+            if position >= self.city_positions.get(city_index, float("inf")):
+                self.next_position = (city_index + 1, 0)
+            elif self.next_position in self.pending_items:
+                ready = self.pending_items.pop(self.next_position)
+                self.next_position = (city_index, position + 1)
+                if ready is not None:
+                    yield ready
+            else:
+                break
+
+    def _parse_single_event(self, data, position=None):
+        city_index = position[0] if position is not None else 0
         item = EventItem()
         item["id"] = data.get("id")
         item["url"] = data.get("link")
@@ -129,27 +345,13 @@ class EventsSpider(scrapy.Spider):
                 item["image_url"] = sizes["large"].get("source_url") or sizes["large"].get("file")
         
         # Luogo
-        item["city"] = self.target_city_slug.capitalize()
+        item["city"] = self.cities[city_index].capitalize()
         item["location_name"] = data.get("venue_name")
         item["location_coords"] = data.get("venue_coords")
         
         # Address extraction
         # Prima cerchiamo nei dati già presenti
         item["location_address"] = data.get("venue_address")
-        venue_id = None
-        
-        if "_embedded" in data and "venue" in data["_embedded"]:
-            venue_list = data["_embedded"]["venue"]
-            if venue_list:
-                venue = venue_list[0]
-                venue_id = venue.get("id")
-                
-                # Try to find a more complete address in embedded
-                full_addr = venue.get("plain_address") or venue.get("address_full")
-                if full_addr:
-                    item["location_address"] = full_addr
-                elif isinstance(venue.get("address"), str) and len(venue.get("address")) > len(str(item["location_address"] or "")):
-                     item["location_address"] = venue.get("address")
 
         # Price
         item["price"] = data.get("price")
@@ -166,15 +368,120 @@ class EventsSpider(scrapy.Spider):
         item["date_scope"] = data.get("date_scope")
         
         item["scraped_at"] = datetime.now().isoformat()
-        
-        # Visit the event page to get full address and formatted dates (HTML scraping)
-        if item["url"]:
+
+        venue_id = None
+        embedded_venues = data.get("_embedded", {}).get("venue")
+        if embedded_venues:
+            venue_id = embedded_venues[0].get("id")
+            self._apply_venue(item, embedded_venues[0])
+        else:
+            # Trimmed payload: venue data from its own endpoint, requested once per venue
+            venue_id, venue_url = self._venue_link(data)
+            if venue_id is not None:
+                if venue_id not in self.venues:
+                    cached_venue = self.venue_api_cache.get(str(venue_id), max_age=self.venue_cache_ttl) \
+                        if self.venue_api_cache is not None else None
+                    if cached_venue is None:
+                        yield from self._wait_for_venue(venue_id, venue_url, item, position)
+                        return
+                    self.crawler.stats.inc_value("venue_api/cached")
+                    self.venues[venue_id] = cached_venue
+                self._apply_venue(item, self.venues[venue_id])
+
+        yield from self._complete_event(item, venue_id, position)
+
+    def _venue_link(self, data):
+        """ID e URL del luogo dai _links dell'evento (payload senza _embed)"""
+        links = data.get("_links", {}).get("venue") or []
+        href = links[0].get("href") if links else None
+        if not href:
+            return None, None
+        match = re.search(r"/(\d+)/?$", urlsplit(href).path)
+        return (int(match.group(1)) if match else href), href
+
+    def _apply_venue(self, item, venue):
+        if not venue:
+            return
+        # Try to find a more complete address in the venue data
+        full_addr = venue.get("plain_address") or venue.get("address_full")
+        if full_addr:
+            item["location_address"] = full_addr
+        elif isinstance(venue.get("address"), str) and len(venue.get("address")) > len(str(item["location_address"] or "")):
+            item["location_address"] = venue.get("address")
+
+    def _wait_for_venue(self, venue_id, venue_url, item, position):
+        waiting = self.venue_waiters.setdefault(venue_id, [])
+        waiting.append((item, position))
+        if len(waiting) > 1:
+            return
+        separator = "&" if "?" in venue_url else "?"
+        yield scrapy.Request(
+            url=f"{venue_url}{separator}_fields={','.join(VENUE_FIELDS)}",
+            callback=self.parse_venue,
+            errback=self._venue_failed,
+            meta={"venue_id": venue_id, "download_slot": API_DOWNLOAD_SLOT},
+            priority=1,
+        )
+
+    def parse_venue(self, response):
+        venue_id = response.meta["venue_id"]
+        try:
+            venue = decode_json(response, self.crawler.stats, "venue")
+            venue = {key: venue.get(key) for key in VENUE_FIELDS} if isinstance(venue, dict) else None
+        except Exception:
+            # Waiting events are completed without venue data, as for a failed request
+            self.logger.exception(f"Error parsing venue {response.url}")
+            self.crawler.stats.inc_value("venue_api/failed")
+            venue = None
+        if venue and self.venue_api_cache is not None:
+            self.venue_api_cache.set(str(venue_id), venue)
+        yield from self._venue_resolved(venue_id, venue)
+
+    def _venue_failed(self, failure):
+        self.logger.warning(f"Venue request failed: {failure.request.url} ({failure.value!r})")
+        self.crawler.stats.inc_value("venue_api/failed")
+        yield from self._venue_resolved(failure.request.meta["venue_id"], None)
+
+    def _venue_resolved(self, venue_id, venue):
+        """Completa gli eventi in attesa del luogo (senza dati del luogo se la richiesta è fallita)"""
+        self.venues[venue_id] = venue
+        for item, position in self.venue_waiters.pop(venue_id, []):
+            try:
+                self._apply_venue(item, venue)
+                yield from self._complete_event(item, venue_id, position)
+            except Exception:
+                # One broken event must not hold back the other waiters nor the items after it
+                self.logger.exception(f"Error completing event {item.get('url')} with venue {venue_id}")
+                self.crawler.stats.inc_value("venue_api/event_failed")
+                if position is not None:
+                    self.incomplete_cities.add(self.cities[position[0]])
+                    yield from self._resolve_positions([position])
+
+    def _complete_event(self, item, venue_id, position):
+        city_index = position[0] if position is not None else 0
+
+        # Address already read from the event page of another event at the same venue
+        cached_address = self._cached_venue_address(venue_id)
+        if cached_address:
+            item["location_address"] = cached_address
+
+        # Visit the event page to get full address and formatted dates (HTML scraping),
+        # in "auto" mode only when the API data lacks one of them
+        needs_page = self.event_page_mode == "always" or not item["location_address"] or not item["date_display"]
+        if item["url"] and not needs_page:
+            self.crawler.stats.inc_value("event_page/skipped")
+            yield from self._emit(self._finalize_item(item), position)
+        elif item["url"]:
+            self.crawler.stats.inc_value("event_page/fetched")
             # Force Italian language to get correct date format (martedì vs Tuesday)
             # The site redirects /it/ to /en/ based on headers/IP, so we must be explicit
             yield scrapy.Request(
                 url=item["url"],
                 callback=self.parse_event_page,
-                meta={"item": item},
+                meta={"item": item, "position": position, "venue_id": venue_id},
+                errback=self._event_page_failed,
+                # Event pages are downloaded in API order: the output buffer stays small
+                priority=-(city_index * CITY_PRIORITY_SPAN + position[1]) if position is not None else 0,
                 headers={
                     "Accept-Language": "it-IT,it;q=0.9,en-US;q=0.8,en;q=0.7",
                     "Cookie": "pll_language=it; wp-wpml_current_language=it" # Try common WP language cookies
@@ -183,13 +490,45 @@ class EventsSpider(scrapy.Spider):
             )
         else:
             # Genera UUID e content_hash anche per item senza URL
-            uuid_string = f"{item.get('title', '')}{item.get('date_start', '')}{item.get('location_name', '')}"
-            item["uuid"] = hashlib.sha256(uuid_string.encode('utf-8')).hexdigest()[:16]
-            content_string = f"{item.get('description', '')}{item.get('price', '')}{item.get('time_start', '')}"
-            item["content_hash"] = hashlib.sha256(content_string.encode('utf-8')).hexdigest()[:16]
-            yield item
+            yield from self._emit(self._finalize_item(item), position)
+
+    def _cached_venue_address(self, venue_id):
+        if self.venue_cache is None or not venue_id:
+            return None
+        address = self.venue_cache.get(str(venue_id), max_age=self.venue_cache_ttl)
+        if address:
+            self.crawler.stats.inc_value("venue_cache/hit")
+        return address
+
+    def _emit(self, item, position):
+        """Emette l'item subito (nessuna posizione) o nell'ordine dell'API"""
+        if position is None:
+            if item is not None:
+                yield item
+        else:
+            yield from self._resolve_positions([position], item)
+
+    def _event_page_failed(self, failure):
+        self.logger.warning(f"Event page failed: {failure.request.url} ({failure.value!r})")
+        self.crawler.stats.inc_value("event_page_failed")
+        position = failure.request.meta.get("position")
+        if position is not None:
+            self.incomplete_cities.add(self.cities[position[0]])
+            yield from self._resolve_positions([position])
 
     def parse_event_page(self, response):
+        position = response.meta.get("position")
+        try:
+            item = self._complete_event_page(response)
+        except Exception:
+            # A broken page must not hold back the items that follow it
+            self.logger.exception(f"Error parsing event page {response.url}")
+            item = None
+            if position is not None:
+                self.incomplete_cities.add(self.cities[position[0]])
+        yield from self._emit(item, position)
+
+    def _complete_event_page(self, response):
         item = response.meta["item"]
         
         # 1. Scrape full address from p.venue
@@ -199,6 +538,9 @@ class EventsSpider(scrapy.Spider):
         if full_address:
              full_address = full_address.strip(" ,-")
              item["location_address"] = full_address
+             venue_id = response.meta.get("venue_id")
+             if self.venue_cache is not None and venue_id:
+                 self.venue_cache.set(str(venue_id), full_address)
         
         # 2. Scrape formatted date ("when")
         # Primary: Look for the "When" / "Quando" section in resume details
@@ -222,6 +564,9 @@ class EventsSpider(scrapy.Spider):
             cleaned_date = " ".join(when_text.strip().split())
             item["date_display"] = cleaned_date
 
+        return self._finalize_item(item)
+
+    def _finalize_item(self, item):
         # Genera UUID dall'hash di titolo + date_start + location_name (come city_today)
         uuid_string = f"{item.get('title', '')}{item.get('date_start', '')}{item.get('location_name', '')}"
         item["uuid"] = hashlib.sha256(uuid_string.encode('utf-8')).hexdigest()[:16]
@@ -230,7 +575,18 @@ class EventsSpider(scrapy.Spider):
         content_string = f"{item.get('description', '')}{item.get('price', '')}{item.get('time_start', '')}"
         item["content_hash"] = hashlib.sha256(content_string.encode('utf-8')).hexdigest()[:16]
 
-        yield item
+        return item
+
+    def closed(self, reason):
+        summarize_api_stats(self.crawler.stats)
+        for store in (self.city_map, self.venue_cache, self.venue_api_cache):
+            if store is not None:
+                store.close()
+        if self.pending_items:
+            self.logger.warning(
+                f"{sum(1 for item in self.pending_items.values() if item)} items not emitted "
+                f"(waiting for position {self.next_position})"
+            )
 
     def _clean_text(self, text):
         if text: